@@ -0,0 +1,91 @@
+"""
+Process governor for ffmpeg: every transcode/decode across every guild takes a slot before spawning,
+so the number of concurrent ffmpeg processes never exceeds a multiple of the CPU count.
+Work beyond the cap waits in FIFO order instead of oversubscribing the host's cores.
+"""
+
+# built-in
+from contextlib import asynccontextmanager
+import asyncio
+import os
+import time
+
+# my modules
+from src.utils import metrics
+from src.utils.config import get_config
+
+class FFmpegGovernor():
+    """
+    Caps concurrent ffmpeg processes at `max_workers`, queueing the rest
+    """
+
+    def __init__(self, max_workers: int):
+        """
+        Args:
+            max_workers (int): how many ffmpeg processes may run at once
+        """
+        self.max_workers = max(1, max_workers)
+        self.active = 0
+        self.queued = 0
+        self._slots = asyncio.Semaphore(self.max_workers)
+
+    @classmethod
+    def from_config(cls) -> "FFmpegGovernor":
+        """
+        Builds a governor from the "ffmpeg_governor" config section:
+        `workers_per_cpu` (default 1) times the CPU count, optionally capped by `max_workers`
+
+        Returns:
+            governor (FFmpegGovernor): the governor
+        """
+        config = get_config("ffmpeg_governor")
+        workers = int((os.cpu_count() or 1) * config.get("workers_per_cpu", 1))
+        if config.get("max_workers"):
+            workers = min(workers, config["max_workers"])
+        return cls(workers)
+
+    def set_max_workers(self, max_workers: int):
+        """
+        Changes the cap. Only call it before any slot is taken (e.g. when a worker process starts).
+
+        Args:
+            max_workers (int): how many ffmpeg processes may run at once
+        """
+        self.max_workers = max(1, max_workers)
+        self._slots = asyncio.Semaphore(self.max_workers)
+
+    @property
+    def utilization(self) -> float:
+        "Fraction of slots in use"
+        return self.active / self.max_workers
+
+    def _report(self):
+        metrics.set_gauge("ffmpeg.active", self.active)
+        metrics.set_gauge("ffmpeg.queued", self.queued)
+        metrics.set_gauge("ffmpeg.utilization", self.utilization)
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Holds one ffmpeg slot for the duration of the block, waiting for one if they're all taken
+        """
+        queued_at = time.perf_counter()
+        self.queued += 1
+        self._report()
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+
+        metrics.observe("ffmpeg.queue_wait_ms", (time.perf_counter() - queued_at) * 1000)
+        self.active += 1
+        self._report()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
+            metrics.inc("ffmpeg.runs")
+            self._report()
+
+GOVERNOR = FFmpegGovernor.from_config()
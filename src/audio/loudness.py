@@ -0,0 +1,74 @@
+"""
+Loudness normalization, measured once per clip when it's decoded.
+The measurement is a gated RMS loudness in the spirit of EBU R128 (400ms blocks, absolute and
+relative gates, without the K-weighting filter), cheap enough to run with audioop at ingest.
+The resulting fixed gain is applied per frame at playback with audioop.mul.
+"""
+
+# built-in
+import audioop
+import math
+
+# my modules
+from src.audio.transcode import SAMPLE_RATE, SAMPLE_WIDTH
+from src.utils.config import get_config
+
+BLOCK_BYTES = SAMPLE_RATE * SAMPLE_WIDTH * 4 // 10 # 400ms of mono PCM
+ABSOLUTE_GATE_DB = -70.0
+RELATIVE_GATE_DB = -10.0
+FULL_SCALE = 32768
+
+_CONFIG = get_config("loudness")
+ENABLED = _CONFIG.get("enabled", True)
+TARGET_DB = _CONFIG.get("target_db", -20.0)
+MAX_GAIN_DB = _CONFIG.get("max_gain_db", 12.0)
+
+def _to_db(rms: float) -> float:
+    return 20 * math.log10(rms / FULL_SCALE) if rms > 0 else -math.inf
+
+def measure_loudness(pcm: bytes) -> float | None:
+    """
+    Measures a clip's integrated loudness
+
+    Args:
+        pcm (bytes): playback PCM (16-bit mono)
+
+    Returns:
+        loudness (float | None): the loudness in dBFS, or None if the clip is silent
+    """
+    blocks = [pcm[start:start + BLOCK_BYTES] for start in range(0, len(pcm), BLOCK_BYTES)]
+    # drop a trailing partial block unless it's all there is
+    if len(blocks) > 1 and len(blocks[-1]) < BLOCK_BYTES:
+        blocks.pop()
+
+    powers = [audioop.rms(block, SAMPLE_WIDTH) ** 2 for block in blocks if block]
+    powers = [power for power in powers if _to_db(math.sqrt(power)) > ABSOLUTE_GATE_DB]
+    if not powers:
+        return None
+
+    # ignore quiet blocks (pauses between words) relative to the clip's overall level
+    relative_gate = _to_db(math.sqrt(sum(powers) / len(powers))) + RELATIVE_GATE_DB
+    gated = [power for power in powers if _to_db(math.sqrt(power)) > relative_gate] or powers
+    return _to_db(math.sqrt(sum(gated) / len(gated)))
+
+def gain_for(pcm: bytes, loudness: float | None) -> float:
+    """
+    Works out the fixed gain that brings a clip to the target loudness without clipping its peak
+
+    Args:
+        pcm (bytes): playback PCM (16-bit mono)
+        loudness (float | None): the clip's loudness from `measure_loudness`
+
+    Returns:
+        gain (float): the multiplier to apply at playback, 1.0 for silent clips or when disabled
+    """
+    if not ENABLED or loudness is None:
+        return 1.0
+
+    gain_db = min(TARGET_DB - loudness, MAX_GAIN_DB)
+    gain = 10 ** (gain_db / 20)
+
+    peak = audioop.max(pcm, SAMPLE_WIDTH)
+    if peak:
+        gain = min(gain, (FULL_SCALE - 1) / peak)
+    return gain
@@ -0,0 +1,172 @@
+"""
+Overlap mode: one AudioSource per guild that plays several clips at once.
+Each lane (normally one per message author) is a serial GuildAudioStream of its own; every 20ms the
+lanes' frames are scaled by lane_gain and summed with audioop, which saturates instead of wrapping,
+so a busy channel drains its backlog in parallel instead of strictly one clip after another.
+"""
+
+# built-in
+from typing import Callable, Dict, Hashable, Optional
+import audioop
+import threading
+
+# PyPI
+import discord
+
+# my modules
+from src.audio.stream import GuildAudioStream, PCMClip, LINGER_FRAMES, SILENCE
+from src.audio.transcode import SAMPLE_WIDTH
+
+class MixingAudioStream(discord.AudioSource):
+    """
+    Long-lived mixing source for one guild. Clips are added to a lane with `enqueue`; lanes play
+    simultaneously, clips within a lane play back to back.
+    """
+
+    def __init__(self, guild_id: int, max_lanes: int = 3, lane_gain: float = 0.7):
+        """
+        Args:
+            guild_id (int): the guild this stream plays in
+            max_lanes (int): how many lanes may play at once, clips for other lanes wait until one frees up
+            lane_gain (float): gain for each lane while more than one is playing, to leave headroom
+        """
+        self.guild_id = guild_id
+        self.max_lanes = max(1, max_lanes)
+        self.lane_gain = lane_gain
+
+        # maps lane -> its serial stream, in the order lanes started
+        self._lanes: Dict[Hashable, GuildAudioStream] = dict()
+        self._lock = threading.Lock()
+        self._idle_frames = 0
+
+    def enqueue(self, clip: PCMClip, lane: Hashable = None):
+        """
+        Adds a clip to the end of a lane, starting the lane if needed
+
+        Args:
+            clip (PCMClip): the clip to add
+            lane (Hashable): which lane to play it in
+        """
+        with self._lock:
+            stream = self._lanes.get(lane)
+            if stream is None:
+                stream = self._lanes[lane] = GuildAudioStream(self.guild_id)
+        stream.enqueue(clip)
+
+    def can_enqueue(self, lane: Hashable, lookahead: int) -> bool:
+        """
+        Whether another clip should be handed to a lane yet
+
+        Args:
+            lane (Hashable): the lane the clip would go in
+            lookahead (int): how many clips may wait behind the playing one in a lane
+        """
+        with self._lock:
+            stream = self._lanes.get(lane)
+            if stream is None:
+                return len(self._lanes) < self.max_lanes
+        return stream.pending < lookahead
+
+    @property
+    def pending(self) -> int:
+        "How many clips are waiting across all lanes, not counting the ones playing"
+        with self._lock:
+            return sum(stream.pending for stream in self._lanes.values())
+
+    def peek(self) -> Optional[PCMClip]:
+        "A clip playing, or next to play"
+        with self._lock:
+            lanes = list(self._lanes.values())
+        for stream in lanes:
+            clip = stream.peek()
+            if clip:
+                return clip
+        return None
+
+    def has_audio(self) -> bool:
+        "Whether any lane has anything to play"
+        with self._lock:
+            return any(stream.has_audio() for stream in self._lanes.values())
+
+    def clips(self) -> list[PCMClip]:
+        "Every clip playing or waiting, across all lanes"
+        with self._lock:
+            lanes = list(self._lanes.values())
+        return [clip for stream in lanes for clip in stream.clips()]
+
+    def playing(self) -> list[PCMClip]:
+        "The clips playing, one per lane"
+        with self._lock:
+            lanes = list(self._lanes.values())
+        return [clip for stream in lanes for clip in stream.playing()]
+
+    def drop(self, match: Callable[[PCMClip], bool]) -> int:
+        """
+        Drops every clip `match` accepts, in every lane (see `GuildAudioStream.drop`)
+
+        Args:
+            match (Callable[[PCMClip], bool]): which clips to drop
+
+        Returns:
+            dropped (int): how many clips were dropped
+        """
+        with self._lock:
+            lanes = list(self._lanes.values())
+        return sum(stream.drop(match) for stream in lanes)
+
+    def is_opus(self) -> bool:
+        return False
+
+    def read(self) -> bytes:
+        with self._lock:
+            lanes = list(self._lanes.items())
+
+        frames: list[bytes] = []
+        for lane, stream in lanes:
+            frame = stream.read_pcm()
+            if frame is None:
+                # lane ran dry, drop it so another can take its place
+                with self._lock:
+                    if not stream.has_audio() and self._lanes.get(lane) is stream:
+                        del self._lanes[lane]
+                continue
+            frames.append(frame)
+
+        if not frames:
+            # nothing queued: linger briefly in case the next chunk is about to arrive
+            self._idle_frames += 1
+            if self._idle_frames > LINGER_FRAMES:
+                self._idle_frames = 0
+                return b""
+            return audioop.tostereo(SILENCE, SAMPLE_WIDTH, 1, 1)
+        self._idle_frames = 0
+
+        if len(frames) == 1:
+            # a lone lane plays at its own level, same as serial mode
+            mixed = frames[0]
+        else:
+            mixed = None
+            for frame in frames:
+                frame = audioop.mul(frame, SAMPLE_WIDTH, self.lane_gain)
+                # audioop.add clips at the sample limits rather than wrapping around
+                mixed = frame if mixed is None else audioop.add(mixed, frame, SAMPLE_WIDTH)
+
+        # discord wants 16-bit stereo, clips are stored mono
+        return audioop.tostereo(mixed, SAMPLE_WIDTH, 1, 1)
+
+    def cleanup(self):
+        # playback ending doesn't end the stream, it's reused for the next clips, but the lanes can
+        # finish clips dropped mid-read now nothing is reading them
+        with self._lock:
+            lanes = list(self._lanes.values())
+        for stream in lanes:
+            stream.cleanup()
+
+    def close(self):
+        "Drops every clip in every lane, reporting each as done (e.g. when leaving VC)"
+        with self._lock:
+            # lanes stay until they run dry, so the audio thread still finishes their playing clips
+            lanes = list(self._lanes.values())
+
+        for stream in lanes:
+            stream.close()
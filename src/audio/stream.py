@@ -0,0 +1,280 @@
+"""
+Gapless per-guild audio: one long-lived AudioSource per guild that plays queued clips back to back.
+Clips are already decoded to PCM, so moving from one clip to the next is just opening the next
+file: no ffmpeg process per clip and no gap between chunks of the same message.
+"""
+
+# built-in
+from collections import deque
+from typing import Callable, Deque, Hashable, Optional
+import audioop
+import threading
+import time
+
+# PyPI
+import discord
+
+# my modules
+from src.audio.transcode import FRAME_BYTES, SAMPLE_WIDTH
+from src.utils.tracing import Span, Trace
+
+# how long to send silence while waiting for the next clip before letting playback end (20ms frames)
+LINGER_FRAMES = 25
+SILENCE = b"\x00" * FRAME_BYTES
+
+class PCMClip():
+    """
+    One decoded clip waiting in (or playing from) a guild stream
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        on_done: Callable[[Optional[Exception]], None],
+        trace: Optional[Trace] = None,
+        enqueued_at: Optional[float] = None,
+        gain: float = 1.0,
+        related: tuple[str, ...] = (),
+        author_id: Optional[int] = None
+    ):
+        """
+        Args:
+            filepath (str): the PCM file to play
+            on_done (Callable): called (from the audio thread) once the clip has finished or failed
+            trace (Optional[Trace]): the request's trace, for queue wait/playback spans
+            enqueued_at (Optional[float]): `time.perf_counter()` of when the clip was queued
+            gain (float): fixed gain to play the clip at (its loudness normalization)
+            related (tuple[str, ...]): other files the clip still needs kept (e.g. the original of a
+            sped-up rendition), so storage cleanup leaves them alone
+            author_id (Optional[int]): the user who sent the text, so their clips can be cleared
+        """
+        self.filepath = filepath
+        self.on_done = on_done
+        self.trace = trace
+        self.enqueued_at = enqueued_at if enqueued_at is not None else time.perf_counter()
+        self.gain = gain
+        self.related = related
+        self.author_id = author_id
+
+        self._file = None
+        self._playback_span: Optional[Span] = None
+
+    @property
+    def paths(self) -> tuple[str, ...]:
+        "Every file the clip is using"
+        return (self.filepath,) + self.related
+
+    def read_frame(self) -> bytes:
+        """
+        Reads the next 20ms of mono PCM, opening the file on first read
+
+        Returns:
+            frame (bytes): the frame (zero-padded if it's the last one), or b"" once the clip is done
+        """
+        if self._file is None:
+            if self.trace:
+                self.trace.start_span("queue_wait", start=self.enqueued_at).finish()
+                self._playback_span = self.trace.start_span("playback")
+            self._file = open(self.filepath, "rb")
+
+        frame = self._file.read(FRAME_BYTES)
+        if frame and len(frame) < FRAME_BYTES:
+            frame += SILENCE[len(frame):]
+        if frame and self.gain != 1.0:
+            frame = audioop.mul(frame, SAMPLE_WIDTH, self.gain)
+        return frame
+
+    def finish(self, error: Optional[Exception] = None):
+        """
+        Closes the clip and reports it done
+
+        Args:
+            error (Optional[Exception]): what went wrong, if anything
+        """
+        if self._file:
+            self._file.close()
+            self._file = None
+        if self._playback_span:
+            self._playback_span.finish(error=repr(error) if error else None)
+        self.on_done(error)
+
+class GuildAudioStream(discord.AudioSource):
+    """
+    Long-lived source for one guild. Clips are added with `enqueue`; `read` plays them back to back,
+    bridges short waits for the next clip with silence, and returns b"" once idle (ending playback,
+    which the playback loop restarts with this same stream when more clips arrive).
+    """
+
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+
+        self._clips: Deque[PCMClip] = deque()
+        self._current: Optional[PCMClip] = None
+        self._lock = threading.Lock()
+        self._idle_frames = 0
+        self._skip: Optional[PCMClip] = None # the playing clip, once it's been dropped
+        # the audio thread reading the stream (from its first read until cleanup), which owns the playing clip
+        self._reader: Optional[int] = None
+
+    def enqueue(self, clip: PCMClip, lane: Hashable = None):
+        """
+        Adds a clip to play after everything already in the stream
+
+        Args:
+            clip (PCMClip): the clip to add
+            lane (Hashable): unused, clips all share one lane here
+        """
+        with self._lock:
+            self._clips.append(clip)
+
+    @property
+    def pending(self) -> int:
+        "How many clips are waiting, not counting the one playing"
+        return len(self._clips)
+
+    def peek(self) -> Optional[PCMClip]:
+        "The clip playing, or next to play"
+        with self._lock:
+            return self._current or (self._clips[0] if self._clips else None)
+
+    def has_audio(self) -> bool:
+        "Whether there's anything to play"
+        return self._current is not None or bool(self._clips)
+
+    def clips(self) -> list[PCMClip]:
+        "The clip playing (if any) and every clip waiting"
+        with self._lock:
+            return ([self._current] if self._current else []) + list(self._clips)
+
+    def playing(self) -> list[PCMClip]:
+        "The clip playing, if any"
+        current = self._current
+        return [current] if current else []
+
+    def drop(self, match: Callable[[PCMClip], bool]) -> int:
+        """
+        Drops every clip `match` accepts. Waiting clips are finished right away; the playing one is
+        stopped by the audio thread at its next frame, so it isn't closed mid-read.
+
+        Args:
+            match (Callable[[PCMClip], bool]): which clips to drop
+
+        Returns:
+            dropped (int): how many clips were dropped
+        """
+        with self._lock:
+            dropped = [clip for clip in self._clips if match(clip)]
+            for clip in dropped:
+                self._clips.remove(clip)
+            if self._current and match(self._current):
+                dropped.append(self._current)
+                self._release_current()
+
+        for clip in dropped:
+            if clip is not self._skip:
+                clip.finish()
+        return len(dropped)
+
+    def _release_current(self):
+        """
+        Stops the playing clip. Hold the lock. If an audio thread is reading the stream, the clip is
+        left for it to finish at its next frame (or in `cleanup`), so it isn't closed mid-read;
+        otherwise it's just let go, for the caller to finish.
+        """
+        if self._reader is not None:
+            self._skip = self._current
+        else:
+            self._current = None
+
+    def is_opus(self) -> bool:
+        return False
+
+    def can_enqueue(self, lane: Hashable, lookahead: int) -> bool:
+        """
+        Whether another clip should be handed to the stream yet
+
+        Args:
+            lane (Hashable): unused, clips all share one lane here
+            lookahead (int): how many clips may wait behind the playing one
+        """
+        return self.pending < lookahead
+
+    def read_pcm(self) -> Optional[bytes]:
+        """
+        Reads the next 20ms of mono PCM, moving on to the next clip as each one ends
+
+        Returns:
+            frame (Optional[bytes]): the frame, or None if there's no clip to play right now
+        """
+        reader = threading.get_ident()
+        if self._reader != reader:
+            with self._lock:
+                self._reader = reader
+
+        while True:
+            if self._current is None:
+                with self._lock:
+                    self._current = self._clips.popleft() if self._clips else None
+                if self._current is None:
+                    return None
+
+            if self._skip is self._current:
+                self._skip = None
+                self._current.finish()
+                self._current = None
+                continue
+
+            try:
+                frame = self._current.read_frame()
+            except Exception as e:
+                self._current.finish(e)
+                self._current = None
+                continue
+
+            if frame:
+                return frame
+
+            self._current.finish()
+            self._current = None
+
+    def read(self) -> bytes:
+        frame = self.read_pcm()
+        if frame is None:
+            # nothing queued: linger briefly in case the next chunk is about to arrive
+            self._idle_frames += 1
+            if self._idle_frames > LINGER_FRAMES:
+                self._idle_frames = 0
+                return b""
+            frame = SILENCE
+        else:
+            self._idle_frames = 0
+
+        # discord wants 16-bit stereo, clips are stored mono
+        return audioop.tostereo(frame, SAMPLE_WIDTH, 1, 1)
+
+    def cleanup(self):
+        # playback ending doesn't end the stream, it's reused for the next clips. nothing is reading it
+        # now though, so a clip dropped mid-read can be finished
+        with self._lock:
+            if self._reader != threading.get_ident():
+                return # playback already restarted on another thread, which owns the clip now
+            self._reader = None
+            skipped = self._skip
+            if skipped is not None:
+                self._skip = self._current = None
+
+        if skipped is not None:
+            skipped.finish()
+
+    def close(self):
+        "Drops every clip, reporting each as done (e.g. when leaving VC)"
+        with self._lock:
+            clips = list(self._clips)
+            self._clips.clear()
+            current = self._current
+            if current:
+                self._release_current()
+
+        for clip in ([current] if current else []) + clips:
+            if clip is not self._skip:
+                clip.finish()
@@ -0,0 +1,113 @@
+"""
+Adaptive playback speed: when a guild's backlog gets long, clips are played faster (pitch preserved)
+so queue latency stays bounded without dropping messages. Each stretched rendition is written next
+to the original clip and deleted along with it once played.
+"""
+
+# built-in
+import asyncio
+import os
+
+# my modules
+from src.audio import transcode
+from src.utils.config import get_config
+
+# atempo can't go beyond this in one pass
+MAX_TEMPO = 2.0
+
+class AdaptiveSpeed():
+    """
+    Picks a playback speed from how much audio is waiting
+    """
+
+    def __init__(self, threshold: float = 30.0, max_speed: float = 1.5, step: float = 0.25):
+        """
+        Args:
+            threshold (float): seconds of queued audio before clips start being sped up
+            max_speed (float): the fastest clips will be played
+            step (float): speeds are rounded down to multiples of this, so the speed doesn't shift with every clip
+        """
+        self.threshold = threshold
+        self.max_speed = min(max_speed, MAX_TEMPO)
+        self.step = step
+
+    @classmethod
+    def from_config(cls) -> "AdaptiveSpeed | None":
+        """
+        Builds the speed policy from the "adaptive_speed" config section
+
+        Returns:
+            policy (AdaptiveSpeed | None): the policy, or None if it isn't enabled
+        """
+        config = get_config("adaptive_speed")
+        if not config.get("enabled", False):
+            return None
+
+        return cls(
+            threshold=config.get("threshold_s", 30.0),
+            max_speed=config.get("max_speed", 1.5),
+            step=config.get("step", 0.25)
+        )
+
+    def choose(self, backlog: float) -> float:
+        """
+        Picks the speed for the next clip
+
+        Args:
+            backlog (float): seconds of audio waiting to be played, including the next clip
+
+        Returns:
+            tempo (float): the speed multiplier, 1.0 if the backlog is under the threshold
+        """
+        if backlog <= self.threshold:
+            return 1.0
+
+        # play fast enough that the backlog would take about `threshold` seconds to get through
+        tempo = min(self.max_speed, backlog / self.threshold)
+        tempo = int(tempo / self.step) * self.step
+        return max(1.0, round(tempo, 3))
+
+def rendition_path(filepath: str, tempo: float) -> str:
+    """
+    Gets where a clip's rendition at some speed lives (next to the original)
+
+    Args:
+        filepath (str): the original clip
+        tempo (float): the speed multiplier
+
+    Returns:
+        path (str): the rendition's path
+    """
+    root, ext = os.path.splitext(filepath)
+    return f"{root} x{tempo:g}{ext}"
+
+async def get_rendition(filepath: str, tempo: float) -> str:
+    """
+    Writes a clip's rendition at some speed
+
+    Args:
+        filepath (str): the original clip
+        tempo (float): the speed multiplier
+
+    Returns:
+        path (str): the rendition's path
+
+    Raises:
+        TranscodeError: if ffmpeg couldn't stretch the clip
+    """
+    path = rendition_path(filepath, tempo)
+    pcm = await asyncio.to_thread(_read, filepath)
+    stretched = await transcode.stretch_pcm(pcm, tempo)
+    await asyncio.to_thread(_write, path, stretched)
+    return path
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+def _write(path: str, data: bytes):
+    # write under a temporary name first, so a half-written rendition is never picked up
+    temp_path = f"{path}.part"
+    with open(temp_path, "wb") as file:
+        file.write(data)
+    os.replace(temp_path, path)
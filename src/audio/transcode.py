@@ -0,0 +1,128 @@
+"""
+Decodes synthesized clips (mp3, wav, ...) into the raw PCM the playback streams read.
+Decoding happens once per clip when it's synthesized, never at playback time.
+"""
+
+# built-in
+import asyncio
+import os
+import platform
+
+# my modules
+from src.audio.governor import GOVERNOR
+from src.errors import OSNotSupportedError
+from src.utils.config import get_config
+
+# every clip is stored as 16-bit little-endian mono PCM at Discord's sample rate
+SAMPLE_RATE = 48000
+SAMPLE_WIDTH = 2
+CHANNELS = 1
+FRAME_SAMPLES = SAMPLE_RATE // 50 # 20ms
+FRAME_BYTES = FRAME_SAMPLES * SAMPLE_WIDTH * CHANNELS
+BYTES_PER_SECOND = SAMPLE_RATE * SAMPLE_WIDTH * CHANNELS
+PCM_EXTENSION = "pcm"
+PCM_FORMAT_ARGS = ["-f", "s16le", "-ac", str(CHANNELS), "-ar", str(SAMPLE_RATE)]
+
+_FFMPEG_PATH: str | None = None
+
+class TranscodeError(Exception):
+    "ffmpeg couldn't decode a clip"
+
+def set_ffmpeg_path(path: str):
+    """
+    Overrides which ffmpeg executable is used
+
+    Args:
+        path (str): the ffmpeg executable
+    """
+    global _FFMPEG_PATH
+    _FFMPEG_PATH = path
+
+def get_ffmpeg_path() -> str:
+    """
+    Gets the ffmpeg executable: the override or "ffmpeg_path" config if set, otherwise the platform's usual location
+
+    Returns:
+        path (str): the ffmpeg executable
+    """
+    global _FFMPEG_PATH
+
+    if _FFMPEG_PATH:
+        return _FFMPEG_PATH
+
+    configured = get_config("audio").get("ffmpeg_path")
+    if configured:
+        _FFMPEG_PATH = configured
+        return _FFMPEG_PATH
+
+    match platform.system():
+        case "Windows":
+            _FFMPEG_PATH = os.path.join("depend", "ffmpeg.exe")
+        case "Darwin":
+            _FFMPEG_PATH = "/opt/homebrew/bin/ffmpeg"
+        case _:
+            raise OSNotSupportedError()
+
+    return _FFMPEG_PATH
+
+async def run_ffmpeg(args: list[str], input_bytes: bytes) -> bytes:
+    """
+    Runs ffmpeg, piping bytes in and collecting stdout. Waits for a governor slot first,
+    so this is the only place ffmpeg should be spawned from.
+
+    Args:
+        args (list[str]): ffmpeg arguments (reading from pipe:0, writing to pipe:1)
+        input_bytes (bytes): what to feed ffmpeg's stdin
+
+    Returns:
+        output (bytes): ffmpeg's stdout
+
+    Raises:
+        TranscodeError: if ffmpeg exits unsuccessfully
+    """
+    async with GOVERNOR.slot():
+        process = await asyncio.create_subprocess_exec(
+            get_ffmpeg_path(), "-hide_banner", "-loglevel", "error", *args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            output, errors = await process.communicate(input_bytes)
+        except asyncio.CancelledError:
+            if process.returncode is None:
+                process.kill()
+                await process.wait() # reap it before giving up the slot
+            raise
+
+    if process.returncode != 0:
+        raise TranscodeError(errors.decode("utf-8", "replace").strip() or f"ffmpeg exited with {process.returncode}")
+    return output
+
+async def decode_to_pcm(audio: bytes) -> bytes:
+    """
+    Decodes a clip to playback PCM (16-bit mono at 48kHz)
+
+    Args:
+        audio (bytes): the clip in any format ffmpeg understands
+
+    Returns:
+        pcm (bytes): the decoded PCM
+    """
+    return await run_ffmpeg(["-i", "pipe:0", *PCM_FORMAT_ARGS, "pipe:1"], audio)
+
+async def stretch_pcm(pcm: bytes, tempo: float) -> bytes:
+    """
+    Speeds up (or slows down) playback PCM without changing its pitch
+
+    Args:
+        pcm (bytes): playback PCM
+        tempo (float): the speed multiplier, from 0.5 to 2.0 (atempo's range)
+
+    Returns:
+        pcm (bytes): the stretched PCM
+    """
+    return await run_ffmpeg(
+        [*PCM_FORMAT_ARGS, "-i", "pipe:0", "-filter:a", f"atempo={tempo:g}", *PCM_FORMAT_ARGS, "pipe:1"],
+        pcm
+    )
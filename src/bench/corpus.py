@@ -0,0 +1,124 @@
+"""
+Deterministic corpus of realistic chat messages for benchmarking the text pipeline.
+Everything is generated from a fixed seed, so runs are comparable across machines and commits.
+"""
+
+# built-in
+from types import SimpleNamespace
+import json
+import os
+import random
+
+SEED = 1424873603
+
+WORDS = (
+    "lol the minecraft server is down again pls brb ngl that was wild uwu labubu bros "
+    "i think we should queue for ranked after dinner wtf did you just say regex params "
+    "unironically the best take ever ykwim anyway who is hosting the movie night tonight"
+).split()
+
+EMOTICONS = [":)", ":(", ">:)", ">:(", ":o", "D:", ":D", ":3", ">:3", "<3"]
+
+class FakeGuild():
+    """
+    Stands in for discord.Guild, answering the lookups `expand_mentions` makes
+    """
+
+    def __init__(self, members: int = 200, roles: int = 30, channels: int = 50):
+        self.members = {
+            100_000_000_000_000_000 + i: SimpleNamespace(nick=f"member{i}", display_name=f"member{i}") for i in range(members)
+        }
+        self.roles = {
+            200_000_000_000_000_000 + i: SimpleNamespace(name=f"role {i}") for i in range(roles)
+        }
+        self.channels = {
+            300_000_000_000_000_000 + i: SimpleNamespace(name=f"channel-number-{i}") for i in range(channels)
+        }
+
+    def get_member(self, user_id: int):
+        return self.members.get(user_id)
+
+    def get_role(self, role_id: int):
+        return self.roles.get(role_id)
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+def _load_emoji() -> list[str]:
+    "Loads the emoji list from emoji.json (relative to the working directory, like the driver)"
+    with open(os.path.join(os.getcwd(), "emoji.json"), encoding="utf-8") as f:
+        return list(json.load(f))
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def build_corpus(guild: FakeGuild, messages: int = 200) -> dict[str, list[str]]:
+    """
+    Builds every message category
+
+    Args:
+        guild (FakeGuild): the guild mention-dense messages should mention members of
+        messages (int): how many messages per category
+
+    Returns:
+        corpus (dict[str, list[str]]): category name -> messages
+    """
+    rng = random.Random(SEED)
+    emoji_list = _load_emoji()
+    member_ids = list(guild.members)
+    role_ids = list(guild.roles)
+    channel_ids = list(guild.channels)
+
+    def emoji_heavy() -> str:
+        parts = []
+        for _ in range(rng.randint(5, 25)):
+            parts.append(rng.choice(emoji_list) + ("\uFE0F" if rng.random() < 0.2 else ""))
+            if rng.random() < 0.4:
+                parts.append(_sentence(rng, rng.randint(1, 3)))
+        return " ".join(parts)
+
+    def paste() -> str:
+        text = ""
+        while len(text) < 2000:
+            text += _sentence(rng, rng.randint(6, 20)) + rng.choice([". ", "! ", "? ", "\n", " " + rng.choice(EMOTICONS) + " "])
+        return text[:2000]
+
+    def mention_dense() -> str:
+        parts = []
+        for _ in range(rng.randint(5, 20)):
+            kind = rng.random()
+            if kind < 0.6:
+                parts.append(f"<@{rng.choice(member_ids)}>")
+            elif kind < 0.8:
+                parts.append(f"<@&{rng.choice(role_ids)}>")
+            else:
+                parts.append(f"<#{rng.choice(channel_ids)}>")
+            parts.append(_sentence(rng, rng.randint(0, 3)))
+        return " ".join(parts)
+
+    return {
+        "short": [_sentence(rng, rng.randint(1, 8)) for _ in range(messages)],
+        "emoji": [emoji_heavy() for _ in range(messages)],
+        "paste": [paste() for _ in range(messages // 10 or 1)],
+        "mentions": [mention_dense() for _ in range(messages)]
+    }
+
+def build_pronunciations(entries: int = 500) -> dict[str, str]:
+    """
+    Builds a large custom pronunciation dictionary, like a busy server's
+
+    Args:
+        entries (int): how many pronunciations
+
+    Returns:
+        pronunciations (dict[str, str]): text -> pronunciation
+    """
+    rng = random.Random(SEED + 1)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+
+    pronunciations = {word: word.upper() for word in WORDS[:20]}
+    while len(pronunciations) < entries:
+        word = "".join(rng.choice(letters) for _ in range(rng.randint(3, 9)))
+        pronunciations[word] = " ".join(word)
+
+    return pronunciations
@@ -0,0 +1,81 @@
+"""
+Fake VoiceClient for load testing: consumes audio sources in real time (one frame per 20ms),
+like Pycord's audio player does, without Discord or a voice connection.
+"""
+
+# built-in
+from types import SimpleNamespace
+from typing import Callable, Optional
+import threading
+import time
+
+# PyPI
+import discord
+
+FRAME_SECONDS = discord.opus.Encoder.FRAME_LENGTH / 1000 # 20ms
+
+class FakeVoiceClient():
+    """
+    Implements the parts of discord.VoiceClient the playback loop uses
+    """
+
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        self.channel = SimpleNamespace(id=guild_id, name=f"fake-vc-{guild_id}", members=[])
+
+        self.frames_played = 0
+        self.late_frames = 0 # frames the source couldn't produce within their 20ms slot
+        self.clips_played = 0
+
+        self._connected = True
+        self._playing = threading.Event()
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def is_playing(self) -> bool:
+        return self._playing.is_set()
+
+    async def disconnect(self, force: bool = False):
+        self._connected = False
+
+    def play(self, source: discord.AudioSource, *, after: Optional[Callable[[Optional[Exception]], None]] = None, **_):
+        """
+        Plays the source in a background thread, calling `after` when it runs out
+
+        Args:
+            source (discord.AudioSource): the source to consume
+            after (Optional[Callable]): called with the error (or None) once done
+        """
+        if self.is_playing():
+            raise discord.ClientException("Already playing audio.")
+
+        self._playing.set()
+        threading.Thread(target=self._consume, args=(source, after), daemon=True).start()
+
+    def _consume(self, source: discord.AudioSource, after: Optional[Callable]):
+        error = None
+        next_frame = time.perf_counter()
+        try:
+            while self._connected:
+                data = source.read()
+                if not data:
+                    break
+
+                self.frames_played += 1
+                next_frame += FRAME_SECONDS
+                delay = next_frame - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # we're behind, a real client would have sent this frame late
+                    self.late_frames += 1
+                    next_frame = time.perf_counter()
+        except Exception as e:
+            error = e
+        finally:
+            source.cleanup()
+            self.clips_played += 1
+            self._playing.clear()
+            if after:
+                after(error)
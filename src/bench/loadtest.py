@@ -0,0 +1,221 @@
+"""
+Load test: drives the bot's own TTS code paths across many fake guilds, against the stub
+lazypy.ro server and fake voice clients, with no Discord connection.
+
+Reports throughput, synthesis/queue latency, time-to-first-audio, CPU and memory, so playback
+loop and driver changes can be compared.
+
+Usage (from the repo root, like the bot; needs ffmpeg):
+    python -m src.bench.loadtest --guilds 50 --messages 5 --rate 0.5
+"""
+
+# built-in
+from types import SimpleNamespace
+import argparse
+import asyncio
+import random
+import resource
+import shutil
+import sys
+import time
+
+# my modules
+from src.audio.governor import GOVERNOR
+from src.audio.tempo import AdaptiveSpeed
+from src.bench.corpus import WORDS
+from src.bench.fake_voice import FakeVoiceClient
+from src.bench.stub_server import StubTTSServer
+from src.tts import driver as ttsd
+from src.tts.worker_pool import WorkerPool
+from src.tts.tts_core import TTSManager, TTSBackgroundTask
+from src.utils import metrics
+from src.utils.rate_limit import TokenBucket
+from src.utils.tracing import Trace
+from src.vc.guild_state import GuildRegistry
+from src.vc.vc_state import VCState
+
+def pct(values: list[float], p: float) -> float:
+    "Gets the p-th percentile of values (0 if empty)"
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def span_durations(traces: list[Trace], name: str) -> list[float]:
+    "Collects the durations (ms) of every span called `name`"
+    return [span.to_dict()["duration_ms"] for trace in traces for span in trace.spans if span.name == name]
+
+async def run(args) -> dict:
+    """
+    Runs one load test
+
+    Returns:
+        report (dict): the measured results
+    """
+    rng = random.Random(args.seed)
+    server = StubTTSServer(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        seed=args.seed
+    )
+    server.start()
+    client = ttsd.TIKTOK_BACKEND.client
+    client.origin = server.origin
+    if args.upstream_rate:
+        client.gate.bucket = TokenBucket(args.upstream_rate, args.upstream_rate * 2)
+
+    mirror = None
+    hedging = {}
+    if args.hedge:
+        # a second, faster and more reliable stub stands in for a lazypyro mirror
+        mirror = StubTTSServer(latency=args.latency_ms / 2000, jitter=0, seed=args.seed + 1)
+        mirror.start()
+        hedging = {"enabled": True, "mirrors": [mirror.origin], "percentile": args.hedge_percentile}
+
+    if args.workers:
+        ttsd.WORKER_POOL = WorkerPool(args.workers, origin=server.origin, gate=client.gate)
+
+    guilds = GuildRegistry()
+    vc_state = VCState(guilds)
+    tts_manager = TTSManager(hedging=hedging, guilds=guilds)
+    voice_clients = []
+    for guild_id in range(1, args.guilds + 1):
+        vc = FakeVoiceClient(guild_id)
+        vc_state.set_vc_state(guild_id, vc)
+        voice_clients.append(vc)
+
+    # clips are decoded at ingest, so the ffmpeg path has to be set before anything is queued
+    bg_task = TTSBackgroundTask(
+        ffmpeg_path=args.ffmpeg,
+        playback={"mode": "overlap" if args.overlap else "serial", "max_lanes": args.max_lanes},
+        guilds=guilds
+    )
+    if args.speedup_after:
+        bg_task.adaptive_speed = AdaptiveSpeed(threshold=args.speedup_after, max_speed=args.max_speed)
+    bg_task.start(SimpleNamespace(loop=asyncio.get_running_loop()), vc_state, tts_manager)
+
+    traces: list[Trace] = []
+    return_codes: dict[str, int] = dict()
+    # the offline backend skips the stub server entirely
+    voices = ttsd.TONE_BACKEND.voices if args.offline else [v for v in ttsd.TIKTOK_VOICES if v != "NO SWEARING LIST"]
+
+    async def send(guild_id: int, text: str):
+        author_id = rng.randrange(args.users)
+        trace = Trace("loadtest", guild_id=guild_id, user_id=author_id)
+        traces.append(trace)
+        return_code = await tts_manager.download_and_queue(text, rng.choice(voices), guild_id, trace, author_id)
+        return_codes[return_code.name] = return_codes.get(return_code.name, 0) + 1
+
+    async def guild_traffic(guild_id: int):
+        # each /tts is its own task in the real bot, so don't await them one by one
+        sends = []
+        for _ in range(args.messages):
+            await asyncio.sleep(rng.expovariate(args.rate))
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, args.max_words)))
+            sends.append(asyncio.create_task(send(guild_id, text)))
+        await asyncio.gather(*sends)
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+
+    await asyncio.gather(*(guild_traffic(guild_id) for guild_id in range(1, args.guilds + 1)))
+    sent_done = time.perf_counter()
+
+    # wait for every queue to drain and every clip to finish playing
+    deadline = time.perf_counter() + args.drain_timeout
+    while time.perf_counter() < deadline:
+        queued = sum(state.queued_items() for state in guilds)
+        if queued == 0 and not any(vc.is_playing() for vc in voice_clients):
+            break
+        await asyncio.sleep(0.1)
+
+    elapsed = time.perf_counter() - start
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    bg_task.stop()
+    if ttsd.WORKER_POOL:
+        ttsd.WORKER_POOL.close()
+    await client.close()
+    for backend in ttsd.MIRROR_BACKENDS.values():
+        await backend.client.close()
+    server.stop()
+    if mirror:
+        mirror.stop()
+
+    played = [trace for trace in traces if any(span.name == "playback" for span in trace.spans)]
+    first_audio = [
+        min(span.start for span in trace.spans if span.name == "playback") - trace.start for trace in played
+    ]
+    # guild streams stay playing across clips, so count clips from their playback spans
+    clips = len(span_durations(traces, "playback"))
+    frames = sum(vc.frames_played for vc in voice_clients)
+    late = sum(vc.late_frames for vc in voice_clients)
+
+    return {
+        "guilds": args.guilds,
+        "messages": len(traces),
+        "return_codes": return_codes,
+        "upstream_requests": server.requests + (mirror.requests if mirror else 0),
+        "wall_s": elapsed,
+        "send_phase_s": sent_done - start,
+        "clips_played": clips,
+        "clips_per_s": clips / elapsed,
+        "late_frame_pct": 100 * late / frames if frames else 0.0,
+        "synthesize_ms": {p: pct(span_durations(traces, "synthesize"), p) for p in (50, 99)},
+        "queue_wait_ms": {p: pct(span_durations(traces, "queue_wait"), p) for p in (50, 99)},
+        "decode_ms": {p: pct(span_durations(traces, "decode"), p) for p in (50, 99)},
+        "first_audio_ms": {p: pct([t * 1000 for t in first_audio], p) for p in (50, 99)},
+        "ffmpeg_wait_ms": {p: metrics.percentile("ffmpeg.queue_wait_ms", p) or 0.0 for p in (50, 99)},
+        "ffmpeg_workers": GOVERNOR.max_workers,
+        "cpu_self_s": (usage_after.ru_utime + usage_after.ru_stime) - (usage_before.ru_utime + usage_before.ru_stime),
+        "cpu_children_s": children.ru_utime + children.ru_stime,
+        "max_rss_mib": usage_after.ru_maxrss / (1024 if sys.platform != "darwin" else 1024 * 1024)
+    }
+
+def print_report(report: dict):
+    print(f"guilds:              {report['guilds']}")
+    print(f"messages:            {report['messages']} {report['return_codes']}")
+    print(f"upstream requests:   {report['upstream_requests']}")
+    print(f"wall time:           {report['wall_s']:.1f}s (sending {report['send_phase_s']:.1f}s)")
+    print(f"clips played:        {report['clips_played']} ({report['clips_per_s']:.2f}/s)")
+    print(f"late frames:         {report['late_frame_pct']:.2f}%")
+    for key in ("synthesize_ms", "decode_ms", "ffmpeg_wait_ms", "queue_wait_ms", "first_audio_ms"):
+        print(f"{key + ':':<21}p50 {report[key][50]:.0f}ms, p99 {report[key][99]:.0f}ms")
+    print(f"cpu:                 {report['cpu_self_s']:.2f}s bot, {report['cpu_children_s']:.2f}s ffmpeg ({report['ffmpeg_workers']} workers)")
+    print(f"max rss:             {report['max_rss_mib']:.1f} MiB")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test the TTS pipeline against a stub server")
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=5, help="messages per guild")
+    parser.add_argument("--rate", type=float, default=0.5, help="messages per second per guild")
+    parser.add_argument("--max-words", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=300, help="stub request_tts.php base latency")
+    parser.add_argument("--jitter-ms", type=float, default=200, help="stub latency tail (exponential mean)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="stub temporary error rate")
+    parser.add_argument("--offline", action="store_true", help="use the offline tone backend instead of the stub server")
+    parser.add_argument("--hedge", action="store_true", help="hedge slow requests to a second (mirror) stub server")
+    parser.add_argument("--hedge-percentile", type=float, default=90, help="primary latency percentile to hedge after")
+    parser.add_argument("--upstream-rate", type=float, default=None, help="override the client's upstream requests/sec")
+    parser.add_argument("--drain-timeout", type=float, default=300, help="max seconds to wait for queues to drain")
+    parser.add_argument("--users", type=int, default=3, help="distinct message authors per guild")
+    parser.add_argument("--overlap", action="store_true", help="mix different users' clips instead of playing serially")
+    parser.add_argument("--max-lanes", type=int, default=3, help="clips mixed at once in overlap mode")
+    parser.add_argument("--speedup-after", type=float, default=None, help="seconds of backlog before clips are sped up")
+    parser.add_argument("--max-speed", type=float, default=1.5, help="fastest adaptive playback speed")
+    parser.add_argument("--workers", type=int, default=0, help="synthesize in this many worker processes")
+    parser.add_argument("--ffmpeg", default=shutil.which("ffmpeg"), help="ffmpeg executable")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not args.ffmpeg:
+        print("ffmpeg not found, pass --ffmpeg")
+        return 1
+
+    print_report(asyncio.run(run(args)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
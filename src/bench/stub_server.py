@@ -0,0 +1,122 @@
+"""
+Local stand-in for lazypy.ro: mimics request_tts.php and the audio URL it hands back,
+with configurable latency and error rates. Runs its own event loop in a background thread,
+so blocking clients in the bot's loop can't deadlock it.
+"""
+
+# built-in
+import asyncio
+import random
+import threading
+
+# PyPI
+from aiohttp import web
+
+# my modules
+from src.tts.backends.tone import make_tone
+
+SECONDS_PER_CHAR = 0.06 # rough speaking rate
+MAX_AUDIO_SECONDS = 20
+
+class StubTTSServer():
+    """
+    Fake lazypy.ro. Start it, then point `ttsd.TIKTOK_BACKEND.client.origin` at `origin`.
+    """
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency: float = 0.3,
+        jitter: float = 0.2,
+        audio_latency: float = 0.05,
+        error_rate: float = 0.0,
+        unsupported_rate: float = 0.0,
+        seed: int = 0
+    ):
+        """
+        Args:
+            port (int): the port to listen on, 0 picks a free one
+            latency (float): mean seconds before request_tts.php answers
+            jitter (float): exponential tail added to the latency (mean seconds)
+            audio_latency (float): seconds before the audio URL answers
+            error_rate (float): fraction of requests answered with "temporarily unavailable"
+            unsupported_rate (float): fraction of requests answered with "not supported for this language"
+            seed (int): seed for latency/error randomness
+        """
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.audio_latency = audio_latency
+        self.error_rate = error_rate
+        self.unsupported_rate = unsupported_rate
+
+        self.requests = 0
+        self.audio_requests = 0
+
+        self._rng = random.Random(seed)
+        self._audio: dict[str, bytes] = dict()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._runner: web.AppRunner | None = None
+        self._ready = threading.Event()
+
+    @property
+    def origin(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def _request_tts(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        audio_id = f"{self.requests}"
+        data = await request.post()
+        text = data.get("text", "")
+
+        await asyncio.sleep(self.latency + self._rng.expovariate(1 / self.jitter) if self.jitter else self.latency)
+
+        roll = self._rng.random()
+        if roll < self.error_rate:
+            return web.json_response({"success": False, "error_msg": "TTS generation is temporarily unavailable"})
+        if roll < self.error_rate + self.unsupported_rate:
+            return web.json_response({"success": False, "error_msg": "This voice is not supported for this language"})
+
+        seconds = min(MAX_AUDIO_SECONDS, max(0.3, len(text) * SECONDS_PER_CHAR))
+        self._audio[audio_id] = make_tone(seconds, 220 + len(text) % 440)
+
+        return web.json_response({"success": True, "audio_url": f"{self.origin}/audio/{audio_id}.mp3"})
+
+    async def _audio_file(self, request: web.Request) -> web.Response:
+        self.audio_requests += 1
+        await asyncio.sleep(self.audio_latency)
+
+        audio = self._audio.pop(request.match_info["audio_id"], None)
+        if audio is None:
+            return web.Response(status=404)
+        return web.Response(body=audio, content_type="audio/mpeg")
+
+    def _serve(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+
+        app = web.Application()
+        app.router.add_post("/tts/request_tts.php", self._request_tts)
+        app.router.add_get("/audio/{audio_id}.mp3", self._audio_file)
+
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", self.port)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+
+        self._ready.set()
+        self._loop.run_forever()
+
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def start(self):
+        "Starts serving in a background thread, returning once the port is bound"
+        threading.Thread(target=self._serve, name="stub-tts-server", daemon=True).start()
+        self._ready.wait()
+
+    def stop(self):
+        "Stops serving"
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
@@ -0,0 +1,151 @@
+"""
+Offline benchmarks for the text pipeline: adjust_pronunciation, smart_chunk, emoji replacement
+and mention expansion, over a deterministic corpus of chat messages.
+
+Reports ops/sec and allocations per op, and exits non-zero when any case is slower than the
+stored baseline by more than the threshold.
+
+Usage (from the repo root, like the bot):
+    python -m src.bench.text_pipeline                   # run and compare against the baseline
+    python -m src.bench.text_pipeline --save-baseline   # run and store the results as the baseline
+"""
+
+# built-in
+from typing import Callable
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# my modules
+from src.bench.corpus import FakeGuild, build_corpus, build_pronunciations
+from src.tts import driver as ttsd
+from src.utils.discord_utils import expand_mentions
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_THRESHOLD = 0.2 # fail if ops/sec drops more than 20% below baseline
+VOICE = ttsd.TIKTOK_VOICES[0]
+
+def normalize(text: str) -> list[str]:
+    "What `download_and_queue` does to a message before synthesis: pronunciation, then chunking"
+    return ttsd.smart_chunk(ttsd.adjust_pronunciation(text, VOICE), ttsd.TIKTOK_BACKEND.max_chunk_length)
+
+def build_cases() -> dict[str, tuple[Callable[[str], object], list[str]]]:
+    """
+    Builds every benchmark case. adjust_pronunciation is called as the bot calls it (the built-in
+    dictionary only), plus once with a large custom dictionary, for when per-server pronunciations
+    are passed in.
+
+    Returns:
+        cases (dict): case name -> (function taking one message, messages to run it over)
+    """
+    guild = FakeGuild()
+    corpus = build_corpus(guild)
+    pronunciations = build_pronunciations()
+
+    return {
+        "adjust_pronunciation/short": (lambda text: ttsd.adjust_pronunciation(text, VOICE), corpus["short"]),
+        "adjust_pronunciation/emoji": (lambda text: ttsd.adjust_pronunciation(text, VOICE), corpus["emoji"]),
+        "adjust_pronunciation/paste": (lambda text: ttsd.adjust_pronunciation(text, VOICE), corpus["paste"]),
+        "adjust_pronunciation/large_dict": (
+            lambda text: ttsd.adjust_pronunciation(text, VOICE, pronunciations), corpus["short"]
+        ),
+        "normalize/short": (normalize, corpus["short"]),
+        "normalize/paste": (normalize, corpus["paste"]),
+        "smart_chunk/short": (ttsd.smart_chunk, corpus["short"]),
+        "smart_chunk/paste": (ttsd.smart_chunk, corpus["paste"]),
+        "replace_emoji/emoji": (ttsd.replace_emoji, corpus["emoji"]),
+        "expand_mentions/mentions": (lambda text: expand_mentions(text, guild), corpus["mentions"])
+    }
+
+def measure(func: Callable[[str], object], messages: list[str], seconds: float) -> dict:
+    """
+    Measures throughput and allocations of one case
+
+    Args:
+        func (Callable[[str], object]): the function to benchmark
+        messages (list[str]): the messages to cycle through
+        seconds (float): roughly how long to spend timing
+
+    Returns:
+        result (dict): ops/sec, plus peak bytes and allocated blocks per op
+    """
+    # warm up (regex caches, lazy imports)
+    for message in messages:
+        func(message)
+
+    ops = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for message in messages:
+            func(message)
+        ops += len(messages)
+    elapsed = time.perf_counter() - start
+
+    # allocations are measured in a separate pass, tracemalloc slows everything down
+    tracemalloc.start()
+    peak_total = 0
+    blocks_before = len(tracemalloc.take_snapshot().traces)
+    for message in messages:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        func(message)
+        _, peak = tracemalloc.get_traced_memory()
+        peak_total += peak - base
+    blocks_after = len(tracemalloc.take_snapshot().traces)
+    tracemalloc.stop()
+
+    return {
+        "ops_per_sec": ops / elapsed,
+        "peak_bytes_per_op": peak_total / len(messages),
+        "retained_blocks": blocks_after - blocks_before
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the TTS text pipeline")
+    parser.add_argument("--seconds", type=float, default=1.0, help="time spent per case")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown vs. baseline (0.2 = 20%%)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file to compare against/save to")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--filter", default="", help="only run cases containing this string")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    print(f"{'case':<36}{'ops/sec':>12}{'peak B/op':>12}{'baseline':>12}{'change':>9}")
+    for name, (func, messages) in build_cases().items():
+        if args.filter not in name:
+            continue
+
+        result = measure(func, messages, args.seconds)
+        results[name] = result
+
+        base = baseline.get(name, {}).get("ops_per_sec")
+        change = f"{result['ops_per_sec'] / base - 1:+.1%}" if base else "—"
+        print(f"{name:<36}{result['ops_per_sec']:>12,.0f}{result['peak_bytes_per_op']:>12,.0f}{base or 0:>12,.0f}{change:>9}")
+
+        if base and result["ops_per_sec"] < base * (1 - args.threshold):
+            regressions.append(name)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"FAILED: {len(regressions)} case(s) regressed more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+Handles bot admin-only functionality.
+Currently this is on-demand profiling of the live bot, and dumping its metrics.
+"""
+
+# built-in
+import io
+import json
+
+# PyPI
+import discord
+from discord.ext import commands
+
+# my modules
+from src.cogs.settings_cog import ADMIN_IDS
+from src.utils.logging_utils import timestamp_print as tsprint
+from src.utils import metrics, profiling
+
+# required for cogs API
+def setup(bot: discord.Bot):
+    bot.add_cog(AdminCog(bot))
+
+class AdminCog(commands.Cog):
+    def __init__(self, bot: discord.Bot):
+        self.bot = bot
+
+    @discord.Cog.listener()
+    async def on_ready(self):
+        tsprint("Admin Cog is now ready!")
+
+    @discord.slash_command(name="profile", description="(BOT ADMIN ONLY) Profile the live bot")
+    @discord.option(
+        "mode",
+        description="CPU sampling or a memory allocation diff",
+        choices=["cpu", "memory"]
+    )
+    @discord.option("seconds", type=int, description="How long to profile for", min_value=1, max_value=120, default=10)
+    async def cmd_profile(self, ctx: discord.ApplicationContext, mode: str, seconds: int = 10):
+        """
+        Profiles the bot for a window and sends the report as an attachment
+
+        :param discord.ApplicationContext ctx: the context in which to execute
+        :param str mode: "cpu" for a sampling CPU profile, "memory" for a tracemalloc diff
+        :param int seconds: how long to profile for
+        """
+        if ctx.author.id not in ADMIN_IDS:
+            await ctx.respond(content="🚫 You must be a bot admin to profile the bot", ephemeral=True)
+            return
+
+        # acknowledge the command internally, profiling takes a while
+        await ctx.defer(ephemeral=True)
+        tsprint(f"Running {seconds}s {mode} profile for {ctx.author.id}...")
+
+        if mode == "cpu":
+            report = await profiling.profile_cpu(seconds)
+        else:
+            report = await profiling.profile_memory(seconds)
+
+        file = discord.File(io.BytesIO(report.encode("utf-8")), filename=f"profile_{mode}.txt")
+        await ctx.respond(content=f"📊 {seconds}s {mode} profile:", file=file, ephemeral=True)
+
+    @discord.slash_command(name="metrics", description="(BOT ADMIN ONLY) Dump the live bot's metrics")
+    async def cmd_metrics(self, ctx: discord.ApplicationContext):
+        """
+        Sends a snapshot of every counter, gauge and histogram as an attachment
+
+        :param discord.ApplicationContext ctx: the context in which to execute
+        """
+        if ctx.author.id not in ADMIN_IDS:
+            await ctx.respond(content="🚫 You must be a bot admin to see the bot's metrics", ephemeral=True)
+            return
+
+        snapshot = metrics.snapshot()
+        report = json.dumps(snapshot, indent=2, sort_keys=True)
+        file = discord.File(io.BytesIO(report.encode("utf-8")), filename="metrics.json")
+        await ctx.respond(
+            content=f"📈 {len(snapshot['counters'])} counters, {len(snapshot['gauges'])} gauges, "
+                    f"{len(snapshot['histograms'])} histograms:",
+            file=file,
+            ephemeral=True
+        )
@@ -1,6 +1,6 @@
 """
 Handles all the per-user, per-guild, and global settings bot functionality.
-This currently includes the settings command and the pronunciation command.
+This currently includes the settings command, the pronunciation command and the server's /tts limits.
 """
 
 # built-in
@@ -13,6 +13,7 @@ import discord
 from discord.ext import commands
 
 # my modules
+from src.tts import admission
 from src.tts import driver as ttsd
 from src.db import driver as dbd # NOT DEAD BY DAYLIGHT
 from src.utils.logging_utils import timestamp_print as tsprint
@@ -30,6 +31,7 @@ class SettingsCog(commands.Cog):
     settings = discord.SlashCommandGroup("settings", "Modify settings")
     user_settings = settings.create_subgroup("user", "Modify your user settings")
     pronunciations = settings.create_subgroup("pronunciations", "Adjust pronuncations of words (per-server)")
+    server_settings = settings.create_subgroup("server", "Modify this server's settings")
 
     def __init__(self, bot: discord.Bot):
         self.bot = bot
@@ -244,4 +246,55 @@ class SettingsCog(commands.Cog):
         if voice:
             await ctx.respond(f"✅ Your default voice has been set to **{voice}**! You can now use /tts without specifying a voice.")
         else:
-            await ctx.respond(f"✅ Your default voice has been cleared. You must now specify a voice when using /tts.")
\ No newline at end of file
+            await ctx.respond(f"✅ Your default voice has been cleared. You must now specify a voice when using /tts.")
+
+    @server_settings.command(name="limits", description="Get or set how often /tts can be used in this server")
+    @discord.option("user_per_min", type=float, description="Requests per minute each user may make", default=None, min_value=0.1)
+    @discord.option("user_burst", type=float, description="Requests each user may make at once", default=None, min_value=1)
+    @discord.option("guild_per_min", type=float, description="Requests per minute the whole server may make", default=None, min_value=0.1)
+    @discord.option("guild_burst", type=float, description="Requests the whole server may make at once", default=None, min_value=1)
+    async def cmd_settings_server_limits(
+        self,
+        ctx: discord.ApplicationContext,
+        user_per_min: float | None = None,
+        user_burst: float | None = None,
+        guild_per_min: float | None = None,
+        guild_burst: float | None = None
+    ):
+        """
+        Shows the server's /tts limits, or changes the ones given
+
+        :param discord.ApplicationContext ctx: the context in which to execute
+        :param float | None user_per_min: requests per minute each user may make
+        :param float | None user_burst: requests each user may make at once
+        :param float | None guild_per_min: requests per minute the whole server may make
+        :param float | None guild_burst: requests the whole server may make at once
+        """
+        limits = admission.guild_limits(ctx.guild_id)
+        changes = {
+            name: value
+            for name, value in (
+                ("user_per_min", user_per_min),
+                ("user_burst", user_burst),
+                ("guild_per_min", guild_per_min),
+                ("guild_burst", guild_burst)
+            )
+            if value is not None
+        }
+
+        if changes:
+            if not ctx.author.guild_permissions.manage_guild:
+                await ctx.respond(content="🚫 You need the Manage Server permission to change limits", ephemeral=True)
+                return
+            limits = admission.set_guild_limits(ctx.guild_id, **changes)
+            tsprint(f"Set /tts limits in guild {ctx.guild_id} to {limits}")
+
+        embed = discord.Embed(
+            title = "/tts Limits" + (" Updated!" if changes else ""),
+            description = f"How often /tts can be used in **{ctx.guild.name}**",
+            color = discord.Color.green() if changes else discord.Color.blurple()
+        )
+        embed.add_field(name = "Per user", value = f"{limits.user_per_min:g}/min, bursts of {limits.user_burst:g}")
+        embed.add_field(name = "Whole server", value = f"{limits.guild_per_min:g}/min, bursts of {limits.guild_burst:g}")
+
+        await ctx.respond(embed=embed)
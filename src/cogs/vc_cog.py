@@ -6,6 +6,7 @@ the components of text-to-speech and voice chat.
 
 # built-in
 from typing import Optional
+import asyncio
 
 # Pycord
 import discord
@@ -14,14 +15,29 @@ from discord.ext import commands
 # my modules
 from src.db import driver as dbd
 from src.tts import driver as ttsd
-from src.tts.voices import TikTokVoice as TTV
 from src.utils.logging_utils import timestamp_print as tsprint
-from src.utils.discord_utils import get_random_app_emoji
+from src.utils.discord_utils import get_random_app_emoji, expand_mentions
 from src.errors import *
-from src.vc.vc_state import VCState
-from src.tts.tts_core import TTSManager, TTSBackgroundTask
+from src.vc.shards import ShardRouter
+from src.vc.vc_state import ConnectionState
+from src.tts.queue_item import QueueItem
+from src.tts.queue_journal import QUEUE_JOURNAL
+from src.tts import storage
 from src.tts import driver as ttsd
 from src.tts.returncodes import TTSReturnCode as TRC
+from src.tts.tts_core import Match
+from src.tts.coalesce import MessageCoalescer
+from src.tts import admission
+from src.utils import metrics
+from src.utils.config import get_config
+from src.utils.tracing import Trace
+
+# what to tell a user whose /tts was turned away, by which limit did it
+REJECTIONS = {
+    "user": "⏳ You're sending TTS too fast, try again in a moment.",
+    "guild": "⏳ This server is sending too much TTS right now, try again in a moment.",
+    "global": "⏳ I'm getting too many TTS requests right now, try again in a moment."
+}
 
 # required for cogs API
 def setup(bot: discord.Bot):
@@ -34,31 +50,145 @@ class VCCog(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.vc_state = VCState()
-        self.tts_manager = TTSManager()
-        self.bg_task = TTSBackgroundTask()
+        # VC state, TTS queues and playback workers are kept per shard
+        self.shards = ShardRouter(bot)
+        self._restored = False
+
+        # guild_id -> text channel read aloud without /tts, loaded from the DB on ready
+        self.auto_tts_channels: dict[int, int] = dict()
+        self.coalescer = MessageCoalescer.from_config(self.speak_coalesced)
+        # voice for auto-TTS users who haven't set a default one (None = they're not read)
+        self.auto_tts_voice: Optional[str] = get_config("auto_tts").get("default_voice")
+        # opt-in: it needs the message content intent, and every message the bot sees goes through it
+        self.auto_tts_enabled: bool = get_config("auto_tts").get("enabled", False)
+        if self.auto_tts_enabled:
+            bot.add_listener(self.read_auto_tts_message, "on_message")
+
+        # reloaded while the bot is running: on_ready won't fire again
+        if bot.is_ready():
+            bot.loop.create_task(self.on_ready())
 
     @discord.Cog.listener()
     async def on_ready(self):
-        tsprint("Initializing guild VC list...")
+        # on_ready fires again after reconnects, only restore once
+        if not self._restored:
+            self._restored = True
+            dbd.init_db()
+            self.auto_tts_channels = dbd.get_auto_tts_channels()
+            await self.restore_queues()
 
-        for guild in self.bot.guilds:
-            self.vc_state.init_guild(guild.id)
-            self.tts_manager.init_guild(guild.id)
-        
-        tsprint("Creating TTS queue task in event loop...")
-        self.bg_task.start(self.bot, self.vc_state, self.tts_manager)
+        # per-guild state is created on first use, so there's nothing to set up per guild here
+        tsprint("Creating TTS queue tasks in event loop...")
+        self.shards.start()
 
         tsprint("VC Cog is now ready!")
 
+    def cog_unload(self):
+        """
+        Stops playback, the workers and the synthesis processes without dropping anything queued, so the
+        journal still has it for the next load
+        """
+        for shard in self.shards:
+            for _, vc in shard.vc_state.connected():
+                vc.stop()
+        self.shards.stop()
+        if self.auto_tts_enabled:
+            self.bot.remove_listener(self.read_auto_tts_message, "on_message")
+        if QUEUE_JOURNAL:
+            QUEUE_JOURNAL.stop()
+        if ttsd.WORKER_POOL:
+            ttsd.WORKER_POOL.close()
+
+    async def restore_queues(self):
+        """
+        Rejoins the voice channels queues were journaled in before the last restart/reload and puts those
+        queues back, reusing the clips on disk. Queues of guilds the bot can't rejoin are dropped (journal
+        rows and files), and any downloaded file nothing references is deleted.
+        """
+        if not QUEUE_JOURNAL:
+            return
+
+        dbd.init_db() # the journal table may not exist yet on a first run
+        rows = QUEUE_JOURNAL.load()
+        QUEUE_JOURNAL.start()
+        # nothing is synthesizing yet, so anything unreferenced can go right away
+        removed, _ = await asyncio.to_thread(storage.sweep, {row[3] for row in rows})
+        if removed:
+            tsprint(f"Removed {removed} orphaned file(s) from {storage.DOWNLOADS_DIR}")
+
+        if not rows:
+            return
+
+        # guild_id -> its journaled clips (oldest first), and the channel it was last queued from
+        guild_rows: dict[int, list[tuple]] = dict()
+        channels: dict[int, int] = dict()
+        for row in rows:
+            guild_rows.setdefault(row[0], []).append(row)
+            if row[1]:
+                channels[row[0]] = row[1]
+
+        restored = 0
+        for guild_id, clips in guild_rows.items():
+            if not await self.rejoin(guild_id, channels.get(guild_id)):
+                # nothing would ever play these, drop them now rather than on the guild's next /tts
+                for row in clips:
+                    QUEUE_JOURNAL.remove(row[3])
+                await asyncio.to_thread(storage.remove_files, [row[3] for row in clips])
+                continue
+
+            state = self.shards.for_guild(guild_id).guilds.get_or_create(guild_id)
+            for _, _, voice, filename, author_id, duration, gain in clips:
+                state.queue(voice).append(QueueItem(filename, None, author_id, duration, gain))
+            restored += len(clips)
+
+        tsprint(
+            f"Restored {restored} queued clip(s), dropped {len(rows) - restored} "
+            f"from guild(s) the bot couldn't rejoin"
+        )
+
+    async def rejoin(self, guild_id: int, channel_id: Optional[int]) -> bool:
+        """
+        Gets the bot back into a guild's voice channel after a restart/reload, adopting the connection if
+        it's still there. Channels nobody is listening in aren't rejoined.
+
+        ## Args:
+        - `guild_id` (int): the guild
+        - `channel_id` (Optional[int]): the voice channel its queue was journaled in
+
+        ## Returns:
+        - `rejoined` (bool): True if the bot is in VC there now
+        """
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            return False
+        vc_state = self.shards.for_guild(guild_id).vc_state
+
+        # after a cog reload the bot is still connected, just adopt the connection
+        if guild.voice_client:
+            vc_state.set_vc_state(guild_id, guild.voice_client)
+            vc_state.track_occupancy(guild_id, guild.voice_client.channel, self.leave_if_empty)
+        else:
+            channel = guild.get_channel(channel_id) if channel_id else None
+            # don't rejoin a channel nobody is listening in
+            if channel is None or not any(not m.bot for m in channel.members):
+                return False
+            try:
+                await vc_state.ensure_connected(guild_id, channel)
+            except Exception as e:
+                tsprint(f"Could not rejoin VC {channel.name} in {guild_id}: {e}")
+                return False
+        vc_state.touch(guild_id, self.leave_if_idle)
+        return True
+
     # HELPERS
     async def try_leave_vc(self, guild_id: int, ctx: Optional[discord.ApplicationContext] = None):
         """
         Attempts to leave a VC in a guild, optionally sending a message if ctx is given.
         """
         tsprint("Bot attempting to leave VC...")
+        shard = self.shards.for_guild(guild_id)
         
-        vc = self.vc_state.vc_dict.get(guild_id)
+        vc = shard.vc_state.get_vc_state(guild_id)
         if not vc or not vc.is_connected():
             tsprint("Bot was not in a VC")
             if ctx:
@@ -69,11 +199,92 @@ class VCCog(commands.Cog):
             await ctx.respond("👋🏻 Left voice!")
 
         # reset triggered channel
-        self.vc_state.set_last_triggered(guild_id, None)
-        await vc.disconnect()
-        self.vc_state.set_vc_state(guild_id, None)
+        shard.vc_state.set_last_triggered(guild_id, None)
+        await shard.vc_state.disconnect(guild_id)
+        await self.release_guild(guild_id)
         tsprint("Bot left VC successfully")
 
+    async def release_guild(self, guild_id: int):
+        """
+        Cancels everything a guild is synthesizing and drops everything it has queued or playing, then
+        deletes its download folder in one go.
+        Safe to call more than once (leaving also fires on_voice_state_update).
+        """
+        shard = self.shards.for_guild(guild_id)
+        self.coalescer.drop_guild(guild_id)
+        shard.tts_manager.cancel_downloads(guild_id, lambda author_id, trace: True)
+        shard.bg_task.close_stream(guild_id)
+        purged = shard.tts_manager.purge(guild_id)
+        removed = await asyncio.to_thread(storage.purge_guild_dir, guild_id)
+        if purged or removed:
+            tsprint(f"Purged {purged} queued clip(s) and {removed} file(s) in {guild_id}")
+
+    async def clear_queue(self, guild_id: int, match: Match) -> int:
+        """
+        Cancels, stops and drops every request/clip in a guild that `match` accepts, deleting their files.
+        """
+        shard = self.shards.for_guild(guild_id)
+        cancelled = shard.tts_manager.cancel_downloads(guild_id, match)
+        stopped = shard.bg_task.drop_clips(guild_id, match)
+        dropped = shard.tts_manager.drop(guild_id, match)
+        await asyncio.to_thread(storage.remove_files, [item.filename for item in dropped])
+        return cancelled + stopped + len(dropped)
+
+    async def leave_if_idle(self, guild_id: int):
+        """
+        Called when a guild's connection has gone unused for the idle timeout: leaves, unless audio
+        is still queued or playing, in which case the timer starts over.
+        """
+        shard = self.shards.for_guild(guild_id)
+        state = shard.guilds.get(guild_id)
+        stream = state.stream if state else None
+        if (stream and stream.has_audio()) or shard.tts_manager.queued_seconds(guild_id) > 0:
+            shard.vc_state.touch(guild_id, self.leave_if_idle)
+            return
+
+        tsprint(f"VC in {guild_id} idle for {shard.vc_state.idle_timeout}s. Leaving.")
+        await self.try_leave_vc(guild_id)
+
+    async def leave_if_empty(self, guild_id: int):
+        """
+        Called once the bot's channel has had no humans in it for the grace period: leaves, unless
+        someone came back meanwhile.
+        """
+        vc_state = self.shards.for_guild(guild_id).vc_state
+        if vc_state.get_humans(guild_id) or not vc_state.is_connected(guild_id):
+            return
+
+        tsprint(f"Nobody in VC in {guild_id} except bots for {vc_state.empty_grace}s. Leaving.")
+        await self.try_leave_vc(guild_id)
+
+    async def speak_coalesced(self, guild_id: int, author_id: int, text: str, messages: int):
+        """
+        Queues TTS for a burst of auto-TTS messages, once the coalescer has merged them
+        """
+        shard = self.shards.for_guild(guild_id)
+        guild = self.bot.get_guild(guild_id)
+        # the bot may have left while the messages were buffered
+        if guild is None or not shard.vc_state.is_connected(guild_id):
+            return
+
+        voice = dbd.get_user_voice(author_id) or self.auto_tts_voice
+        if voice not in ttsd.TTS_VOICES:
+            metrics.inc("auto_tts.no_voice")
+            return
+
+        # a coalesced burst counts as one request
+        if admission.admit(guild_id, author_id):
+            return
+
+        trace = Trace("auto_tts", guild_id=guild_id, user_id=author_id, chars=len(text), messages=messages)
+        with trace.span("normalize.mentions"):
+            text = expand_mentions(text, guild)
+
+        shard.vc_state.touch(guild_id, self.leave_if_idle)
+        return_code = await shard.tts_manager.download_and_queue(text, voice, guild_id, trace, author_id)
+        if return_code not in (TRC.OKAY, TRC.CANCELLED):
+            tsprint(f"Auto-TTS failed in {guild_id}: {return_code.name}")
+
     # COMMANDS
     @discord.slash_command(
         name="tts",
@@ -95,23 +306,44 @@ class VCCog(commands.Cog):
         """
         Does TTS (soon to include Moonbase Alpha, REPO)
         """
-        # silently acknowledge the command while we process
-        await ctx.defer()
+        # admission first, so a rejection costs no normalization, network or disk work
+        rejected_by = admission.admit(ctx.guild_id, ctx.author.id)
+        if rejected_by:
+            await ctx.respond(REJECTIONS[rejected_by], ephemeral=True)
+            return
 
-        # make sure vc and tts queue dicts have entries for this guild
-        self.vc_state.init_guild(ctx.guild_id)
-        self.tts_manager.init_guild(ctx.guild_id)
+        # every span from here to playback completion is recorded against this trace
+        trace = Trace("tts", guild_id=ctx.guild_id, user_id=ctx.author.id, chars=len(input))
+
+        # silently acknowledge the command while we process
+        with trace.span("defer"):
+            await ctx.defer()
 
         # if the user isn't in a VC, it doesn't make sense to do TTS
         author_vc = ctx.author.voice
         if author_vc is None:
+            trace.finish(rejected="not_in_vc")
             await ctx.respond("❌ You are not in a VC.")
             return
 
-        if not self.vc_state.is_connected_in_channel(ctx.guild_id, author_vc.channel):
-            await self.try_leave_vc(ctx.guild_id)
-            vc = await author_vc.channel.connect(reconnect=False)
-            self.vc_state.set_vc_state(ctx.guild_id, vc)
+        shard = self.shards.for_guild(ctx.guild_id)
+        if shard.vc_state.is_settling(ctx.guild_id):
+            # someone else's /tts or /join is already taking the bot somewhere: let it get there
+            # instead of dragging the bot off mid-move
+            settled = await shard.vc_state.wait_settled(ctx.guild_id)
+            if settled == ConnectionState.CONNECTED and not shard.vc_state.is_connected_in_channel(ctx.guild_id, author_vc.channel):
+                trace.finish(rejected="vc_busy")
+                await ctx.respond("❌ I just joined another VC, try again in a moment.")
+                return
+        if not shard.vc_state.is_connected_in_channel(ctx.guild_id, author_vc.channel):
+            # already in another channel here? that's a move, which reuses the voice session
+            try:
+                with trace.span("vc.connect", moved=bool(shard.vc_state.is_connected(ctx.guild_id))):
+                    await shard.vc_state.ensure_connected(ctx.guild_id, author_vc.channel)
+            except Exception:
+                trace.finish(rejected="connect_failed")
+                raise
+        shard.vc_state.touch(ctx.guild_id, self.leave_if_idle)
         
         # if no voice is specified, need to check if user has a default set and use it
         if voice is None:
@@ -119,6 +351,7 @@ class VCCog(commands.Cog):
             if db_user_voice:
                 voice = db_user_voice
             else:
+                trace.finish(rejected="no_voice")
                 await ctx.respond("❌ You need to specify a voice or set a default with /settings voice")
                 return
 
@@ -128,49 +361,29 @@ class VCCog(commands.Cog):
 
         # --------------------------------
 
-        # ----- HANDLE PINGS -----
-        # translate raw user mentions to nicknames
-        raw_mentions = discord.utils.raw_mentions(input)
-        for user_id in raw_mentions:
-            input = input.replace(
-                f"<@{user_id}>",
-                "@" + ctx.guild.get_member(user_id).nick
-            )
-        
-        # translate raw role mentions to role names
-        raw_mentions = discord.utils.raw_role_mentions(input)
-        for role_id in raw_mentions:
-            input = input.replace(
-                f"<@&{role_id}>",
-                "@" + ctx.guild.get_role(role_id).name
-            )
-        
-        # translate raw channel mentions to role names
-        raw_mentions = discord.utils.raw_channel_mentions(input)
-        for channel_id in raw_mentions:
-            input = input.replace(
-                f"<#{channel_id}>",
-                "#" + ctx.guild.get_channel(channel_id).name.replace("-", " ")
-            )
-        # --------------------------------
+        # translate raw user/role/channel mentions to names
+        with trace.span("normalize.mentions"):
+            input = expand_mentions(input, ctx.guild)
 
         return_code = TRC.NONE
         # download and queue the voice line
         if voice in ttsd.TTS_VOICES:
-            # TODO: can this be updated to use the list in ttsd instead?
-            voice_internal = voice.replace(" ", "_") # internal voice names are goofy, translate them pls
-
-            # is this a LazyPyro voice?
-            if voice_internal in TTV._member_names_:
-                return_code = await self.tts_manager.download_and_queue(input, TTV[voice_internal], ctx.guild_id)
+            return_code = await shard.tts_manager.download_and_queue(input, voice, ctx.guild_id, trace, ctx.author.id)
+        else:
+            # e.g. a saved default voice that's since been removed
+            trace.finish(rejected="unknown_voice")
         
         # error return codes? make error known
         if return_code == TRC.LANGUAGE_UNSUPPORTED:
             await ctx.respond(f"❌ Invalid phonemes or characters in input.")
         if return_code == TRC.TEMP_UNAVAILABLE:
             await ctx.respond(f"❌ Lazypyro is temporarily unavailable.")
+        if return_code == TRC.RATE_LIMITED:
+            await ctx.respond(f"❌ Too many TTS requests right now, try again in a moment.")
         if return_code == TRC.GENERIC_ERROR:
             await ctx.respond(f"❌ Generic error from lazypyro.")
+        if return_code == TRC.CANCELLED:
+            await ctx.respond(f"🗑️ Cleared before it was spoken.")
 
         # any error should cause an exit
         if return_code != TRC.OKAY:
@@ -197,8 +410,8 @@ class VCCog(commands.Cog):
         """
         Forces the bot to join VC.
         """
-        self.vc_state.init_guild(ctx.guild_id)
-        self.vc_state.set_last_triggered(ctx.guild_id, ctx.channel_id)
+        vc_state = self.shards.for_guild(ctx.guild_id).vc_state
+        vc_state.set_last_triggered(ctx.guild_id, ctx.channel_id)
 
         author_vc = ctx.author.voice
         # not in a vc
@@ -206,19 +419,93 @@ class VCCog(commands.Cog):
             await ctx.respond("❌ You are not in a VC.")
             return
         
-        if self.vc_state(ctx.guild_id):
-            await ctx.respond("❌ Already connected in this guild.")
+        voice_channel = vc or author_vc.channel # shorthand for separate ifs
+        if vc_state.is_connected_in_channel(ctx.guild_id, voice_channel):
+            await ctx.respond("❌ Already connected to that VC.")
+            return
+        if vc_state.is_settling(ctx.guild_id):
+            await ctx.respond("❌ Already joining a VC, try again in a moment.")
             return
         
         await ctx.defer(invisible=False)
         await ctx.respond(content="🛜 Connecting...")
         
-        voice_channel = vc or author_vc.channel # shorthand for separate ifs
-        vc_client = await voice_channel.connect(reconnect=False)
-        self.vc_state.set_vc_state(ctx.guild_id, vc_client)
+        await vc_state.ensure_connected(ctx.guild_id, voice_channel)
+        vc_state.touch(ctx.guild_id, self.leave_if_idle)
 
         await ctx.edit(content=f"✅ Successfully joined **{voice_channel.name}**! Use /tts to speak.")
 
+    @discord.slash_command(name="skip", description="Skips the message currently being spoken.", dm_permission=False)
+    async def cmd_skip(self, ctx: discord.ApplicationContext):
+        """
+        Stops the clip(s) playing, and drops the rest of their messages (queued or still synthesizing).
+        """
+        shard = self.shards.for_guild(ctx.guild_id)
+        playing = shard.bg_task.skip(ctx.guild_id)
+        if not playing:
+            await ctx.respond("❌ Nothing is playing.")
+            return
+
+        # the rest of a long message is queued (or synthesizing) as further chunks
+        traces = {clip.trace for clip in playing if clip.trace}
+        await self.clear_queue(ctx.guild_id, lambda author_id, trace: trace is not None and trace in traces)
+        await ctx.respond("⏭️ Skipped!")
+
+    @discord.slash_command(name="clear", description="Clears the TTS queue.", dm_permission=False)
+    @discord.option(
+        "mine",
+        type=bool,
+        description="Only clear your own messages (optional)",
+        default=False
+    )
+    async def cmd_clear(self, ctx: discord.ApplicationContext, mine: bool):
+        """
+        Stops and drops everything queued in the guild (or just the user's messages), including
+        messages still being synthesized.
+        """
+        if mine:
+            author_id = ctx.author.id
+            cleared = await self.clear_queue(ctx.guild_id, lambda author, trace: author == author_id)
+        else:
+            cleared = await self.clear_queue(ctx.guild_id, lambda author, trace: True)
+
+        if not cleared:
+            await ctx.respond("❌ Nothing to clear.")
+            return
+        await ctx.respond("🗑️ Cleared your messages." if mine else "🗑️ Cleared the queue.")
+
+    @discord.slash_command(name="autotts", description="Reads every message in this channel aloud, no /tts needed.", dm_permission=False)
+    @discord.default_permissions(manage_guild=True)
+    @discord.option(
+        "enabled",
+        type=bool,
+        description="Whether to read this channel's messages aloud"
+    )
+    async def cmd_autotts(self, ctx: discord.ApplicationContext, enabled: bool):
+        """
+        Binds auto-TTS to the channel the command is used in, or turns it off for the guild.
+        Messages are only read while the bot is in VC, and only from users in the same VC.
+        """
+        if not self.auto_tts_enabled:
+            await ctx.respond("❌ Auto-TTS isn't enabled on this bot.", ephemeral=True)
+            return
+        # the default permissions can be overridden per server, so check anyway
+        if not ctx.author.guild_permissions.manage_guild:
+            await ctx.respond(content="🚫 You need the Manage Server permission to change auto-TTS", ephemeral=True)
+            return
+
+        if enabled:
+            dbd.set_auto_tts_channel(ctx.guild_id, ctx.channel_id)
+            self.auto_tts_channels[ctx.guild_id] = ctx.channel_id
+            self.shards.for_guild(ctx.guild_id).vc_state.set_last_triggered(ctx.guild_id, ctx.channel_id)
+            await ctx.respond("✅ I'll read messages in this channel aloud while I'm in VC. Set a voice with /settings user voice.")
+            return
+
+        dbd.set_auto_tts_channel(ctx.guild_id, None)
+        self.auto_tts_channels.pop(ctx.guild_id, None)
+        self.coalescer.drop_guild(ctx.guild_id)
+        await ctx.respond("✅ Auto-TTS is off. Use /tts to speak.")
+
     @discord.command(name="leave", description="Leaves whatever voice chat it's currently in.")
     async def cmd_leave(self, ctx: discord.ApplicationContext):
         """
@@ -227,9 +514,26 @@ class VCCog(commands.Cog):
         await self.try_leave_vc(ctx.guild_id, ctx)
 
     # EVENTS
+    async def read_auto_tts_message(self, message: discord.Message):
+        """
+        Feeds messages in a guild's auto-TTS channel to the coalescer, if the author is in the bot's VC.
+        Only registered (as an on_message listener) when auto-TTS is enabled.
+        """
+        # this runs for every message the bot can see, so the cheapest checks go first
+        if message.guild is None or message.author.bot:
+            return
+        guild_id = message.guild.id
+        if self.auto_tts_channels.get(guild_id) != message.channel.id or not message.content:
+            return
+
+        vc = self.shards.for_guild(guild_id).vc_state.get_vc_state(guild_id)
+        author_voice = getattr(message.author, "voice", None)
+        if vc is None or not vc.is_connected() or author_voice is None or author_voice.channel != vc.channel:
+            return
+
+        self.coalescer.add(guild_id, message.author.id, message.content)
+
 
-    # TODO: make it so when the bot leaves it clears the TTS queue and deletes all files for the server
-    # in order to do this we may need separate folders for each server within /downloads
     @discord.Cog.listener()
     async def on_voice_state_update(
         self,
@@ -238,9 +542,11 @@ class VCCog(commands.Cog):
         after: discord.VoiceState
     ):
         """
-        When the bot's voice state updates:
-            - if it left a VC, clear its VC state.
-            - if the VC is empty except for bots, leave.
+        When a voice state updates:
+            - if the bot left a VC, clear its VC state, queue and files.
+            - if the bot joined or moved, start counting the humans in its new channel.
+            - if a human joined or left the bot's channel, update the count, leaving once it's been
+            empty for a while.
 
         ## Args:
         - `member` (discord.Member): the member whose voice state updates
@@ -249,21 +555,25 @@ class VCCog(commands.Cog):
         """
         guild_id = member.guild.id
 
-        # check if the bot left the VC
         if member.id == self.bot.user.id:
+            vc_state = self.shards.for_guild(guild_id).vc_state
             if after.channel is None:
-                self.vc_state.set_vc_state(guild_id, None)
+                vc_state.set_vc_state(guild_id, None)
                 tsprint(f"Bot left VC {before.channel.name} in {guild_id}.")
-            return # no need to check for emptiness if bot left
-        
-        # check if the bot is in a VC in this guild, just to make sure
-        vc = self.vc_state.get_vc_state(guild_id)
-        if vc is None or not vc.is_connected():
+                # also covers being kicked or disconnected, not just /leave
+                await self.release_guild(guild_id)
+            elif before.channel != after.channel:
+                vc_state.track_occupancy(guild_id, after.channel, self.leave_if_empty)
             return
-        
-        # BUG: why doesn't this work properly? is it because we rely on self.vc_dict? is there a better way?
-        # if VC empty except for bots, leave
-        non_bot_members = [m for m in vc.channel.members if not m.bot]
-        if not non_bot_members:
-            tsprint(f"Nobody in VC {vc.channel.name} except bots. Leaving.")
-            await self.try_leave_vc(guild_id)
\ No newline at end of file
+
+        # other bots don't count as listeners
+        if member.bot:
+            return
+
+        # no member scan here: only the bot's channel's count changes, and only on joins/leaves/moves
+        self.shards.for_guild(guild_id).vc_state.update_occupancy(
+            guild_id,
+            before.channel.id if before.channel else None,
+            after.channel.id if after.channel else None,
+            self.leave_if_empty
+        )
@@ -49,8 +49,30 @@ def init_db() -> None:
                                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                                 user_id INTEGER NOT NULL,
                                 chosen_voice_id INTEGER 
+                            );
+
+                            CREATE TABLE IF NOT EXISTS queued_clips (
+                                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                guild_id INTEGER NOT NULL,
+                                channel_id INTEGER,
+                                voice TEXT NOT NULL,
+                                filename TEXT UNIQUE NOT NULL,
+                                author_id INTEGER,
+                                duration REAL NOT NULL,
+                                gain REAL NOT NULL
+                            );
+
+                            CREATE TABLE IF NOT EXISTS guild_settings (
+                                guild_id INTEGER PRIMARY KEY,
+                                auto_tts_channel_id INTEGER
                             )
                             """)
+
+        # columns added after guild_settings was first created, NULL means "use the bot's default"
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(guild_settings)")}
+        for column in ("user_per_min", "user_burst", "guild_per_min", "guild_burst"):
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE guild_settings ADD COLUMN {column} REAL")
     
 def init_server(guild_id: int) -> int:
     """
@@ -277,4 +299,120 @@ def get_user_voice(user_id: int) -> str | None:
 
         # voice could be None
         return voice[0] if voice else None
-                   
\ No newline at end of file
+                   
+
+def apply_queue_journal(inserts: list[tuple], deletes: list[str]) -> None:
+    """
+    Applies a batch of queue journal changes in one transaction
+
+    :param list[tuple] inserts: (guild_id, channel_id, voice, filename, author_id, duration, gain) rows for newly queued clips
+    :param list[str] deletes: filenames of clips that are done (played, failed or dropped)
+    """
+
+    with get_conn() as connection:
+        cursor = connection.cursor()
+
+        cursor.executemany("""
+                            INSERT OR REPLACE INTO queued_clips (guild_id, channel_id, voice, filename, author_id, duration, gain)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)
+                        """, inserts)
+        cursor.executemany("DELETE FROM queued_clips WHERE filename = ?", [(filename,) for filename in deletes])
+
+def get_queued_clips() -> list[tuple]:
+    """
+    Gets every clip still in the queue journal, oldest first
+
+    :return list[tuple]: (guild_id, channel_id, voice, filename, author_id, duration, gain) rows
+    """
+
+    with get_conn() as connection:
+        cursor = connection.cursor()
+
+        cursor.execute("""
+                        SELECT guild_id, channel_id, voice, filename, author_id, duration, gain
+                        FROM queued_clips
+                        ORDER BY id
+                    """)
+        return cursor.fetchall()
+
+def set_auto_tts_channel(guild_id: int, channel_id: int | None) -> None:
+    """
+    Binds (or unbinds) the text channel a guild's messages are automatically read from
+
+    :param int guild_id: the Discord guild ID
+    :param int | None channel_id: the text channel to read, None to turn auto-TTS off
+    """
+
+    with get_conn() as connection:
+        cursor = connection.cursor()
+
+        cursor.execute("INSERT OR IGNORE INTO guild_settings (guild_id) VALUES (?)", (guild_id,))
+        cursor.execute("""
+                        UPDATE guild_settings
+                        SET auto_tts_channel_id = ?
+                        WHERE guild_id = ?
+                    """, (channel_id, guild_id))
+
+def get_auto_tts_channels() -> dict[int, int]:
+    """
+    Gets every guild's auto-TTS channel
+
+    :return dict[int, int]: guild ID -> bound text channel ID, only for guilds with auto-TTS on
+    """
+
+    with get_conn() as connection:
+        cursor = connection.cursor()
+
+        cursor.execute("SELECT guild_id, auto_tts_channel_id FROM guild_settings WHERE auto_tts_channel_id IS NOT NULL")
+        return dict(cursor.fetchall())
+
+def set_guild_limits(
+    guild_id: int,
+    user_per_min: float | None,
+    user_burst: float | None,
+    guild_per_min: float | None,
+    guild_burst: float | None
+) -> None:
+    """
+    Sets some of a guild's /tts admission limits. None leaves that limit as it is (the bot's default, unless
+    the guild set it before), so only limits the guild actually chose are stored.
+
+    :param int guild_id: the Discord guild ID
+    :param float | None user_per_min: requests per minute each user may make
+    :param float | None user_burst: requests each user may make at once
+    :param float | None guild_per_min: requests per minute the whole guild may make
+    :param float | None guild_burst: requests the whole guild may make at once
+    """
+
+    with get_conn() as connection:
+        cursor = connection.cursor()
+
+        cursor.execute("INSERT OR IGNORE INTO guild_settings (guild_id) VALUES (?)", (guild_id,))
+        cursor.execute("""
+                        UPDATE guild_settings
+                        SET user_per_min = COALESCE(?, user_per_min),
+                            user_burst = COALESCE(?, user_burst),
+                            guild_per_min = COALESCE(?, guild_per_min),
+                            guild_burst = COALESCE(?, guild_burst)
+                        WHERE guild_id = ?
+                    """, (user_per_min, user_burst, guild_per_min, guild_burst, guild_id))
+
+def get_guild_limits(guild_id: int) -> tuple | None:
+    """
+    Gets a guild's /tts admission limits
+
+    :param int guild_id: the Discord guild ID
+
+    :return tuple | None: (user_per_min, user_burst, guild_per_min, guild_burst), each None if not set,
+    or None if the guild has no settings at all
+    """
+
+    with get_conn() as connection:
+        cursor = connection.cursor()
+
+        cursor.execute("""
+                        SELECT user_per_min, user_burst, guild_per_min, guild_burst
+                        FROM guild_settings
+                        WHERE guild_id = ?
+                    """, (guild_id,))
+        return cursor.fetchone()
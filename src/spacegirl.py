@@ -13,9 +13,12 @@ import importlib
 import discord # pycord
 
 # my modules
-from src.utils.logging_utils import timestamp_print as tsprint
+from src.utils.logging_utils import timestamp_print as tsprint, reset_log
+from src.utils.config import get_config
+from src.utils.loop_monitor import LoopLagMonitor
 from src.errors import *
 from src.db import driver as dbd # NOT DEAD BY DAYLIGHT
+from src.tts import driver as ttsd
 from src.views.views import *
 
 # get intents
@@ -23,10 +26,19 @@ intents = discord.Intents.default()
 intents.voice_states = True
 intents.members = True
 intents.guilds = True
+# privileged, only needed (and requested) when auto-TTS is enabled, since it reads messages in its bound channel
+intents.message_content = get_config("auto_tts").get("enabled", False)
 
+reset_log()
 tsprint("Starting Space Girl...")
 
-bot = discord.Bot(intents=intents)
+# sharded so the bot can grow past the single-shard guild limit, pycord picks the shard count
+# unless the "sharding" section of config/bot.json sets one
+sharding = get_config("sharding")
+bot = discord.AutoShardedBot(intents=intents, shard_count=sharding.get("shard_count"))
+
+# opt-in, see the "loop_monitor" section of config/bot.json
+loop_monitor = LoopLagMonitor.from_config()
 
 tsprint("Loading cogs...")
 for filename in os.listdir(os.path.join(os.path.dirname(__file__), "cogs")):
@@ -68,6 +80,9 @@ async def on_ready():
     
     tsprint("Loaded Opus successfully.")
 
+    if loop_monitor:
+        loop_monitor.start(bot.loop)
+
 @bot.event
 async def on_command_error(ctx: discord.ApplicationContext, error):
     """
@@ -88,4 +103,9 @@ if __name__ == "__main__":
 
     # run the bot with that token
     token = config.get("token")
-    bot.run(token)
\ No newline at end of file
+    try:
+        bot.run(token)
+    finally:
+        # the synthesis processes (multi-process mode) outlive the event loop otherwise
+        if ttsd.WORKER_POOL:
+            ttsd.WORKER_POOL.close()
\ No newline at end of file
@@ -0,0 +1,69 @@
+"""
+Admission control for TTS requests: per-user, per-guild and global token buckets, checked before any
+work is done. Guilds can set their own limits (stored in guild_settings); they're cached here, so
+checking a request costs no database query in the common case.
+"""
+
+# built-in
+from dataclasses import replace
+from typing import Optional
+
+# my modules
+from src.db import driver as dbd
+from src.utils.rate_limit import AdmissionControl, AdmissionLimits
+from src.utils.ttl_cache import TTLCache
+
+# shared by every shard
+ADMISSION = AdmissionControl.from_config()
+
+# guild_id -> AdmissionLimits, so the DB is only read once per guild every few minutes
+_LIMITS_CACHE = TTLCache(maxsize=4096, ttl=300)
+
+_LIMIT_FIELDS = ("user_per_min", "user_burst", "guild_per_min", "guild_burst")
+
+def guild_limits(guild_id: int) -> AdmissionLimits:
+    """
+    Gets a guild's limits, falling back to the bot's defaults for any it hasn't set
+
+    Args:
+        guild_id (int): the guild
+
+    Returns:
+        limits (AdmissionLimits): the guild's limits
+    """
+    limits = _LIMITS_CACHE.get(guild_id)
+    if limits is None:
+        row = dbd.get_guild_limits(guild_id)
+        overrides = {name: value for name, value in zip(_LIMIT_FIELDS, row or ()) if value is not None}
+        limits = replace(ADMISSION.defaults, **overrides)
+        _LIMITS_CACHE.put(guild_id, limits)
+    return limits
+
+def set_guild_limits(guild_id: int, **changes: float) -> AdmissionLimits:
+    """
+    Saves the limits a guild changed, taking effect immediately. Only those are stored, the rest keep
+    following the bot's defaults (unless the guild set them before).
+
+    Args:
+        guild_id (int): the guild
+        **changes (float): the new values, by AdmissionLimits field name
+
+    Returns:
+        limits (AdmissionLimits): the guild's limits now
+    """
+    dbd.set_guild_limits(guild_id, *(changes.get(name) for name in _LIMIT_FIELDS))
+    _LIMITS_CACHE.pop(guild_id)
+    return guild_limits(guild_id)
+
+def admit(guild_id: int, user_id: int) -> Optional[str]:
+    """
+    Checks (and counts) a TTS request against the user's, the guild's and the global limits
+
+    Args:
+        guild_id (int): the guild the request is in
+        user_id (int): who made it
+
+    Returns:
+        rejected_by (Optional[str]): None if admitted, otherwise "user", "guild" or "global"
+    """
+    return ADMISSION.admit(guild_id, user_id, guild_limits(guild_id))
@@ -0,0 +1,98 @@
+"""
+The interface every TTS backend implements
+"""
+
+# built-in
+from abc import ABC, abstractmethod
+import asyncio
+import time
+
+# my modules
+from src.tts.returncodes import TTSReturnCode as TRC
+from src.utils import metrics
+from src.utils.tracing import Trace
+
+class TTSBackend(ABC):
+    """
+    A source of synthesized speech. Subclasses set `name`, `max_chunk_length` and
+    `file_extension`, list their `voices`, and implement `_synthesize`.
+    """
+
+    name: str = ""
+    max_chunk_length: int = 300 # longest chunk of text one synthesize call accepts
+    file_extension: str = "mp3" # what format the synthesized bytes are in
+
+    def __init__(self, max_concurrency: int):
+        """
+        :param max_concurrency: how many synthesize calls may run at once
+        :type max_concurrency: int
+        """
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def set_max_concurrency(self, max_concurrency: int):
+        """
+        Changes the concurrency limit. Only call it before any synthesis has started.
+
+        :param max_concurrency: how many synthesize calls may run at once
+        :type max_concurrency: int
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    @property
+    @abstractmethod
+    def voices(self) -> list[str]:
+        "The display names of every voice this backend provides"
+
+    @property
+    def latency_metric(self) -> str:
+        "The histogram successful synthesis latencies (ms) are recorded in"
+        return f"tts.backend.{self.name}.latency_ms"
+
+    def is_available(self) -> bool:
+        """
+        Whether the backend is worth calling right now (e.g. False while its circuit breaker is open)
+
+        :return: True if calls should be made
+        :rtype: bool
+        """
+        return True
+
+    def find_unsupported_script(self, text: str) -> str | None:
+        """
+        Cheap local check for text the backend is known not to handle, so it's never sent
+
+        :param text: the text to check
+        :type text: str
+        :return: a description of the unsupported script, or None if the text looks fine
+        :rtype: str | None
+        """
+        return None
+
+    async def synthesize(self, text: str, voice: str, trace: Trace, index: int = 0) -> tuple[TRC, bytes | None]:
+        """
+        Synthesizes one chunk of text, respecting the backend's concurrency limit
+
+        :param text: the text to speak, at most `max_chunk_length` long
+        :type text: str
+        :param voice: the display name of the voice to use
+        :type voice: str
+        :param trace: the trace to record spans on
+        :type trace: Trace
+        :param index: the chunk index, for the spans
+        :type index: int
+        :return: the return code, and the audio bytes if successful
+        :rtype: tuple[TRC, bytes | None]
+        """
+        async with self._semaphore:
+            start = time.perf_counter()
+            return_code, audio = await self._synthesize(text, voice, trace, index)
+
+        if return_code == TRC.OKAY:
+            metrics.observe(self.latency_metric, (time.perf_counter() - start) * 1000)
+        return return_code, audio
+
+    @abstractmethod
+    async def _synthesize(self, text: str, voice: str, trace: Trace, index: int) -> tuple[TRC, bytes | None]:
+        "Does the actual synthesis, see `synthesize`"
@@ -0,0 +1,152 @@
+"""
+Hedged requests and failover across backends.
+Wraps a primary backend with alternates (mirrors of it): if the primary hasn't answered within a
+percentile of its recent latency, the request is also sent to an alternate and the first successful
+response wins. While the primary's circuit is open, requests go straight to an alternate, or to a
+failover-only backend (e.g. the offline tone backend), which is never raced against a healthy primary.
+"""
+
+# built-in
+import asyncio
+import time
+
+# my modules
+from src.tts.backends.base import TTSBackend
+from src.tts.returncodes import TTSReturnCode as TRC
+from src.utils import metrics
+from src.utils.tracing import Trace
+
+# failures another backend might not have, everything else (e.g. an unsupported language) is final
+TRANSIENT_CODES = (TRC.TEMP_UNAVAILABLE, TRC.RATE_LIMITED)
+
+class HedgedBackend(TTSBackend):
+    """
+    Looks like the primary backend (same name and voices), but hedges and fails over to alternates.
+    """
+
+    def __init__(
+        self,
+        primary: TTSBackend,
+        alternates: list[TTSBackend],
+        percentile: float = 95,
+        min_delay: float = 0.25,
+        max_delay: float = 3.0,
+        failovers: list[TTSBackend] | None = None
+    ):
+        """
+        :param primary: the backend normally used
+        :param alternates: backends to hedge/fail over to, in order of preference
+        :param percentile: the primary latency percentile to wait for before hedging
+        :param min_delay: never hedge sooner than this (seconds)
+        :param max_delay: always hedge after this (seconds), also used before there's latency data
+        :param failovers: backends only used while the primary is down (after the alternates), never hedged to
+        """
+        super().__init__(primary.max_concurrency)
+        self.primary = primary
+        self.alternates = alternates
+        self.failovers = failovers or []
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+
+        # same name, so caches and coalescing treat hedged and unhedged requests alike
+        self.name = primary.name
+        # chunks have to fit every backend they might be sent to
+        self.max_chunk_length = min(backend.max_chunk_length for backend in [primary] + alternates + self.failovers)
+        # ffmpeg probes the content, so a failover clip in another format still plays
+        self.file_extension = primary.file_extension
+
+    @property
+    def voices(self) -> list[str]:
+        return self.primary.voices
+
+    def is_available(self) -> bool:
+        return any(backend.is_available() for backend in [self.primary] + self.alternates + self.failovers)
+
+    def find_unsupported_script(self, text: str) -> str | None:
+        return self.primary.find_unsupported_script(text)
+
+    def hedge_delay(self) -> float:
+        """
+        How long to wait for the primary before hedging
+
+        :return: the delay in seconds
+        :rtype: float
+        """
+        latency_ms = metrics.percentile(self.primary.latency_metric, self.percentile)
+        if latency_ms is None:
+            return self.max_delay
+        return min(self.max_delay, max(self.min_delay, latency_ms / 1000))
+
+    def _alternate_voice(self, alternate: TTSBackend, voice: str) -> str:
+        "Mirrors have the same voice, other backends fall back to their first voice"
+        return voice if voice in alternate.voices else alternate.voices[0]
+
+    async def synthesize(self, text: str, voice: str, trace: Trace, index: int = 0) -> tuple[TRC, bytes | None]:
+        # the wrapped backends enforce their own concurrency limits
+        return await self._synthesize(text, voice, trace, index)
+
+    async def _synthesize(self, text: str, voice: str, trace: Trace, index: int) -> tuple[TRC, bytes | None]:
+        alternates = [backend for backend in self.alternates if backend.is_available()]
+
+        # primary's circuit is open: fail over without waiting
+        if not self.primary.is_available():
+            failovers = alternates + [backend for backend in self.failovers if backend.is_available()]
+            if not failovers:
+                return TRC.TEMP_UNAVAILABLE, None
+
+            alternate = failovers[0]
+            metrics.inc("tts.hedge.failover")
+            with trace.span("synthesize.failover", chunk=index, backend=alternate.name):
+                return await alternate.synthesize(text, self._alternate_voice(alternate, voice), trace, index)
+
+        start = time.perf_counter()
+        primary_task = asyncio.create_task(self.primary.synthesize(text, voice, trace, index))
+        tasks = [primary_task]
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=self.hedge_delay())
+            if done or not alternates:
+                return await primary_task
+
+            alternate = alternates[0]
+            metrics.inc("tts.hedge.fired")
+            trace.start_span("synthesize.hedge", chunk=index, backend=alternate.name).finish()
+            hedge_task = asyncio.create_task(
+                alternate.synthesize(text, self._alternate_voice(alternate, voice), trace, index)
+            )
+            tasks.append(hedge_task)
+
+            pending = {primary_task, hedge_task}
+            fallback = None # the primary's failure, if both fail
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+
+                    return_code, audio = task.result()
+                    if return_code == TRC.OKAY:
+                        metrics.inc("tts.hedge.won." + ("primary" if task is primary_task else "alternate"))
+                        return return_code, audio
+                    if task is primary_task and return_code not in TRANSIENT_CODES:
+                        # the mirror would reject the same text, don't wait for it
+                        return return_code, audio
+
+                    if task is primary_task or fallback is None:
+                        fallback = (return_code, audio)
+
+            if fallback is not None:
+                return fallback
+            raise error
+        finally:
+            # a primary that lost the race never records its latency, but it took at least this long.
+            # without it the slow tail disappears from the histogram and the hedge delay keeps shrinking
+            if len(tasks) > 1 and not primary_task.done():
+                metrics.observe(self.primary.latency_metric, (time.perf_counter() - start) * 1000)
+
+            # first response wins, the loser is cancelled (aborting its HTTP request)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
@@ -0,0 +1,72 @@
+"""
+TikTok voices, synthesized through lazypyro
+"""
+
+# built-in
+import unicodedata
+
+# my modules
+from src.tts.backends.base import TTSBackend
+from src.tts.client import LazypyroClient
+from src.tts.returncodes import TTSReturnCode as TRC
+from src.tts.voices import TikTokVoice as TTV
+from src.utils.tracing import Trace
+
+# unicode name prefixes of scripts the (English) TikTok voices can't speak
+TIKTOK_UNSUPPORTED_SCRIPTS = (
+    "CJK", "HIRAGANA", "KATAKANA", "HANGUL", "CYRILLIC", "ARABIC", "HEBREW", "DEVANAGARI",
+    "BENGALI", "TAMIL", "TELUGU", "THAI", "GEORGIAN", "ARMENIAN", "ETHIOPIC"
+)
+
+class TikTokBackend(TTSBackend):
+    name = "TikTok"
+    max_chunk_length = 300 # TikTok voices limit us here
+    file_extension = "mp3"
+
+    def __init__(self, client: LazypyroClient, max_concurrency: int = 8, label: str | None = None):
+        """
+        :param client: the lazypyro client to synthesize through
+        :type client: LazypyroClient
+        :param max_concurrency: how many chunks may be synthesized at once
+        :type max_concurrency: int
+        :param label: tells a mirror's metrics apart from the main backend's, e.g. "mirror.example.com"
+        :type label: str | None
+        """
+        super().__init__(max_concurrency)
+        self.client = client
+        self.label = label
+
+    @property
+    def latency_metric(self) -> str:
+        # mirrors share the name (so caches treat them alike), but not the latency histogram hedging is based on
+        if self.label:
+            return f"tts.backend.{self.name}.{self.label}.latency_ms"
+        return super().latency_metric
+
+    @property
+    def voices(self) -> list[str]:
+        return [voice.replace("_", " ") for voice in TTV._member_names_]
+
+    def is_available(self) -> bool:
+        return not self.client.breaker.is_open
+
+    def find_unsupported_script(self, text: str) -> str | None:
+        # the overwhelmingly common case
+        if text.isascii():
+            return None
+
+        for char in set(text):
+            if char.isascii() or not char.isalpha():
+                continue
+
+            name = unicodedata.name(char, "")
+            for script in TIKTOK_UNSUPPORTED_SCRIPTS:
+                if name.startswith(script):
+                    return script
+
+        return None
+
+    async def _synthesize(self, text: str, voice: str, trace: Trace, index: int) -> tuple[TRC, bytes | None]:
+        # internal voice names are goofy, translate them
+        tiktok_voice = TTV[voice.replace(" ", "_")]
+        return await self.client.synthesize(self.name, tiktok_voice.value, text, trace, index)
@@ -0,0 +1,115 @@
+"""
+Offline backend that "speaks" deterministic tones: one beep per word, pitched by the word.
+Needs no network, so benchmarks, load tests and degraded operation can run without lazypyro.
+"""
+
+# built-in
+import asyncio
+import io
+import math
+import wave
+import zlib
+
+# my modules
+from src.tts.backends.base import TTSBackend
+from src.tts.returncodes import TTSReturnCode as TRC
+from src.utils.tracing import Trace
+
+SAMPLE_RATE = 24000 # roughly what TikTok voices come back as
+SECONDS_PER_CHAR = 0.06 # rough speaking rate
+WORD_GAP_SECONDS = 0.08
+
+# voice name -> base pitch in Hz
+TONE_VOICES = {
+    "Tone Low": 180.0,
+    "Tone High": 360.0
+}
+
+def tone_pcm(seconds: float, frequency: float, amplitude: int = 8000) -> bytes:
+    """
+    Generates mono 16-bit PCM of a sine tone
+
+    :param seconds: how long the tone is
+    :type seconds: float
+    :param frequency: the tone's pitch in Hz
+    :type frequency: float
+    :param amplitude: peak sample value
+    :type amplitude: int
+    :return: the raw PCM
+    :rtype: bytes
+    """
+    frames = int(SAMPLE_RATE * seconds)
+    # one period, repeated
+    period = max(1, int(SAMPLE_RATE / frequency))
+    cycle = b"".join(
+        int(amplitude * math.sin(2 * math.pi * i / period)).to_bytes(2, "little", signed=True) for i in range(period)
+    )
+    return (cycle * (frames // period + 1))[:frames * 2]
+
+def to_wav(pcm: bytes) -> bytes:
+    """
+    Wraps mono 16-bit PCM in a WAV container, which ffmpeg decodes like any other clip
+
+    :param pcm: the raw PCM at SAMPLE_RATE
+    :type pcm: bytes
+    :return: the WAV file contents
+    :rtype: bytes
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+def make_tone(seconds: float, frequency: float = 440.0) -> bytes:
+    """
+    Generates a WAV file of a single tone
+
+    :param seconds: how long the tone is
+    :type seconds: float
+    :param frequency: the tone's pitch in Hz
+    :type frequency: float
+    :return: the WAV file contents
+    :rtype: bytes
+    """
+    return to_wav(tone_pcm(seconds, frequency))
+
+def speak_tones(text: str, base_frequency: float) -> bytes:
+    """
+    "Speaks" text as one tone per word, the same text always giving the same audio
+
+    :param text: the text to speak
+    :type text: str
+    :param base_frequency: the voice's base pitch in Hz
+    :type base_frequency: float
+    :return: the WAV file contents
+    :rtype: bytes
+    """
+    gap = tone_pcm(WORD_GAP_SECONDS, base_frequency, amplitude=0)
+    parts = []
+    for word in text.split():
+        # stable across runs, unlike hash()
+        frequency = base_frequency * (1 + (zlib.crc32(word.encode("utf-8")) % 12) / 12)
+        parts.append(tone_pcm(max(0.05, len(word) * SECONDS_PER_CHAR), frequency))
+        parts.append(gap)
+
+    return to_wav(b"".join(parts) or gap)
+
+class ToneBackend(TTSBackend):
+    name = "Tone"
+    max_chunk_length = 2000 # no upstream limit, keep chunks similar in size to a message
+    file_extension = "wav"
+
+    def __init__(self, max_concurrency: int = 4):
+        super().__init__(max_concurrency)
+
+    @property
+    def voices(self) -> list[str]:
+        return list(TONE_VOICES)
+
+    async def _synthesize(self, text: str, voice: str, trace: Trace, index: int) -> tuple[TRC, bytes | None]:
+        with trace.span("synthesize.tone", chunk=index):
+            audio = await asyncio.to_thread(speak_tones, text, TONE_VOICES[voice])
+        return TRC.OKAY, audio
@@ -0,0 +1,258 @@
+"""
+The lazypyro HTTP client: every upstream TTS call goes through here.
+Adds a request timeout, a global token bucket, bounded retries with jittered backoff for
+transient failures, and a circuit breaker that fails fast during an outage.
+Every attempt passes through the client's gate (the bucket and the breaker); in multi-process mode the
+worker processes' clients use a gate that asks the gateway's, so the limits stay global.
+"""
+
+# built-in
+import asyncio
+import random
+
+# PyPI
+import aiohttp
+
+# my modules
+from src.tts.returncodes import TTSReturnCode as TRC
+from src.utils import metrics
+from src.utils.circuit_breaker import CircuitBreaker
+from src.utils.config import get_config
+from src.utils.logging_utils import timestamp_print as tsprint
+from src.utils.rate_limit import TokenBucket
+from src.utils.tracing import Trace
+
+DEFAULT_ORIGIN = "https://lazypy.ro"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+class TransientError(Exception):
+    "A failure that's worth retrying (timeouts, connection errors, 5xx, temporary unavailability)"
+
+class UpstreamGate():
+    """
+    What every upstream attempt has to get past: the circuit breaker, then the token bucket.
+    Each attempt that's let through must be settled with `record_success`, `record_failure` or `cancel_trial`.
+    """
+
+    def __init__(self, bucket: TokenBucket, breaker: CircuitBreaker, max_queue_wait: float = 5.0):
+        """
+        :param bucket: the rate limit
+        :param breaker: the circuit breaker
+        :param max_queue_wait: longest an attempt waits for a token before being rejected
+        """
+        self.bucket = bucket
+        self.breaker = breaker
+        self.max_queue_wait = max_queue_wait
+
+    async def acquire(self) -> TRC | None:
+        """
+        Lets one attempt through, or says why not
+
+        :return: None if the attempt may be made, otherwise the return code to give up with
+        :rtype: TRC | None
+        """
+        # fail fast while upstream is known to be down
+        if not self.breaker.allow():
+            metrics.inc("lazypyro.breaker_rejected")
+            return TRC.TEMP_UNAVAILABLE
+
+        try:
+            acquired = await self.bucket.acquire(self.max_queue_wait)
+        except asyncio.CancelledError:
+            self.breaker.cancel_trial()
+            raise
+        if not acquired:
+            # we didn't actually call upstream, so give back the breaker trial (if any)
+            self.breaker.cancel_trial()
+            metrics.inc("lazypyro.rate_limited")
+            return TRC.RATE_LIMITED
+        return None
+
+    def record_success(self):
+        "Settles an attempt upstream answered properly"
+        self.breaker.record_success()
+
+    def record_failure(self):
+        "Settles an attempt that failed transiently"
+        self.breaker.record_failure()
+
+    def cancel_trial(self):
+        "Settles an attempt that ended up not reaching upstream (or was cancelled)"
+        self.breaker.cancel_trial()
+
+class LazypyroClient():
+    """
+    Talks to lazypyro. Use `synthesize` to get audio bytes and a correctly classified return code.
+    """
+
+    def __init__(
+        self,
+        origin: str = DEFAULT_ORIGIN,
+        rate: float = 5.0,
+        burst: float = 10.0,
+        max_queue_wait: float = 5.0,
+        timeout: float = 10.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.25,
+        backoff_cap: float = 2.0,
+        breaker: CircuitBreaker | None = None
+    ):
+        """
+        :param origin: the lazypyro origin, overridable to point at a stub server
+        :param rate: requests per second allowed by the global token bucket
+        :param burst: token bucket capacity
+        :param max_queue_wait: longest a request waits for a token before being rejected
+        :param timeout: total seconds allowed per HTTP attempt
+        :param max_retries: retries (after the first attempt) for transient failures
+        :param backoff_base: first backoff ceiling in seconds, doubled per retry
+        :param backoff_cap: max backoff ceiling in seconds
+        :param breaker: the circuit breaker to use, a default one if not given
+        """
+        self.origin = origin
+        self.gate = UpstreamGate(TokenBucket(rate, burst), breaker or CircuitBreaker(), max_queue_wait)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self._session: aiohttp.ClientSession | None = None
+
+    @classmethod
+    def from_config(cls, origin: str | None = None) -> "LazypyroClient":
+        """
+        Builds a client from the "lazypyro" config section (every key optional)
+
+        :param origin: overrides the configured origin (e.g. for a mirror)
+        :return: the client
+        :rtype: LazypyroClient
+        """
+        config = get_config("lazypyro")
+        return cls(
+            origin=origin or config.get("origin", DEFAULT_ORIGIN),
+            rate=config.get("rate_per_sec", 5.0),
+            burst=config.get("burst", 10.0),
+            max_queue_wait=config.get("max_queue_wait", 5.0),
+            timeout=config.get("timeout", 10.0),
+            max_retries=config.get("max_retries", 2),
+            breaker=CircuitBreaker(
+                failure_threshold=config.get("breaker_failures", 5),
+                reset_timeout=config.get("breaker_reset", 30.0)
+            )
+        )
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        "The circuit breaker of this process's gate"
+        return self.gate.breaker
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        "The shared HTTP session, created on first use (must be inside the event loop)"
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        return self._session
+
+    async def close(self):
+        "Closes the HTTP session"
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    def _backoff(self, attempt: int) -> float:
+        "Full-jitter exponential backoff for the given retry number (0-based)"
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    async def synthesize(self, service: str, voice: str, text: str, trace: Trace, index: int = 0) -> tuple[TRC, bytes | None]:
+        """
+        Requests TTS from lazypyro and downloads the resulting audio
+
+        :param service: the lazypyro service, e.g. "TikTok"
+        :param voice: the service's internal voice name
+        :param text: the (already adjusted and chunked) text to speak
+        :param trace: the trace to record attempt spans on
+        :param index: the chunk index, for the spans
+        :return: the return code, and the audio bytes if successful
+        :rtype: tuple[TRC, bytes | None]
+        """
+        for attempt in range(self.max_retries + 1):
+            rejected = await self.gate.acquire()
+            if rejected is not None:
+                return rejected, None
+
+            try:
+                return_code, audio = await self._attempt(service, voice, text, trace, index, attempt)
+            except asyncio.CancelledError:
+                self.gate.cancel_trial()
+                raise
+            except TransientError as e:
+                self.gate.record_failure()
+                metrics.inc("lazypyro.transient_failures")
+                tsprint(f"lazypyro attempt {attempt + 1} failed: {e}")
+
+                if attempt == self.max_retries:
+                    return TRC.TEMP_UNAVAILABLE, None
+
+                metrics.inc("lazypyro.retries")
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            except Exception:
+                # a bug, but the attempt still has to be settled or a breaker trial would never end
+                self.gate.record_failure()
+                raise
+
+            # lazypyro answered properly (even if it rejected the input), so it's healthy
+            self.gate.record_success()
+            return return_code, audio
+
+        return TRC.TEMP_UNAVAILABLE, None
+
+    async def _attempt(self, service: str, voice: str, text: str, trace: Trace, index: int, attempt: int) -> tuple[TRC, bytes | None]:
+        """
+        Makes one request + download attempt
+
+        :raises TransientError: if the failure is worth retrying
+        :return: the return code, and the audio bytes if successful
+        :rtype: tuple[TRC, bytes | None]
+        """
+        url = f"{self.origin}/tts/request_tts.php"
+        headers = {
+            "content-type": "application/x-www-form-urlencoded",
+            "origin": self.origin,
+            "referer": url,
+            "user-agent": USER_AGENT
+        }
+        data = {
+            "service": service,
+            "voice": voice,
+            "text": text
+        }
+
+        try:
+            with trace.span("synthesize.request", chunk=index, attempt=attempt):
+                async with self.session.post(url, headers=headers, data=data) as response:
+                    if response.status >= 500 or response.status == 429:
+                        raise TransientError(f"HTTP {response.status} from request_tts.php")
+                    response = await response.json(content_type=None) # get response json
+
+            if not response["success"]:
+                error_msg = response.get("error_msg", "")
+                tsprint(f"Could not get TTS from lazypyro. {error_msg}")
+
+                if "supported for this language" in error_msg:
+                    return TRC.LANGUAGE_UNSUPPORTED, None
+                elif "generation is temporarily unavailable" in error_msg:
+                    raise TransientError(error_msg)
+                
+                return TRC.GENERIC_ERROR, None
+
+            with trace.span("synthesize.download", chunk=index, attempt=attempt) as span:
+                async with self.session.get(response["audio_url"]) as audio_response:
+                    if audio_response.status != 200:
+                        raise TransientError(f"HTTP {audio_response.status} from audio URL")
+                    audio = await audio_response.read()
+                span.attrs["bytes"] = len(audio)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError, TypeError, AttributeError) as e:
+            # connection problems, timeouts and garbled responses (TypeError/AttributeError: JSON that
+            # isn't an object, e.g. null or a list)
+            raise TransientError(repr(e)) from e
+
+        return TRC.OKAY, audio
@@ -0,0 +1,159 @@
+"""
+Message coalescing for auto-TTS: a burst of messages from one user becomes one synthesis request
+(one upstream call, one clip boundary) instead of one per message, and lines the guild has just
+heard are collapsed instead of being spoken again.
+"""
+
+# built-in
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import time
+
+# my modules
+from src.utils import metrics
+from src.utils.config import get_config
+
+# sentence endings that already give a pause between coalesced lines
+_TERMINATORS = ".!?…"
+
+@dataclass
+class _Pending():
+    lines: list[str] = field(default_factory=list)
+    chars: int = 0
+    messages: int = 0
+    first_at: float = field(default_factory=time.monotonic)
+    timer: Optional[asyncio.TimerHandle] = None
+
+class MessageCoalescer():
+    """
+    Buffers each user's messages per guild, flushing them as one text once the user pauses for
+    `window` seconds (or after `max_wait` seconds, or `max_chars` characters, whichever comes first)
+    """
+
+    def __init__(
+        self,
+        on_flush: Callable[[int, int, str, int], Awaitable[None]],
+        window: float = 1.5,
+        max_wait: float = 5.0,
+        max_chars: int = 600,
+        duplicate_window: float = 10.0
+    ):
+        """
+        Args:
+            on_flush (Callable[[int, int, str, int], Awaitable[None]]): called with the guild ID, author ID,
+            the coalesced text and how many messages went into it
+            window (float): seconds of quiet from a user before their messages are flushed
+            max_wait (float): most seconds a message is held back, however chatty its author is
+            max_chars (int): flush as soon as a user's buffer reaches this many characters
+            duplicate_window (float): seconds during which a line the guild already heard is collapsed
+        """
+        self.on_flush = on_flush
+        self.window = window
+        self.max_wait = max_wait
+        self.max_chars = max_chars
+        self.duplicate_window = duplicate_window
+
+        self._pending: Dict[tuple[int, int], _Pending] = dict()
+        # guild_id -> normalized line -> time.monotonic() it stops counting as a duplicate
+        self._recent: Dict[int, Dict[str, float]] = dict()
+
+    @classmethod
+    def from_config(cls, on_flush: Callable[[int, int, str, int], Awaitable[None]]) -> "MessageCoalescer":
+        """
+        Builds a coalescer from the "auto_tts" config section
+
+        Args:
+            on_flush (Callable[[int, int, str, int], Awaitable[None]]): see `__init__`
+
+        Returns:
+            coalescer (MessageCoalescer): the coalescer
+        """
+        config = get_config("auto_tts")
+        return cls(
+            on_flush,
+            window=config.get("window_ms", 1500) / 1000,
+            max_wait=config.get("max_wait_ms", 5000) / 1000,
+            max_chars=config.get("max_chars", 600),
+            duplicate_window=config.get("duplicate_window_s", 10)
+        )
+
+    def _is_duplicate(self, guild_id: int, line: str) -> bool:
+        now = time.monotonic()
+        recent = self._recent.setdefault(guild_id, dict())
+        for seen in [seen for seen, expires in recent.items() if expires <= now]:
+            del recent[seen]
+
+        key = " ".join(line.casefold().split())
+        if key in recent:
+            return True
+        recent[key] = now + self.duplicate_window
+        return False
+
+    def add(self, guild_id: int, author_id: int, text: str) -> bool:
+        """
+        Buffers a message
+
+        Args:
+            guild_id (int): the guild it was sent in
+            author_id (int): who sent it
+            text (str): what it says
+
+        Returns:
+            buffered (bool): False if it was collapsed as a duplicate (or empty)
+        """
+        line = text.strip()
+        if not line:
+            return False
+        metrics.inc("auto_tts.messages")
+        if self._is_duplicate(guild_id, line):
+            metrics.inc("auto_tts.collapsed")
+            return False
+
+        key = (guild_id, author_id)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _Pending()
+        else:
+            metrics.inc("auto_tts.coalesced")
+            pending.timer.cancel()
+
+        pending.lines.append(line)
+        pending.chars += len(line)
+        pending.messages += 1
+
+        if pending.chars >= self.max_chars:
+            self._flush(key)
+            return True
+
+        # wait for a pause, but never hold the first message longer than max_wait
+        delay = min(self.window, pending.first_at + self.max_wait - time.monotonic())
+        pending.timer = asyncio.get_running_loop().call_later(max(0.0, delay), self._flush, key)
+        return True
+
+    def _flush(self, key: tuple[int, int]):
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        if pending.timer:
+            pending.timer.cancel()
+
+        text = " ".join(
+            line if line[-1] in _TERMINATORS else f"{line}."
+            for line in pending.lines
+        ) if len(pending.lines) > 1 else pending.lines[0]
+        metrics.inc("auto_tts.requests")
+        asyncio.create_task(self.on_flush(key[0], key[1], text, pending.messages))
+
+    def drop_guild(self, guild_id: int):
+        """
+        Discards everything buffered in a guild (e.g. after leaving VC or turning auto-TTS off)
+
+        Args:
+            guild_id (int): the guild
+        """
+        for key in [key for key in self._pending if key[0] == guild_id]:
+            pending = self._pending.pop(key)
+            if pending.timer:
+                pending.timer.cancel()
+        self._recent.pop(guild_id, None)
@@ -5,45 +5,107 @@ the module that handles tts interactions
 # built-in modules
 import os
 import re
+import shutil
+import uuid
 from collections import deque
-import requests
+from typing import Callable
 import json
 from pathlib import Path
-import aiohttp, asyncio
+from urllib.parse import urlparse
+import asyncio
 
 # PyPI modules
 import emoji
 
 # my modules
 from src.utils.logging_utils import timestamp_print as tsprint
-from src.tts.voices import TikTokVoice as TTV
 from src.tts.returncodes import TTSReturnCode as TRC
+from src.tts.queue_item import QueueItem
+from src.tts.client import LazypyroClient
+from src.tts.backends.base import TTSBackend
+from src.tts.backends.hedged import HedgedBackend
+from src.tts.backends.tiktok import TikTokBackend
+from src.tts.backends.tone import ToneBackend
+from src.audio import loudness, transcode
+from src.tts import storage
+from src.tts.worker_pool import WorkerPool
+from src.utils.tracing import Trace
+from src.utils.single_flight import SingleFlight
+from src.utils.ttl_cache import TTLCache
+from src.utils.config import get_config
+from src.utils import metrics
+
+MAX_CHUNK_LENGTH = 300 # default for smart_chunk, each backend has its own limit
+TIKTOK_MAX_REPEAT = 4
 
-DOWNLOADS_DIR = os.path.join(os.getcwd(), "downloads")
-os.makedirs(DOWNLOADS_DIR, exist_ok=True)
+# every lazypyro call goes through the TikTok backend's client (rate limit, retries, circuit breaker)
+TIKTOK_BACKEND = TikTokBackend(
+    LazypyroClient.from_config(),
+    max_concurrency=get_config("lazypyro").get("max_concurrency", 8)
+)
+# lazypyro mirror origin -> its backend, hedged/failed over to (see the "hedging" config section).
+# each mirror has its own client (rate limit, breaker), shared by every shard
+MIRROR_BACKENDS: dict[str, TikTokBackend] = dict()
 
-MAX_CHUNK_LENGTH = 300 # TikTok voices limit us here. TODO: dynamic length for different services?
-TIKTOK_MAX_REPEAT = 4
-TIKTOK_VOICES = [voice.replace("_", " ") for voice in TTV._member_names_]
+def get_mirror_backend(origin: str) -> TikTokBackend:
+    """
+    Gets the backend for a lazypyro mirror, creating it (with the "lazypyro" config limits) on first use
+
+    :param origin: the mirror's origin
+    :type origin: str
+    :return: the mirror's backend
+    :rtype: TikTokBackend
+    """
+    backend = MIRROR_BACKENDS.get(origin)
+    if backend is None:
+        backend = MIRROR_BACKENDS[origin] = TikTokBackend(
+            LazypyroClient.from_config(origin),
+            max_concurrency=get_config("lazypyro").get("max_concurrency", 8),
+            label=f"mirror.{urlparse(origin).netloc}"
+        )
+    return backend
+
+for origin in get_config("hedging").get("mirrors", []):
+    get_mirror_backend(origin)
+
+# offline, always available (benchmarks, load tests, degraded operation)
+TONE_BACKEND = ToneBackend()
+BACKENDS: list[TTSBackend] = [TIKTOK_BACKEND, TONE_BACKEND]
+
+# voice display name -> the backend providing it
+VOICE_BACKENDS: dict[str, TTSBackend] = {voice: backend for backend in BACKENDS for voice in backend.voices}
+
+TIKTOK_VOICES = TIKTOK_BACKEND.voices
 TTS_VOICES = TIKTOK_VOICES + [] # you can add more :3
+# the tone voices are only offered to users if enabled
+if get_config("tone_backend").get("enabled", False):
+    TTS_VOICES += TONE_BACKEND.voices
+
+# identical chunks being synthesized at the same time share one upstream request
+SYNTHESIS_FLIGHTS = SingleFlight()
+
+# synthesis runs in worker processes when multi-process mode is enabled, in this process otherwise
+WORKER_POOL = WorkerPool.from_config(TIKTOK_BACKEND.client.gate)
+
+# (backend, voice, chunk) -> return code, for inputs the backend rejected recently
+NEGATIVE_CACHE = TTLCache(
+    maxsize=get_config("negative_cache").get("maxsize", 4096),
+    ttl=get_config("negative_cache").get("ttl", 6 * 60 * 60)
+)
 
 EMOJI_DICT = Path(f"{os.getcwd()}/emoji.json") # read in emoji.json
 EMOJI_DICT = EMOJI_DICT.read_text(encoding="utf-8") # read text from emoji.json
 EMOJI_DICT: dict = json.loads(EMOJI_DICT) # load into a dict
 
-def adjust_pronunciation(text: str, voice: str) -> str:
+def replace_emoji(text: str) -> str:
     """
-    Makes various adjustments to input text to make tts sound and function better
+    Replaces unicode emoji with their names, so they can be spoken
 
-    :param text: the text to adjust
+    :param text: the text to replace emoji in
     :type text: str
-    :param voice: the voice to adjust pronunciation for
-    :type voice: str
-    :return: the adjusted input
+    :return: the text with each emoji replaced by its name
     :rtype: str
     """
-
-    # ----- HANDLE UNICODE EMOJI -----
     # remove emoji variation selectors first
     text = re.sub(r"[\uFE0F\uFE0E]", "", text)
 
@@ -57,7 +119,24 @@ def adjust_pronunciation(text: str, voice: str) -> str:
         return f" {name} "
 
     # replaces each emoji with its name surrounded by colons and whitespace
-    text = emoji.replace_emoji(text, replace=replace_match)
+    return emoji.replace_emoji(text, replace=replace_match)
+
+def adjust_pronunciation(text: str, voice: str, pronunciations: dict[str, str] | None = None) -> str:
+    """
+    Makes various adjustments to input text to make tts sound and function better
+
+    :param text: the text to adjust
+    :type text: str
+    :param voice: the voice to adjust pronunciation for
+    :type voice: str
+    :param pronunciations: extra text -> pronunciation overrides (e.g. from the database), matched as whole words
+    :type pronunciations: dict[str, str] | None
+    :return: the adjusted input
+    :rtype: str
+    """
+
+    # ----- HANDLE UNICODE EMOJI -----
+    text = replace_emoji(text)
     # --------------------------------
 
     # max 1 space between words, and no whitespace on ends
@@ -178,6 +257,10 @@ def adjust_pronunciation(text: str, voice: str) -> str:
         # if the whole input is "no", add a period so voice doesn't say "number"
         if text.lower() == "no":
             text = "no."
+
+    # custom pronunciations are case-insensitive whole words/phrases
+    for trigger, pronunciation in (pronunciations or {}).items():
+        text = re.sub(rf"(?<!\w){re.escape(trigger)}(?!\w)", lambda _: pronunciation, text, flags=re.IGNORECASE)
         
     return text
 
@@ -223,79 +306,225 @@ def smart_chunk(input_text: str, max_chunk_length: int = MAX_CHUNK_LENGTH) -> li
 
     return text_chunks
 
-async def download_and_queue_tiktok(input_text: str, voice: TTV, tts_queue_deque: deque) -> TRC:
+async def synthesize_pcm(backend: TTSBackend, text: str, voice: str, trace: Trace, index: int) -> tuple[TRC, bytes | None, float]:
     """
-    downloads a TikTok voice line and adds it to the TTS queue
+    synthesizes one chunk and decodes it to playback PCM, so playback never has to transcode.
+    the clip's loudness is measured here too, once, so playback only has to apply a fixed gain
 
-    :param input_text: the text to speak
-    :type input_text: str
-    :param voice: the TikTok voice to use
-    :type voice: TVV
-    :param tts_queue_deque: the tts deque (from dict) to add to
-    :type tts_queue_deque: deque
-    :return: the return code, to indicate whether valid or not and in what way
-    :rtype: TRC
+    :param backend: the backend to synthesize with
+    :type backend: TTSBackend
+    :param text: the chunk to speak
+    :type text: str
+    :param voice: the display name of the voice to use
+    :type voice: str
+    :param trace: the trace to record spans on
+    :type trace: Trace
+    :param index: the chunk index, for the spans
+    :type index: int
+    :return: the return code, the decoded PCM if successful, and the gain to play it at (1.0 if not)
+    :rtype: tuple[TRC, bytes | None, float]
+    """
+    return_code, audio = await backend.synthesize(text, voice, trace, index)
+    if return_code != TRC.OKAY:
+        return return_code, None, 1.0
+
+    try:
+        with trace.span("decode", chunk=index, bytes=len(audio)):
+            pcm = await transcode.decode_to_pcm(audio)
+    except transcode.TranscodeError as e:
+        tsprint(f"Could not decode {backend.name} audio: {e}")
+        return TRC.GENERIC_ERROR, None, 1.0
+
+    with trace.span("loudness", chunk=index) as span:
+        clip_loudness = loudness.measure_loudness(pcm)
+        gain = loudness.gain_for(pcm, clip_loudness)
+        span.attrs["loudness_db"] = clip_loudness
+        span.attrs["gain"] = gain
+
+    return TRC.OKAY, pcm, gain
+
+async def synthesize_to_file(
+    backend: TTSBackend,
+    text: str,
+    voice: str,
+    trace: Trace,
+    index: int,
+    filepath: str
+) -> tuple[TRC, str | None, float, float]:
     """
+    synthesizes one chunk to a playback PCM file. this is the unit of work worker processes run in
+    multi-process mode
 
-    tsprint(f"Getting {voice.name} TTS...")
-    # make any necessary pronunciation changes/emoji pronunciations prior to checking repeat chars
-    adjusted_input = adjust_pronunciation(input_text, voice.name)
-
-    # use chunking, if necessary
-    split_text = smart_chunk(adjusted_input)
-
-    async with aiohttp.ClientSession():
-        for index, split_item in enumerate(split_text):
-            # strip illegal chars from input to put into filename
-            filename = re.sub(r'[\\/*?:"<>,|]', "", split_item)
-            filename = f"{filename[:100].rstrip()} part {index}"
-            filename_ext = f"{filename}.mp3"
-
-            # make sure filename is not too long (factoring in .mp3)
-            filepath = os.path.join("downloads", filename_ext)
-
-            # request from the lazypyro API
-            url = f"https://lazypy.ro/tts/request_tts.php"
-            headers = {
-                "content-type": "application/x-www-form-urlencoded",
-                "origin": "https://lazypy.ro",
-                "referer": url,
-                "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            }
-            data = {
-                "service": "TikTok",
-                "voice": voice.value,
-                "text": split_item
-            }
-            response = requests.post(url, headers=headers, data=data)
+    :param backend: the backend to synthesize with
+    :type backend: TTSBackend
+    :param text: the chunk to speak
+    :type text: str
+    :param voice: the display name of the voice to use
+    :type voice: str
+    :param trace: the trace to record spans on
+    :type trace: Trace
+    :param index: the chunk index, for the spans
+    :type index: int
+    :param filepath: where to write the PCM
+    :type filepath: str
+    :return: the return code, the file path if successful, the gain to play it at and its duration (seconds)
+    :rtype: tuple[TRC, str | None, float, float]
+    """
+    return_code, pcm, gain = await synthesize_pcm(backend, text, voice, trace, index)
+    if return_code != TRC.OKAY:
+        return return_code, None, 1.0, 0.0
 
-            response = response.json() # get response json
+    with trace.span("synthesize.write", chunk=index):
+        await asyncio.to_thread(write_pcm, filepath, pcm)
+    tsprint(f"Saved TTS to \"{filepath}\"")
 
-            if not response["success"]:
-                error_msg = response["error_msg"]
-                tsprint(f"Could not get TTS from lazypyro. {error_msg}")
+    return TRC.OKAY, filepath, gain, len(pcm) / transcode.BYTES_PER_SECOND
 
-                if "supported for this language" in error_msg:
-                    return TRC.LANGUAGE_UNSUPPORTED
-                elif "generation is temporarily unavailable":
-                    return TRC.TEMP_UNAVAILABLE
-                
-                return TRC.GENERIC_ERROR
+def write_pcm(filepath: str, pcm: bytes):
+    """
+    writes a clip's PCM to disk. blocking, run it in a thread
 
-            audio_url = response["audio_url"]
-            audio_response = requests.get(audio_url)
-            decoded_audio_bytes = audio_response.content
+    :param filepath: where to write it
+    :type filepath: str
+    :param pcm: the PCM
+    :type pcm: bytes
+    """
+    # the guild's folder may have been purged (the bot left) while this was synthesizing
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, "wb") as file:
+        file.write(pcm)
 
-            with open(filepath, "wb") as file:
-                file.write(decoded_audio_bytes)
+def link_or_copy(source: str, destination: str):
+    """
+    gives a request its own copy of a clip another request produced: a hard link where the filesystem
+    allows it (no extra disk), a real copy otherwise
 
-                tsprint(f"Saved TTS to \"{filepath}\"")
+    :param source: the existing clip
+    :type source: str
+    :param destination: where the copy should be
+    :type destination: str
+    """
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+async def download_and_queue(
+    input_text: str,
+    voice: str,
+    tts_queue_deque: deque,
+    trace: Trace,
+    backend: TTSBackend | None = None,
+    author_id: int | None = None,
+    on_queued: Callable[[QueueItem], None] | None = None,
+    guild_id: int | None = None
+) -> TRC:
+    """
+    synthesizes a voice line with whichever backend provides the voice, and adds it to the TTS queue
+
+    :param input_text: the text to speak
+    :type input_text: str
+    :param voice: the display name of the voice to use
+    :type voice: str
+    :param tts_queue_deque: the tts deque (from dict) to add to
+    :type tts_queue_deque: deque
+    :param trace: the trace of the request, spans are recorded for each stage
+    :type trace: Trace
+    :param backend: the backend to synthesize with, defaults to the one providing the voice
+    :type backend: TTSBackend | None
+    :param author_id: the user who sent the text, if any
+    :type author_id: int | None
+    :param on_queued: called with each clip as it's added to the queue
+    :type on_queued: Callable[[QueueItem], None] | None
+    :param guild_id: the guild the clips are for, they're written to its folder under downloads/
+    :type guild_id: int | None
+    :return: the return code, to indicate whether valid or not and in what way
+    :rtype: TRC
+    """
+    backend = backend or VOICE_BACKENDS[voice]
+    trace.attrs["backend"] = backend.name
+
+    tsprint(f"Getting {voice} TTS...")
+    with trace.span("normalize.pronunciation"):
+        # make any necessary pronunciation changes/emoji pronunciations prior to checking repeat chars
+        adjusted_input = adjust_pronunciation(input_text, voice)
+
+    with trace.span("normalize.chunk") as span:
+        # use chunking, if necessary
+        split_text = smart_chunk(adjusted_input, backend.max_chunk_length)
+        span.attrs["chunks"] = len(split_text)
+
+    # answer known-bad input immediately, before any chunk spends upstream capacity
+    with trace.span("precheck"):
+        for split_item in split_text:
+            cached_code = NEGATIVE_CACHE.get((backend.name, voice, split_item))
+            if cached_code is not None:
+                metrics.inc("tts.negative_cache.hits")
+                return cached_code
+
+            script = backend.find_unsupported_script(split_item)
+            if script is not None:
+                tsprint(f"Not requesting TTS, {voice} can't speak {script} text")
+                metrics.inc("tts.precheck.unsupported_script")
+                return TRC.LANGUAGE_UNSUPPORTED
+
+    for index, split_item in enumerate(split_text):
+        # strip illegal chars from input to put into filename
+        filename = re.sub(r'[\\/*?:"<>,|]', "", split_item)
+        # the suffix keeps identical text (now common, thanks to coalescing) from sharing a file
+        filename = f"{filename[:100].rstrip()} part {index} {uuid.uuid4().hex[:8]}"
+        filename_ext = f"{filename}.{transcode.PCM_EXTENSION}"
+        # queue items refer to clips relative to downloads/, guild folder included
+        if guild_id is not None:
+            filename_ext = os.path.join(str(guild_id), filename_ext)
+            storage.guild_dir(guild_id)
+
+        # make sure filename is not too long (factoring in the extension)
+        filepath = os.path.join(storage.DOWNLOADS_DIR, filename_ext)
+
+        with trace.span("synthesize", chunk=index, chars=len(split_item)) as synth_span:
+            # workers only have the plain backends, so hedged requests stay here to keep hedging and failover
+            if WORKER_POOL and not isinstance(backend, HedgedBackend):
+                synthesize = lambda: WORKER_POOL.synthesize(backend.name, voice, split_item, filepath, index)
+            else:
+                synthesize = lambda: synthesize_to_file(backend, split_item, voice, trace, index, filepath)
+
+            # identical chunks in flight at the same time (spam, multiple guilds) share one request and decode
+            (return_code, clip_path, gain, duration), shared = await SYNTHESIS_FLIGHTS.do(
+                (backend.name, voice, split_item),
+                synthesize
+            )
+            synth_span.attrs["coalesced"] = shared
+            if shared:
+                metrics.inc("tts.synthesis.coalesced")
+
+        if return_code != TRC.OKAY:
+            synth_span.attrs["error"] = return_code.name
+            # remember rejections (not outages), so repeats and retries don't go upstream again
+            if return_code == TRC.LANGUAGE_UNSUPPORTED:
+                NEGATIVE_CACHE.put((backend.name, voice, split_item), return_code)
+            return return_code
+
+        if clip_path != filepath:
+            # the clip was written for whichever request got there first, this one needs its own file
+            try:
+                with trace.span("synthesize.link", chunk=index):
+                    await asyncio.to_thread(link_or_copy, clip_path, filepath)
+            except OSError as e:
+                tsprint(f"Could not reuse \"{clip_path}\": {e}")
+                return TRC.GENERIC_ERROR
 
-            tts_queue_deque.append(f"{filename}.mp3")
+        with trace.span("enqueue", chunk=index):
+            # the trace stays open until this clip is done playing
+            trace.hold()
+            item = QueueItem(filename_ext, trace, author_id, duration, gain)
+            tts_queue_deque.append(item)
+            if on_queued:
+                on_queued(item)
 
-            tsprint(f"Queued TTS \"{split_item}\"")
+        tsprint(f"Queued TTS \"{split_item}\"")
 
-            await asyncio.sleep(0.1)
+        await asyncio.sleep(0.1)
 
     return TRC.OKAY
 
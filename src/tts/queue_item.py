@@ -0,0 +1,31 @@
+"""
+Defines what actually sits in a guild's TTS queue
+"""
+
+# built-in
+from typing import Optional
+import time
+
+# my modules
+from src.utils.tracing import Trace
+
+class QueueItem():
+    """
+    A single downloaded clip waiting to be played, along with the trace of the request that queued it
+    and who it's from
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        trace: Optional[Trace] = None,
+        author_id: Optional[int] = None,
+        duration: float = 0.0,
+        gain: float = 1.0
+    ):
+        self.filename = filename
+        self.trace = trace
+        self.author_id = author_id
+        self.duration = duration # seconds of audio
+        self.gain = gain # loudness normalization, measured when the clip was decoded
+        self.enqueued_at = time.perf_counter()
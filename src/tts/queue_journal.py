@@ -0,0 +1,119 @@
+"""
+Durable TTS queues: every queued clip is journaled to SQLite and removed once it's done, so a restart
+or cog reload can put the queues back as they were, reusing the clips already on disk instead of
+synthesizing them again. Writes go through a background thread, so neither the event loop nor the
+audio thread waits on the database.
+"""
+
+# built-in
+from typing import Optional
+import os
+import queue
+import threading
+
+# my modules
+from src.db import driver as dbd
+from src.tts.queue_item import QueueItem
+from src.tts.storage import DOWNLOADS_DIR
+from src.utils import metrics
+from src.utils.config import get_config
+from src.utils.logging_utils import timestamp_print as tsprint
+
+class QueueJournal():
+    """
+    Batches queue changes into the queued_clips table from a writer thread
+    """
+
+    def __init__(self):
+        self._ops: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_config(cls) -> Optional["QueueJournal"]:
+        """
+        Builds the journal from the "queue_journal" config section
+
+        Returns:
+            journal (Optional[QueueJournal]): the journal, or None if it's disabled
+        """
+        if not get_config("queue_journal").get("enabled", True):
+            return None
+        return cls()
+
+    def start(self):
+        "Starts the writer thread, if not already running"
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._write_loop, name="queue-journal", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        "Writes everything pending and stops the writer thread"
+        if self._thread and self._thread.is_alive():
+            self._ops.put(None)
+            self._thread.join(timeout=10)
+        self._thread = None
+
+    def record(self, guild_id: int, channel_id: Optional[int], voice: str, item: QueueItem):
+        """
+        Journals a newly queued clip
+
+        Args:
+            guild_id (int): the guild it's queued in
+            channel_id (Optional[int]): the voice channel the bot was in, to rejoin on restore
+            voice (str): the voice queue it's in
+            item (QueueItem): the clip
+        """
+        self._ops.put(("insert", (guild_id, channel_id, voice, item.filename, item.author_id, item.duration, item.gain)))
+
+    def remove(self, filename: str):
+        """
+        Drops a clip from the journal once it's done. Safe to call from any thread.
+
+        Args:
+            filename (str): the clip's filename
+        """
+        self._ops.put(("delete", filename))
+
+    def _write_loop(self):
+        running = True
+        while running:
+            ops = [self._ops.get()]
+            # take whatever else piled up meanwhile, so a burst is one transaction
+            while True:
+                try:
+                    ops.append(self._ops.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in ops:
+                running = False
+            inserts = [payload for kind, payload in filter(None, ops) if kind == "insert"]
+            deletes = [payload for kind, payload in filter(None, ops) if kind == "delete"]
+            if not inserts and not deletes:
+                continue
+
+            try:
+                dbd.apply_queue_journal(inserts, deletes)
+                metrics.inc("queue_journal.writes", len(inserts) + len(deletes))
+            except Exception as e:
+                tsprint(f"Could not write queue journal: {e!r}")
+
+    def load(self) -> list[tuple]:
+        """
+        Reads back every journaled clip whose file still exists, oldest first. Clips whose file is gone
+        are dropped from the journal.
+
+        Returns:
+            rows (list[tuple]): (guild_id, channel_id, voice, filename, author_id, duration, gain) rows
+        """
+        rows = []
+        for row in dbd.get_queued_clips():
+            if os.path.exists(os.path.join(DOWNLOADS_DIR, row[3])):
+                rows.append(row)
+            else:
+                self.remove(row[3])
+        return rows
+
+# shared by every shard; None when disabled
+QUEUE_JOURNAL = QueueJournal.from_config()
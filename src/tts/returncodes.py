@@ -5,5 +5,7 @@ class TTSReturnCode(Enum):
     OKAY = 0
     LANGUAGE_UNSUPPORTED = 3
     TEMP_UNAVAILABLE = 4
+    RATE_LIMITED = 5
+    CANCELLED = 6
 
-    GENERIC_ERROR = 99
\ No newline at end of file
+    GENERIC_ERROR = 99
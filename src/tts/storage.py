@@ -0,0 +1,182 @@
+"""
+On-disk clip storage. Every guild writes its clips to its own folder under downloads/, so everything a
+guild has on disk can be released in one go when the bot leaves, and a periodic janitor keeps the
+whole directory in line with what's actually queued: unreferenced files (failed plays, crashes,
+disconnects) are deleted, and a global disk quota is enforced.
+"""
+
+# built-in
+from typing import Awaitable, Callable, Optional
+import asyncio
+import os
+import shutil
+import time
+
+# my modules
+from src.utils import metrics
+from src.utils.config import get_config
+from src.utils.logging_utils import timestamp_print as tsprint
+
+DOWNLOADS_DIR = "downloads"
+os.makedirs(DOWNLOADS_DIR, exist_ok=True)
+
+def guild_dir(guild_id: int) -> str:
+    """
+    Gets a guild's folder, creating it if needed
+
+    Args:
+        guild_id (int): the guild
+
+    Returns:
+        path (str): the folder, relative to the working directory
+    """
+    path = os.path.join(DOWNLOADS_DIR, str(guild_id))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def purge_guild_dir(guild_id: int) -> int:
+    """
+    Deletes a guild's folder and everything in it. Blocking, run it in a thread.
+
+    Args:
+        guild_id (int): the guild
+
+    Returns:
+        removed (int): how many files were deleted
+    """
+    path = os.path.join(DOWNLOADS_DIR, str(guild_id))
+    try:
+        with os.scandir(path) as entries:
+            removed = sum(1 for entry in entries if entry.is_file())
+    except FileNotFoundError:
+        return 0
+
+    shutil.rmtree(path, ignore_errors=True)
+    metrics.inc("storage.purged", removed)
+    return removed
+
+def remove_files(filenames: list[str]) -> int:
+    """
+    Deletes clips. Blocking, run it in a thread.
+
+    Args:
+        filenames (list[str]): paths relative to downloads/
+
+    Returns:
+        removed (int): how many files were deleted
+    """
+    removed = 0
+    for filename in filenames:
+        try:
+            os.remove(os.path.join(DOWNLOADS_DIR, filename))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+def sweep(live: set[str], grace: float = 0.0) -> tuple[int, int]:
+    """
+    Deletes every clip nothing references, then totals up what's left. Blocking, run it in a thread.
+
+    Args:
+        live (set[str]): paths (relative to downloads/) of every clip still queued or playing
+        grace (float): seconds a file must be untouched before it can be deleted, so clips that are
+        still being synthesized (not queued yet) are left alone
+
+    Returns:
+        (removed, usage) (tuple[int, int]): how many files were deleted, and the bytes still used
+    """
+    cutoff = time.time() - grace
+    removed = usage = 0
+
+    def visit(directory: str, prefix: str):
+        nonlocal removed, usage
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name = os.path.join(prefix, entry.name) if prefix else entry.name
+                try:
+                    if entry.is_dir():
+                        # files from before per-guild folders live at the top level, guilds one level down
+                        if not prefix:
+                            visit(entry.path, name)
+                            if entry.stat().st_mtime < cutoff and not os.listdir(entry.path):
+                                os.rmdir(entry.path)
+                        continue
+
+                    stat = entry.stat()
+                    if name in live or stat.st_mtime >= cutoff:
+                        usage += stat.st_size
+                        continue
+                    os.remove(entry.path)
+                    removed += 1
+                except OSError as e: # deleted or written to under us
+                    tsprint(f"Could not sweep \"{entry.path}\": {e}")
+
+    visit(DOWNLOADS_DIR, "")
+    metrics.inc("storage.orphans_removed", removed)
+    metrics.set_gauge("storage.bytes", usage)
+    return removed, usage
+
+class Janitor():
+    """
+    Periodically reconciles downloads/ with the live queues, and evicts queued clips while the
+    directory is over its quota
+    """
+
+    def __init__(self, interval: float = 300.0, quota: Optional[int] = None, grace: float = 600.0):
+        """
+        Args:
+            interval (float): seconds between sweeps
+            quota (Optional[int]): most bytes downloads/ may use, None for no limit
+            grace (float): seconds an unreferenced file is kept, in case it's still being synthesized
+        """
+        self.interval = interval
+        self.quota = quota
+        self.grace = grace
+
+    @classmethod
+    def from_config(cls) -> Optional["Janitor"]:
+        """
+        Builds a janitor from the "janitor" config section
+
+        Returns:
+            janitor (Optional[Janitor]): the janitor, or None if it's disabled
+        """
+        config = get_config("janitor")
+        if not config.get("enabled", True):
+            return None
+        quota_mb = config.get("quota_mb", 1024)
+        return cls(
+            interval=config.get("interval_s", 300),
+            quota=int(quota_mb * 1024 * 1024) if quota_mb else None,
+            grace=config.get("grace_s", 600)
+        )
+
+    async def run(self, live_files: Callable[[], set[str]], evict: Callable[[int], Awaitable[int]]):
+        """
+        Sweeps every `interval` seconds, forever
+
+        Args:
+            live_files (Callable[[], set[str]]): gets the paths (relative to downloads/) of every clip
+            still queued or playing
+            evict (Callable[[int], Awaitable[int]]): drops queued clips to free at least the given
+            number of bytes, returning how many clips it dropped
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep_once(live_files, evict)
+            except Exception as e:
+                tsprint(f"Download janitor failed: {e!r}")
+
+    async def sweep_once(self, live_files: Callable[[], set[str]], evict: Callable[[int], Awaitable[int]]):
+        "Runs one sweep, see `run`"
+        # the references are gathered on the event loop, only the disk work goes to a thread
+        removed, usage = await asyncio.to_thread(sweep, live_files(), self.grace)
+        if removed:
+            tsprint(f"Janitor removed {removed} unreferenced file(s) from {DOWNLOADS_DIR}")
+
+        if self.quota and usage > self.quota:
+            dropped = await evict(usage - self.quota)
+            tsprint(f"{DOWNLOADS_DIR} over quota by {usage - self.quota} bytes, dropped {dropped} queued clip(s)")
+            metrics.inc("storage.evicted", dropped)
@@ -5,76 +5,290 @@ Avoids slash-commands, focuses on audio.
 
 # built-in
 from collections import deque
-from typing import Dict, Deque, Optional
+from typing import Callable, Dict, Optional
 import asyncio
 import os
-import platform
+import time
 
 # PyPI
 import discord
 
 # my modules
 from src.tts import driver as ttsd
+from src.tts import storage
 from src.tts.returncodes import TTSReturnCode as TRC
-from .voices import TikTokVoice as TTV
+from src.tts.queue_item import QueueItem
+from src.tts.queue_journal import QUEUE_JOURNAL
+from src.tts.backends.base import TTSBackend
+from src.tts.backends.hedged import HedgedBackend
+from src.audio import tempo, transcode
+from src.audio.mixer import MixingAudioStream
+from src.audio.stream import GuildAudioStream, PCMClip
 from ..errors import *
+from ..utils import metrics
+from ..utils.config import get_config
 from ..utils.logging_utils import timestamp_print as tsprint
-from ..vc.vc_state import VCState
+from ..utils.tracing import Trace
+from ..vc.guild_state import GuildRegistry, GuildState
+from ..vc.vc_state import ConnectionState, VCState
+
+def release_item(item: QueueItem):
+    """
+    Lets go of a clip that's done (played, failed or dropped): drops it from the journal and
+    releases its trace. Its files are left to the caller. Safe to call from any thread.
+
+    ## Args:
+    - `item` (QueueItem): the clip
+    """
+    if QUEUE_JOURNAL:
+        QUEUE_JOURNAL.remove(item.filename)
+    if item.trace:
+        item.trace.release()
+
+# picks clips/requests by who sent them and which request they're from: (author_id, trace) -> bool
+Match = Callable[[Optional[int], Optional[Trace]], bool]
 
 class TTSManager():
     """
     Holds the TTS queue and its contents, allows you to queue into the TTS queue
     """
 
-    def __init__(self):
-        # maps guild_id -> voice_name -> deque of filenames to play
-        self.tts_queue_dict: Dict[int, Dict[str, Deque[str]]] = dict()
+    def __init__(self, hedging: Optional[dict] = None, guilds: Optional[GuildRegistry] = None):
+        """
+        :param hedging: hedging/failover settings, defaults to the "hedging" config section
+        :type hedging: Optional[dict]
+        :param guilds: where each guild's queues (voice_name -> deque of clips to play) are kept,
+        shared with VCState and the playback loop
+        :type guilds: Optional[GuildRegistry]
+        """
+        self.guilds = guilds if guilds is not None else GuildRegistry()
 
-    def init_guild(self, guild_id: int):
+        # maps voice_name -> backend to synthesize it with
+        self.voice_backends: Dict[str, TTSBackend] = dict(ttsd.VOICE_BACKENDS)
+
+        hedging = get_config("hedging") if hedging is None else hedging
+        if hedging.get("enabled", False):
+            self._enable_hedging(hedging)
+
+    def _enable_hedging(self, hedging: dict):
         """
-        Verifies/initializes guild in "tts queue" dict with all voices
+        Wraps the TikTok backend so slow requests are hedged, and requests fail over while it's down.
+        Alternates are lazypyro mirrors (same voices); the offline tone backend can optionally be failed
+        over to, but is never hedged to (it'd win every race against a healthy but slow primary).
 
         ## Args:
-        - `guild_id` (int): the guild ID to verify/initialize
+        - `hedging` (dict): the hedging settings
         """
-        if guild_id not in self.tts_queue_dict:
-            self.tts_queue_dict[guild_id] = {voice: deque() for voice in ttsd.TTS_VOICES}
+        # shared by every shard, so each mirror's rate limit and breaker are global
+        alternates: list[TTSBackend] = [ttsd.get_mirror_backend(origin) for origin in hedging.get("mirrors", [])]
+        failovers: list[TTSBackend] = [ttsd.TONE_BACKEND] if hedging.get("failover_to_tone", False) else []
+
+        if not alternates and not failovers:
+            tsprint("Hedging enabled, but no mirrors or failover backend configured.")
+            return
+
+        hedged = HedgedBackend(
+            ttsd.TIKTOK_BACKEND,
+            alternates,
+            percentile=hedging.get("percentile", 95),
+            min_delay=hedging.get("min_delay_ms", 250) / 1000,
+            max_delay=hedging.get("max_delay_ms", 3000) / 1000,
+            failovers=failovers
+        )
+        for voice in ttsd.TIKTOK_BACKEND.voices:
+            self.voice_backends[voice] = hedged
+
+        tsprint(f"Hedging TikTok TTS across {len(alternates)} mirror(s), {len(failovers)} failover-only backend(s).")
+        if ttsd.WORKER_POOL:
+            tsprint("Warning: hedged TikTok requests are synthesized in the gateway process, not the worker processes.")
 
-    async def download_and_queue(self, input: str, voice: TTV, guild_id: int) -> TRC:
+    def queued_seconds(self, guild_id: int) -> float:
+        """
+        How much audio is waiting in a guild's queues
+
+        ## Args:
+        - `guild_id` (int): the guild to check
+
+        ## Returns:
+        - `seconds` (float): the total duration of every queued clip
+        """
+        state = self.guilds.get(guild_id)
+        if state is None or not state.queues:
+            return 0.0
+        return sum(item.duration for queue in state.queues.values() for item in queue)
+
+    def drop(self, guild_id: int, match: Match) -> list[QueueItem]:
+        """
+        Takes the clips `match` accepts out of a guild's queues and releases them. Their files are
+        left for the caller to delete.
+
+        ## Args:
+        - `guild_id` (int): the guild to drop clips in
+        - `match` (Match): which clips to drop
+
+        ## Returns:
+        - `dropped` (list[QueueItem]): the clips dropped
+        """
+        state = self.guilds.get(guild_id)
+        if state is None or not state.queues:
+            return []
+
+        dropped = []
+        # filtered in place: downloads still in progress hold on to these deques
+        for queue in state.queues.values():
+            kept = [item for item in queue if not match(item.author_id, item.trace)]
+            if len(kept) == len(queue):
+                continue
+            dropped += [item for item in queue if match(item.author_id, item.trace)]
+            queue.clear()
+            queue.extend(kept)
+        for item in dropped:
+            release_item(item)
+        return dropped
+
+    def purge(self, guild_id: int) -> int:
+        """
+        Empties a guild's queues, releasing every clip in them. The files are left for the caller to
+        delete in bulk, along with the rest of the guild's folder.
+
+        ## Args:
+        - `guild_id` (int): the guild to purge
+
+        ## Returns:
+        - `purged` (int): how many clips were dropped
+        """
+        return len(self.drop(guild_id, lambda author_id, trace: True))
+
+    def cancel_downloads(self, guild_id: int, match: Match) -> int:
+        """
+        Cancels the requests `match` accepts that are still synthesizing. Their upstream requests are
+        aborted (or worker jobs cancelled), unless an identical request elsewhere still wants the result.
+
+        ## Args:
+        - `guild_id` (int): the guild to cancel requests in
+        - `match` (Match): which requests to cancel
+
+        ## Returns:
+        - `cancelled` (int): how many requests were cancelled
+        """
+        state = self.guilds.get(guild_id)
+        if state is None or not state.downloads:
+            return 0
+
+        cancelled = 0
+        for task, (author_id, trace) in list(state.downloads.items()):
+            if match(author_id, trace) and task.cancel():
+                cancelled += 1
+        metrics.inc("tts.downloads_cancelled", cancelled)
+        return cancelled
+
+    async def download_and_queue(
+        self,
+        input: str,
+        voice: str,
+        guild_id: int,
+        trace: Optional[Trace] = None,
+        author_id: Optional[int] = None
+    ) -> TRC:
         """
         Chooses the proper method for downloading and queueing TTS
         
         :param input: the text to speak
         :type input: str
-        :param voice: the voice to use
-        :type voice: TVV
+        :param voice: the display name of the voice to use
+        :type voice: str
         :param guild_id: the guild ID to queue the TTS in
         :type guild_id: int
+        :param trace: the trace to record spans on, a new one is started if not given
+        :type trace: Optional[Trace]
+        :param author_id: the user who sent the text, clips from different users can overlap in overlap mode
+        :type author_id: Optional[int]
         :return: the return code from the function
         :rtype: TRC
         """
-        voice_name_spaces = voice.name.replace("_", " ")
-        queue_deque = self.tts_queue_dict[guild_id][voice_name_spaces]
+        # queues are only allocated once a guild (and voice) is actually used
+        state = self.guilds.get_or_create(guild_id)
+        queue_deque = state.queue(voice)
+
+        on_queued = None
+        if QUEUE_JOURNAL:
+            def on_queued(item: QueueItem):
+                # remember where the bot was, so a restore can rejoin the same channel
+                channel_id = state.vc.channel.id if state.vc else None
+                QUEUE_JOURNAL.record(guild_id, channel_id, voice, item)
 
-        return await ttsd.download_and_queue_tiktok(input, voice, queue_deque)
+        if trace is None:
+            trace = Trace("tts", guild_id=guild_id)
+        trace.attrs["voice"] = voice
+
+        # run as its own task, so /skip and /clear can cancel it without cancelling the command
+        download = asyncio.ensure_future(ttsd.download_and_queue(
+            input, voice, queue_deque, trace, self.voice_backends[voice], author_id, on_queued, guild_id
+        ))
+        if state.downloads is None:
+            state.downloads = dict()
+        state.downloads[download] = (author_id, trace)
+
+        # hold the trace while downloading, so it can't finish before every clip is queued
+        trace.hold()
+        return_code = TRC.GENERIC_ERROR
+        try:
+            return_code = await download
+            return return_code
+        except asyncio.CancelledError:
+            # cancelled through cancel_downloads, rather than the caller itself being cancelled
+            if download.cancelled() and not asyncio.current_task().cancelling():
+                return_code = TRC.CANCELLED
+                return return_code
+            raise
+        finally:
+            state.downloads.pop(download, None)
+            trace.attrs["return_code"] = return_code.name
+            trace.release()
     
 class TTSBackgroundTask():
     """
     Playback loop. Instantiate then call `start` to start the loop.
+    Each guild gets one long-lived stream that queued clips are fed into, so consecutive clips play
+    back to back without spawning anything. In "overlap" mode the stream mixes clips from different
+    users at the same time instead of playing everything one after another.
     """
 
-    def __init__(self):
+    LOOKAHEAD = 1 # clips waiting in a stream (or lane) besides the one playing, so the next starts without a gap
+    SCAN_DEPTH = 8 # how far into a voice queue overlap mode looks for a clip whose lane has room
+
+    RECLAIM_INTERVAL = 60 # seconds between sweeps for idle guild state
+
+    def __init__(
+        self,
+        ffmpeg_path: Optional[str] = None,
+        playback: Optional[dict] = None,
+        guilds: Optional[GuildRegistry] = None
+    ):
+        """
+        :param ffmpeg_path: the ffmpeg executable clips are decoded with, defaults to the platform's usual location
+        :type ffmpeg_path: Optional[str]
+        :param playback: playback settings, defaults to the "playback" config section
+        :type playback: Optional[dict]
+        :param guilds: where each guild's stream is kept, shared with VCState and TTSManager
+        :type guilds: Optional[GuildRegistry]
+        """
         self.running = False
         self._task: Optional[asyncio.Task] = None
+        self.guilds = guilds if guilds is not None else GuildRegistry()
 
-        match platform.system():
-            case "Windows":
-                self.ffmpeg_path = os.path.join("depend", "ffmpeg.exe")
-            case "Darwin":
-                self.ffmpeg_path = "/opt/homebrew/bin/ffmpeg"
-            case _:
-                self.ffmpeg_path = ""
-                raise OSNotSupportedError()
+        self.playback = get_config("playback") if playback is None else playback
+        self.overlap = self.playback.get("mode", "serial") == "overlap"
+
+        # speeds clips up while a guild's backlog is long, None when disabled
+        self.adaptive_speed = tempo.AdaptiveSpeed.from_config()
+        # guild_id -> clip taken off a queue that's being sped up, so isn't in any queue or stream right now
+        self.preparing_items: Dict[int, QueueItem] = dict()
+
+        if ffmpeg_path:
+            transcode.set_ffmpeg_path(ffmpeg_path)
+        # fail early (rather than on the first /tts) if there's no ffmpeg for this OS
+        transcode.get_ffmpeg_path()
 
     def start(self, bot: discord.Bot, vc_state, tts_manager: TTSManager):
         """
@@ -109,39 +323,245 @@ class TTSBackgroundTask():
         
         self._task.cancel()
         self.running = False
+
+    def get_stream(self, state: GuildState) -> GuildAudioStream | MixingAudioStream:
+        """
+        Gets a guild's audio stream, creating it on first use
+
+        :param state: the guild to get the stream for
+        :type state: GuildState
+        :return: the guild's stream
+        :rtype: GuildAudioStream | MixingAudioStream
+        """
+        stream = state.stream
+        if stream is None:
+            if self.overlap:
+                stream = MixingAudioStream(
+                    state.guild_id,
+                    max_lanes=self.playback.get("max_lanes", 3),
+                    lane_gain=self.playback.get("lane_gain", 0.7)
+                )
+            else:
+                stream = GuildAudioStream(state.guild_id)
+            state.stream = stream
+        return stream
+
+    def close_stream(self, guild_id: int):
+        """
+        Drops a guild's stream and everything queued in it, e.g. after leaving VC
+
+        :param guild_id: the guild whose stream to close
+        :type guild_id: int
+        """
+        state = self.guilds.get(guild_id)
+        if state and state.stream:
+            stream, state.stream = state.stream, None
+            stream.close()
+
+    def playing(self, guild_id: int) -> list[PCMClip]:
+        """
+        Gets the clips a guild is playing right now (more than one in overlap mode)
+
+        :param guild_id: the guild to check
+        :type guild_id: int
+        :return: the playing clips
+        :rtype: list[PCMClip]
+        """
+        state = self.guilds.get(guild_id)
+        return state.stream.playing() if state and state.stream else []
+
+    def skip(self, guild_id: int) -> list[PCMClip]:
+        """
+        Stops the clips a guild is playing, along with the rest of their messages already in the stream
+
+        :param guild_id: the guild to skip in
+        :type guild_id: int
+        :return: the clips that were playing
+        :rtype: list[PCMClip]
+        """
+        playing = self.playing(guild_id)
+        traces = {clip.trace for clip in playing if clip.trace}
+        self.drop_clips(guild_id, lambda author_id, trace: trace is not None and trace in traces)
+        # restored clips have no trace to match on
+        state = self.guilds.get(guild_id)
+        if state and state.stream:
+            state.stream.drop(lambda clip: clip in playing)
+        return playing
+
+    def drop_clips(self, guild_id: int, match: Match) -> int:
+        """
+        Stops and drops the clips `match` accepts from a guild's stream, including one being sped up
+
+        :param guild_id: the guild to drop clips in
+        :type guild_id: int
+        :param match: which clips to drop
+        :type match: Match
+        :return: how many clips were dropped
+        :rtype: int
+        """
+        state = self.guilds.get(guild_id)
+        if state is None:
+            return 0
+
+        dropped = 0
+        item = self.preparing_items.get(guild_id)
+        if item and state.preparing and match(item.author_id, item.trace):
+            state.preparing.cancel() # cleans up after itself
+            dropped += 1
+        if state.stream:
+            dropped += state.stream.drop(lambda clip: match(clip.author_id, clip.trace))
+        return dropped
+
+    def _next_playable(
+        self,
+        queue: deque[QueueItem],
+        stream: GuildAudioStream | MixingAudioStream
+    ) -> Optional[QueueItem]:
+        """
+        Takes the next clip off a voice queue that the stream has room for, or None if none has.
+        In overlap mode a full lane only holds back its own author: later clips from other authors
+        (up to SCAN_DEPTH deep) may go ahead, while each author's own clips keep their order.
+
+        :param queue: the voice queue to take from
+        :type queue: deque[QueueItem]
+        :param stream: the guild's stream the clip is for
+        :type stream: GuildAudioStream | MixingAudioStream
+        """
+        depth = self.SCAN_DEPTH if self.overlap else 1
+        blocked = set()
+        for i, item in enumerate(queue):
+            if i >= depth:
+                break
+            if item.author_id in blocked:
+                continue
+            if stream.can_enqueue(item.author_id, self.LOOKAHEAD):
+                del queue[i]
+                return item
+            blocked.add(item.author_id)
+        return None
+
+    def _make_clip(self, item: QueueItem, guild_id: int, rendition: Optional[str] = None) -> PCMClip:
+        """
+        Turns a queue item into a stream clip that cleans up after itself once played
+
+        :param rendition: a sped-up copy of the clip to play instead, deleted along with the original
+        :type rendition: Optional[str]
+        """
+        tts_filepath = os.path.join(storage.DOWNLOADS_DIR, item.filename)
+
+        def on_done(error):  # called from the audio thread
+            tsprint(f"Audio done playing in {guild_id}: \"{item.filename}\"")
+            if error:
+                tsprint(f"Could not play audio for guild {guild_id}: {error}")
+            for filepath in filter(None, (tts_filepath, rendition)):
+                try:
+                    os.remove(filepath)
+                    tsprint(f"Deleted \"{filepath}\"")
+                except FileNotFoundError:
+                    tsprint(f"File \"{filepath}\" already deleted")
+            release_item(item)
+
+        if rendition:
+            # the original stays on disk until the rendition is done with
+            return PCMClip(
+                rendition, on_done, item.trace, item.enqueued_at, item.gain,
+                related=(tts_filepath,), author_id=item.author_id
+            )
+        return PCMClip(tts_filepath, on_done, item.trace, item.enqueued_at, item.gain, author_id=item.author_id)
+
+    async def _enqueue_stretched(
+        self,
+        state: GuildState,
+        stream: GuildAudioStream | MixingAudioStream,
+        item: QueueItem,
+        lane: Optional[int],
+        speed: float
+    ):
+        """
+        Makes a sped-up rendition of a clip, then hands it to the guild's stream
+        """
+        guild_id = state.guild_id
+        rendition = None
+        try:
+            trace = item.trace or Trace("untracked")
+            with trace.span("stretch", tempo=speed):
+                rendition = await tempo.get_rendition(os.path.join(storage.DOWNLOADS_DIR, item.filename), speed)
+            metrics.inc("playback.stretched")
+        except (transcode.TranscodeError, OSError) as e:
+            # fall back to normal speed rather than dropping the message
+            tsprint(f"Could not speed up \"{item.filename}\": {e}")
+        except asyncio.CancelledError:
+            # skipped/cleared: clean up (a half-written .part rendition is left to the janitor)
+            self._make_clip(item, guild_id).finish()
+            raise
+        finally:
+            state.preparing = None
+            self.preparing_items.pop(guild_id, None)
+
+        clip = self._make_clip(item, guild_id, rendition)
+        if state.stream is not stream:
+            clip.finish() # the guild's stream was closed while we were busy, just clean up
+            return
+        stream.enqueue(clip, lane)
         
     async def _playback_loop(self, bot: discord.Bot, voice_state: VCState, tts_manager: TTSManager):
         """
         Processes TTS queue - runs in Pycord event loop
         """
-        def make_after_callback(tts_filepath: str, tts_filename: str, guild_id: int):
-            def after_play(_):  # The `_` is the exception Pycord passes
-                tsprint(f"Audio done playing in {guild_id}: \"{tts_filename}\"")
-                try:
-                    os.remove(tts_filepath)
-                    tsprint(f"Deleted \"{tts_filename}\"")
-                except FileNotFoundError:
-                    tsprint(f"File \"{tts_filename}\" already deleted")
+        def make_after_callback(guild_id: int):
+            def after_play(error):  # Pycord passes the exception, if any
+                if error:
+                    tsprint(f"Audio stream stopped with an error in guild {guild_id}: {error}")
             return after_play
 
-        # eternally loop over vc_dict items for each guild
+        last_reclaim = time.monotonic()
+
+        # eternally loop over each guild connected to voice
         while True:
-            for guild_id, vc in voice_state.vc_dict.items():
-                if vc is None or not vc.is_connected():
+            for state, vc in voice_state.connected():
+                guild_id = state.guild_id
+                # mid-move (or on its way out) the voice session can't be played into yet
+                if voice_state.get_connection_state(guild_id) != ConnectionState.CONNECTED:
                     continue
-                
-                for voice, queue in tts_manager.tts_queue_dict[guild_id].items():
-                    if queue and not vc.is_playing():
-                        tts_filename = queue.popleft()
-                        tts_filepath = f"downloads/{tts_filename}"
-                        tsprint(f"Playing queued TTS \"{tts_filename}\" in guild {guild_id}")
-
-                        try:
-                            tts_audio_source = discord.FFmpegOpusAudio(
-                                executable=self.ffmpeg_path,
-                                source=tts_filepath
-                            )
-                            vc.play(tts_audio_source, after=make_after_callback(tts_filepath, tts_filename, guild_id))
-                        except Exception as e:
-                            tsprint(f"Could not play audio for guild {guild_id}: {e}")
-            await asyncio.sleep(0.1)
\ No newline at end of file
+                stream = self.get_stream(state)
+
+                # top up the stream from the voice queues, taking turns between voices
+                for voice, queue in list((state.queues or {}).items()):
+                    if not queue or state.preparing:
+                        continue
+                    item = self._next_playable(queue, stream)
+                    if item is None:
+                        continue
+                    # in overlap mode each author gets their own lane, otherwise the lane is ignored
+                    lane = item.author_id
+                    tsprint(f"Playing queued TTS \"{item.filename}\" in guild {guild_id}")
+
+                    speed = 1.0
+                    if self.adaptive_speed:
+                        speed = self.adaptive_speed.choose(tts_manager.queued_seconds(guild_id) + item.duration)
+                    if speed > 1.0:
+                        self.preparing_items[guild_id] = item
+                        state.preparing = asyncio.create_task(
+                            self._enqueue_stretched(state, stream, item, lane, speed)
+                        )
+                    else:
+                        stream.enqueue(self._make_clip(item, guild_id), lane)
+
+                # the stream ends playback whenever it runs dry, so restart it once there's audio again
+                if stream.has_audio() and not vc.is_playing():
+                    head = stream.peek()
+                    # fall back to an untracked trace so the span below doesn't need guarding
+                    trace = (head.trace if head else None) or Trace("untracked")
+                    try:
+                        with trace.span("vc.play"):
+                            vc.play(stream, after=make_after_callback(guild_id))
+                    except Exception as e:
+                        tsprint(f"Could not play audio for guild {guild_id}: {e}")
+
+            # drop the state of guilds that have gone quiet
+            if time.monotonic() - last_reclaim > self.RECLAIM_INTERVAL:
+                last_reclaim = time.monotonic()
+                reclaimed = self.guilds.reclaim()
+                if reclaimed:
+                    tsprint(f"Reclaimed state of {reclaimed} idle guild(s)")
+            await asyncio.sleep(0.1)
@@ -0,0 +1,354 @@
+"""
+Optional multi-process synthesis: a pool of worker processes does the HTTP synthesis, ffmpeg decoding,
+loudness analysis and file writing, so none of that CPU work shares the gateway's event loop with the
+voice clients. Jobs and results travel over a local pipe per worker; the gateway only ever gets back
+a reference to the finished PCM file.
+The upstream limits stay global: every upstream attempt a worker makes is let through (or rejected) by
+the gateway's gate, and its outcome is reported back, so the rate limit and circuit breaker are shared
+by all workers. Local limits (ffmpeg processes, concurrent synthesis) are split evenly between them.
+"""
+
+# built-in
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+import asyncio
+import itertools
+import multiprocessing
+import sys
+import threading
+import types
+
+# my modules
+from src.audio import transcode
+from src.audio.governor import GOVERNOR
+from src.tts.client import UpstreamGate
+from src.tts.returncodes import TTSReturnCode as TRC
+from src.utils import metrics
+from src.utils.config import get_config
+from src.utils.logging_utils import timestamp_print as tsprint
+from src.utils.tracing import Trace
+
+# a job's result: return code, PCM file path, gain, duration (seconds)
+Result = tuple[TRC, Optional[str], float, float]
+FAILED: Result = (TRC.GENERIC_ERROR, None, 1.0, 0.0)
+
+@dataclass
+class _Worker():
+    index: int
+    process: multiprocessing.Process
+    conn: "multiprocessing.connection.Connection"
+    send_lock: threading.Lock = field(default_factory=threading.Lock)
+    jobs: set[int] = field(default_factory=set) # IDs of jobs waiting on this worker
+    grants: int = 0 # upstream attempts let through and not settled yet
+    alive: bool = True
+
+@contextmanager
+def _bare_main():
+    """
+    Hides the real __main__ while a worker is spawned. Spawned children re-run the parent's __main__
+    (for the bot, src.spacegirl: a whole second bot with every cog); a main module without a spec or
+    file tells multiprocessing there's nothing to re-run, so workers only import what they use.
+    """
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+class WorkerPool():
+    """
+    Hands synthesis jobs to worker processes, least busy first. Workers that die are replaced,
+    and their in-flight jobs fail instead of hanging.
+    """
+
+    def __init__(self, processes: int = 2, origin: Optional[str] = None, gate: Optional[UpstreamGate] = None):
+        """
+        Args:
+            processes (int): how many worker processes to run
+            origin (Optional[str]): lazypyro origin override for the workers (e.g. a stub server)
+            gate (Optional[UpstreamGate]): the gateway's lazypyro gate, every worker's upstream attempts go
+            through it. Without one, attempts aren't limited at all.
+        """
+        self.processes = max(1, processes)
+        self.origin = origin
+        self.gate = gate
+
+        self._context = multiprocessing.get_context("spawn") # fork doesn't mix with threads/event loops
+        self._workers: list[_Worker] = []
+        self._jobs: Dict[int, asyncio.Future] = dict()
+        self._job_ids = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def from_config(cls, gate: UpstreamGate) -> Optional["WorkerPool"]:
+        """
+        Builds a pool from the "workers" config section
+
+        Args:
+            gate (UpstreamGate): the gateway's lazypyro gate
+
+        Returns:
+            pool (Optional[WorkerPool]): the pool, or None if multi-process mode isn't enabled
+        """
+        config = get_config("workers")
+        if not config.get("enabled", False):
+            return None
+        return cls(processes=config.get("processes", 2), gate=gate)
+
+    def _spawn(self, index: int) -> _Worker:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, transcode.get_ffmpeg_path(), self.origin, self.processes),
+            name=f"tts-worker-{index}",
+            daemon=True
+        )
+        with _bare_main():
+            process.start()
+        child_conn.close() # the child has its own copy
+
+        worker = _Worker(index, process, parent_conn)
+        threading.Thread(target=self._read_results, args=(worker,), name=f"tts-worker-{index}-reader", daemon=True).start()
+        tsprint(f"Started TTS worker process {index} (pid {process.pid})")
+        return worker
+
+    def start(self):
+        "Starts the worker processes, if not already started. Called automatically on first use."
+        if self._workers:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._workers = [self._spawn(index) for index in range(self.processes)]
+
+    def close(self):
+        "Stops every worker process, failing their in-flight jobs. The pool restarts them if it's used again."
+        for worker in self._workers:
+            worker.alive = False
+            worker.conn.close()
+            if self._loop and not self._loop.is_closed():
+                for job_id in list(worker.jobs):
+                    future = self._jobs.get(job_id)
+                    if future and not future.done():
+                        future.set_result(FAILED)
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.kill()
+        self._workers = []
+
+    def _send(self, worker: _Worker, message: tuple):
+        with worker.send_lock:
+            worker.conn.send(message)
+
+    async def synthesize(self, backend_name: str, voice: str, text: str, filepath: str, index: int = 0) -> Result:
+        """
+        Synthesizes one chunk in a worker process, which writes the playback PCM to `filepath`
+
+        Args:
+            backend_name (str): which backend to synthesize with
+            voice (str): the display name of the voice to use
+            text (str): the chunk to speak
+            filepath (str): where the worker should write the PCM
+            index (int): the chunk index
+
+        Returns:
+            result (Result): the return code, the PCM file path if successful, its gain and duration
+        """
+        self.start()
+        workers = [worker for worker in self._workers if worker.alive]
+        if not workers:
+            return FAILED
+        worker = min(workers, key=lambda worker: len(worker.jobs))
+
+        job_id = next(self._job_ids)
+        future = self._loop.create_future()
+        self._jobs[job_id] = future
+        worker.jobs.add(job_id)
+        metrics.inc("workers.jobs")
+        try:
+            self._send(worker, ("synthesize", job_id, backend_name, voice, text, filepath, index))
+            return await future
+        except asyncio.CancelledError:
+            # stop the worker spending upstream/CPU time on a result nobody wants
+            if worker.alive:
+                self._send(worker, ("cancel", job_id))
+            raise
+        except (OSError, ValueError) as e: # broken pipe, closed connection
+            tsprint(f"Could not reach TTS worker {worker.index}: {e}")
+            return FAILED
+        finally:
+            self._jobs.pop(job_id, None)
+            worker.jobs.discard(job_id)
+
+    def _read_results(self, worker: _Worker):
+        "Runs in a thread per worker, handing its messages to the event loop"
+        while True:
+            try:
+                message = worker.conn.recv()
+            except (EOFError, OSError, TypeError): # TypeError: closed under us by `close`
+                try:
+                    self._loop.call_soon_threadsafe(self._worker_died, worker)
+                except RuntimeError:
+                    pass # the loop is already closed, we're shutting down
+                return
+            self._loop.call_soon_threadsafe(self._handle, worker, message)
+
+    def _handle(self, worker: _Worker, message: tuple):
+        kind, *payload = message
+        if kind == "result":
+            job_id, code, path, gain, duration = payload
+            self._resolve(job_id, (TRC(code), path, gain, duration))
+        elif kind == "acquire":
+            self._loop.create_task(self._grant(worker, *payload))
+        elif kind == "settle":
+            self._settle(worker, *payload)
+
+    def _resolve(self, job_id: int, result: Result):
+        future = self._jobs.get(job_id)
+        if future and not future.done():
+            future.set_result(result)
+
+    async def _grant(self, worker: _Worker, request_id: int):
+        "Asks the gateway's gate to let one of a worker's upstream attempts through, and tells the worker"
+        rejected = await self.gate.acquire() if self.gate else None
+        if rejected is None:
+            worker.grants += 1
+        try:
+            self._send(worker, ("grant", request_id, rejected.value if rejected else None))
+        except (OSError, ValueError): # the worker is gone, it'll never settle the attempt
+            if rejected is None:
+                self._settle(worker, "cancel_trial")
+
+    def _settle(self, worker: _Worker, outcome: str):
+        "Applies the outcome of an attempt a worker was let through to the gateway's gate"
+        if worker.grants <= 0:
+            return # already given back when the worker died
+        worker.grants -= 1
+        if self.gate:
+            getattr(self.gate, outcome)()
+
+    def _worker_died(self, worker: _Worker):
+        if not worker.alive:
+            return # closed on purpose
+        worker.alive = False
+        tsprint(f"TTS worker process {worker.index} exited ({worker.process.exitcode}), restarting it")
+        metrics.inc("workers.restarts")
+
+        # its jobs will never be answered, fail them (callers fall back to their error handling)
+        for job_id in list(worker.jobs):
+            future = self._jobs.get(job_id)
+            if future and not future.done():
+                future.set_result(FAILED)
+        # nor will its attempts, give back anything it was let through (e.g. a breaker trial)
+        while worker.grants:
+            self._settle(worker, "cancel_trial")
+
+        self._workers[self._workers.index(worker)] = self._spawn(worker.index)
+
+class _RemoteGate():
+    """
+    A worker process's stand-in for the gateway's `UpstreamGate`: asks the gateway before every upstream
+    attempt, and reports how it went
+    """
+
+    def __init__(self, send):
+        self._send = send
+        self._pending: Dict[int, asyncio.Future] = dict()
+        self._request_ids = itertools.count()
+
+    async def acquire(self) -> Optional[TRC]:
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self._send(("acquire", request_id))
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+    def granted(self, request_id: int, code: Optional[int]):
+        "Handles the gateway's answer to `acquire`"
+        future = self._pending.pop(request_id, None)
+        if future and not future.done():
+            future.set_result(TRC(code) if code is not None else None)
+        elif code is None:
+            # the attempt was cancelled while waiting, give it straight back
+            self.cancel_trial()
+
+    def record_success(self):
+        self._send(("settle", "record_success"))
+
+    def record_failure(self):
+        self._send(("settle", "record_failure"))
+
+    def cancel_trial(self):
+        self._send(("settle", "cancel_trial"))
+
+def _worker_main(conn, ffmpeg_path: str, origin: Optional[str], processes: int):
+    "Entry point of a worker process"
+    transcode.set_ffmpeg_path(ffmpeg_path)
+    asyncio.run(_serve(conn, origin, processes))
+
+async def _serve(conn, origin: Optional[str], processes: int):
+    # imported here: the driver imports this module, and only worker processes need the reverse
+    from src.tts import driver as ttsd
+
+    loop = asyncio.get_running_loop()
+    jobs: Dict[int, asyncio.Task] = dict()
+    closed = asyncio.Event()
+    send_lock = threading.Lock()
+
+    def send(message: tuple):
+        with send_lock:
+            conn.send(message)
+
+    # upstream limits are the gateway's, local ones are this worker's share
+    gate = _RemoteGate(send)
+    ttsd.TIKTOK_BACKEND.client.gate = gate
+    if origin:
+        ttsd.TIKTOK_BACKEND.client.origin = origin
+    GOVERNOR.set_max_workers(GOVERNOR.max_workers // processes)
+    for backend in ttsd.BACKENDS:
+        backend.set_max_concurrency(backend.max_concurrency // processes)
+    backends = {backend.name: backend for backend in ttsd.BACKENDS}
+
+    async def run(job_id: int, backend_name: str, voice: str, text: str, filepath: str, index: int):
+        backend = backends.get(backend_name) or ttsd.VOICE_BACKENDS[voice]
+        try:
+            code, path, gain, duration = await ttsd.synthesize_to_file(
+                backend, text, voice, Trace("worker"), index, filepath
+            )
+            send(("result", job_id, code.value, path, gain, duration))
+        except asyncio.CancelledError:
+            pass # the gateway stopped waiting
+        except Exception as e:
+            tsprint(f"TTS worker job failed: {e!r}")
+            send(("result", job_id, TRC.GENERIC_ERROR.value, None, 1.0, 0.0))
+        finally:
+            jobs.pop(job_id, None)
+
+    def handle(message: tuple):
+        kind, job_id, *payload = message
+        if kind == "synthesize":
+            jobs[job_id] = loop.create_task(run(job_id, *payload))
+        elif kind == "cancel" and job_id in jobs:
+            jobs[job_id].cancel()
+        elif kind == "grant":
+            gate.granted(job_id, *payload)
+
+    def read_jobs():
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                loop.call_soon_threadsafe(closed.set)
+                return
+            loop.call_soon_threadsafe(handle, message)
+
+    threading.Thread(target=read_jobs, name="tts-worker-jobs", daemon=True).start()
+    await closed.wait() # the gateway closing the pipe is the signal to exit
+
+    for task in list(jobs.values()):
+        task.cancel()
+    await ttsd.TIKTOK_BACKEND.client.close()
@@ -0,0 +1,72 @@
+"""
+Circuit breaker, so calls to an upstream that's down fail fast instead of piling up
+"""
+
+# built-in
+from enum import Enum
+import time
+
+class BreakerState(Enum):
+    CLOSED = 0 # healthy, calls go through
+    OPEN = 1 # failing, calls are rejected
+    HALF_OPEN = 2 # cooling off is over, one trial call at a time goes through
+
+class CircuitBreaker():
+    """
+    Opens after `failure_threshold` consecutive failures, rejects calls for `reset_timeout` seconds,
+    then lets a trial call through: success closes it again, failure reopens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        "True while calls would be rejected (without claiming a trial call)"
+        return self.state == BreakerState.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        """
+        Checks whether a call may go through right now
+
+        Returns:
+            allowed (bool): True if the call should be made
+        """
+        if self.state == BreakerState.CLOSED:
+            return True
+
+        if self.state == BreakerState.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = BreakerState.HALF_OPEN
+
+        # half open: only one trial call at a time
+        if self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def cancel_trial(self):
+        "Gives back a trial call that ended up not being made (or was cancelled)"
+        self._trial_in_flight = False
+
+    def record_success(self):
+        "Records a successful call, closing the breaker"
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        "Records a failed call, opening the breaker if there have been too many"
+        self.failures += 1
+        self._trial_in_flight = False
+
+        if self.state == BreakerState.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = BreakerState.OPEN
+            self.opened_at = time.monotonic()
@@ -0,0 +1,55 @@
+"""
+Optional bot configuration, read from config/bot.json.
+Every key is optional; a missing file or section just means "use the defaults".
+
+Example:
+    {
+        "tracing": {"enabled": true, "path": "traces.jsonl"},
+        "loop_monitor": {"enabled": true, "interval_ms": 50, "threshold_ms": 100},
+        "ffmpeg_governor": {"workers_per_cpu": 1, "max_workers": 8},
+        "playback": {"mode": "overlap", "max_lanes": 3, "lane_gain": 0.7},
+        "adaptive_speed": {"enabled": true, "threshold_s": 30, "max_speed": 1.5, "step": 0.25},
+        "loudness": {"enabled": true, "target_db": -20, "max_gain_db": 12},
+        "voice": {"idle_disconnect_s": 900, "empty_leave_s": 30},
+        "guild_state": {"reclaim_after_s": 600},
+        "sharding": {"shard_count": 2},
+        "workers": {"enabled": true, "processes": 4},
+        "hedging": {"enabled": true, "mirrors": ["https://mirror.example"], "percentile": 95,
+                    "min_delay_ms": 250, "max_delay_ms": 3000, "failover_to_tone": false},
+        "queue_journal": {"enabled": true},
+        "janitor": {"enabled": true, "interval_s": 300, "quota_mb": 1024, "grace_s": 600},
+        "auto_tts": {"enabled": true, "window_ms": 1500, "max_wait_ms": 5000, "max_chars": 600, "duplicate_window_s": 10,
+                     "default_voice": "Jessie"},
+        "admission": {"user_per_min": 6, "user_burst": 3, "guild_per_min": 30, "guild_burst": 10,
+                      "global_per_min": 600, "global_burst": 100}
+    }
+"""
+
+# built-in
+import json
+import os
+
+CONFIG_PATH = os.path.join("config", "bot.json")
+
+_CONFIG_CACHE: dict | None = None
+
+def get_config(section: str) -> dict:
+    """
+    Gets a section of the bot config, loading the config file on first use
+
+    Args:
+        section (str): the top-level key to get
+
+    Returns:
+        config (dict): the section's settings, empty if not present
+    """
+    global _CONFIG_CACHE
+
+    if _CONFIG_CACHE is None:
+        try:
+            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+                _CONFIG_CACHE = json.load(f)
+        except FileNotFoundError:
+            _CONFIG_CACHE = {}
+
+    return _CONFIG_CACHE.get(section) or {}
@@ -50,4 +50,44 @@ async def get_random_app_emoji(bot: discord.Bot, search: str) -> AppEmoji:
         return random_selection
     else:
         tsprint(f"No app emoji found containing {search} (case-insensitive)")
-        return None
\ No newline at end of file
+        return None
+
+def expand_mentions(text: str, guild: discord.Guild) -> str:
+    """
+    Translates raw user, role and channel mentions into readable names
+
+    ## Args:
+    - `text` (str): the text containing mentions
+    - `guild` (discord.Guild): the guild to look the mentioned users, roles and channels up in
+
+    ## Returns:
+    - `text` (str): the text with mentions replaced by names
+    """
+    # translate raw user mentions to nicknames (display_name falls back to the global name),
+    # members that aren't cached (or have left) are just "someone"
+    raw_mentions = discord.utils.raw_mentions(text)
+    for user_id in raw_mentions:
+        member = guild.get_member(user_id)
+        name = member.display_name if member else "someone"
+        # <@!id> is the legacy nickname mention format
+        text = text.replace(f"<@{user_id}>", "@" + name).replace(f"<@!{user_id}>", "@" + name)
+    
+    # translate raw role mentions to role names
+    raw_mentions = discord.utils.raw_role_mentions(text)
+    for role_id in raw_mentions:
+        role = guild.get_role(role_id)
+        text = text.replace(
+            f"<@&{role_id}>",
+            "@" + (role.name if role else "some role")
+        )
+    
+    # translate raw channel mentions to channel names
+    raw_mentions = discord.utils.raw_channel_mentions(text)
+    for channel_id in raw_mentions:
+        channel = guild.get_channel(channel_id)
+        text = text.replace(
+            f"<#{channel_id}>",
+            "#" + (channel.name.replace("-", " ") if channel else "some channel")
+        )
+
+    return text
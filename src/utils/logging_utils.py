@@ -8,7 +8,13 @@ from datetime import datetime
 from pathlib import Path
 
 LOG_FILE = Path("../program.log")
-LOG_FILE.open("w", encoding="utf-8").close()
+
+def reset_log():
+    """
+    Empties the log file, for a fresh log per run. Only the bot's own process calls this at startup:
+    worker processes import this module too, and log into the same file.
+    """
+    LOG_FILE.open("w", encoding="utf-8").close()
 
 def timestamp_print(message: str, log: bool = True):
     """
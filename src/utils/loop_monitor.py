@@ -0,0 +1,121 @@
+"""
+Opt-in watchdog for the event loop.
+A heartbeat task measures how late the loop schedules it (loop lag), and a watchdog thread
+captures the loop thread's stack whenever a single callback holds the loop past the threshold,
+so blocking calls show up in the log and metrics instead of as stuttering audio.
+"""
+
+# built-in
+from collections import deque
+from typing import Deque, Optional
+import asyncio
+import sys
+import threading
+import time
+import traceback
+
+# my modules
+from . import metrics
+from .config import get_config
+from .logging_utils import timestamp_print as tsprint
+
+class LoopLagMonitor():
+    """
+    Measures event loop lag and reports blocking callbacks. Call `start` from inside the loop.
+    """
+
+    def __init__(self, interval: float = 0.05, threshold: float = 0.1):
+        self.interval = interval
+        self.threshold = threshold
+        self.running = False
+
+        # most recent blocking stacks, newest last
+        self.blocking_stacks: Deque[str] = deque(maxlen=20)
+
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.perf_counter()
+        self._beat_id = 0
+        self._reported_beat_id = -1
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls) -> Optional["LoopLagMonitor"]:
+        """
+        Builds a monitor from the "loop_monitor" config section
+
+        Returns:
+            monitor (Optional[LoopLagMonitor]): the monitor, or None if it isn't enabled
+        """
+        config = get_config("loop_monitor")
+        if not config.get("enabled", False):
+            return None
+
+        return cls(
+            interval=config.get("interval_ms", 50) / 1000,
+            threshold=config.get("threshold_ms", 100) / 1000
+        )
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """
+        Starts the heartbeat task and the watchdog thread, if not already running
+
+        Args:
+            loop (asyncio.AbstractEventLoop): the loop to monitor, must be the running loop
+        """
+        if self.running:
+            return
+
+        tsprint(f"Starting loop lag monitor (threshold {self.threshold * 1000:.0f}ms)...")
+        self.running = True
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+
+        self._task = loop.create_task(self._heartbeat())
+        threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True).start()
+
+    def stop(self):
+        "Stops the heartbeat task and the watchdog thread"
+        self.running = False
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        """
+        Sleeps for the interval and records how much later than requested the loop woke us
+        """
+        while self.running:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+
+            now = time.perf_counter()
+            lag = max(0.0, now - expected)
+            self._last_beat = now
+            self._beat_id += 1
+
+            metrics.observe("loop.lag_ms", lag * 1000)
+            if lag > self.threshold:
+                metrics.inc("loop.lag_over_threshold")
+
+    def _watchdog(self):
+        """
+        Runs in its own thread. If the heartbeat is overdue, the loop is blocked right now,
+        so grab the loop thread's current stack (once per stall).
+        """
+        while self.running:
+            time.sleep(self.interval)
+
+            stalled_for = time.perf_counter() - self._last_beat - self.interval
+            beat_id = self._beat_id
+            if stalled_for <= self.threshold or beat_id == self._reported_beat_id:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+
+            self._reported_beat_id = beat_id
+            stack = "".join(traceback.format_stack(frame))
+            self.blocking_stacks.append(stack)
+            metrics.inc("loop.blocking_stalls")
+
+            tsprint(f"Event loop blocked for {stalled_for * 1000:.0f}ms+, loop thread is at:\n{stack}")
@@ -0,0 +1,96 @@
+"""
+Tiny in-process metrics registry: counters, gauges and sample histograms.
+Safe to use from the event loop and from audio/worker threads.
+"""
+
+# built-in
+from collections import deque
+from typing import Deque, Dict
+import threading
+
+HISTOGRAM_SAMPLES = 1024 # how many recent samples each histogram keeps
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = dict()
+_gauges: Dict[str, float] = dict()
+_histograms: Dict[str, Deque[float]] = dict()
+
+def inc(name: str, amount: float = 1):
+    """
+    Increments a counter
+
+    Args:
+        name (str): the counter to increment
+        amount (float): how much to increment by
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def set_gauge(name: str, value: float):
+    """
+    Sets a gauge to a value
+
+    Args:
+        name (str): the gauge to set
+        value (float): the value to set it to
+    """
+    with _lock:
+        _gauges[name] = value
+
+def observe(name: str, value: float):
+    """
+    Records a sample in a histogram, only the most recent samples are kept
+
+    Args:
+        name (str): the histogram to record in
+        value (float): the sample
+    """
+    with _lock:
+        if name not in _histograms:
+            _histograms[name] = deque(maxlen=HISTOGRAM_SAMPLES)
+        _histograms[name].append(value)
+
+def percentile(name: str, pct: float) -> float | None:
+    """
+    Gets a percentile of a histogram's recent samples
+
+    Args:
+        name (str): the histogram to check
+        pct (float): the percentile, from 0 to 100
+
+    Returns:
+        value (float | None): the percentile, or None if there are no samples
+    """
+    with _lock:
+        samples = sorted(_histograms.get(name, ()))
+
+    if not samples:
+        return None
+
+    index = min(len(samples) - 1, int(len(samples) * pct / 100))
+    return samples[index]
+
+def snapshot() -> dict:
+    """
+    Gets a copy of every metric
+
+    Returns:
+        metrics (dict): counters and gauges as-is, histograms summarized as count/p50/p99/max
+    """
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        names = list(_histograms)
+
+    histograms = {}
+    for name in names:
+        with _lock:
+            samples = list(_histograms[name])
+        histograms[name] = {
+            "count": len(samples),
+            "p50": percentile(name, 50),
+            "p99": percentile(name, 99),
+            "max": max(samples) if samples else None
+        }
+
+    return {"counters": counters, "gauges": gauges, "histograms": histograms}
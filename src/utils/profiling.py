@@ -0,0 +1,111 @@
+"""
+On-demand profiling of the live bot: a sampling CPU profiler and a tracemalloc snapshot diff.
+Both run for a fixed window without restarting anything, and produce plain-text reports.
+"""
+
+# built-in
+from collections import Counter
+import asyncio
+import sys
+import threading
+import time
+import tracemalloc
+
+def _frame_key(frame) -> str:
+    "Formats a frame as function (file:line of the function definition)"
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+def _sample_threads(seconds: float, interval: float) -> tuple[Counter, Counter, int]:
+    """
+    Samples every thread's stack (except this one) for `seconds`
+
+    Returns:
+        own (Counter): samples where the function was on top of the stack
+        cumulative (Counter): samples where the function was anywhere on the stack
+        total (int): number of thread stacks sampled
+    """
+    own = Counter()
+    cumulative = Counter()
+    total = 0
+    sampler_id = threading.get_ident()
+
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == sampler_id:
+                continue
+
+            total += 1
+            own[_frame_key(frame)] += 1
+
+            # count each function once per stack, so recursion doesn't inflate it
+            seen = set()
+            while frame is not None:
+                key = _frame_key(frame)
+                if key not in seen:
+                    seen.add(key)
+                    cumulative[key] += 1
+                frame = frame.f_back
+        time.sleep(interval)
+
+    return own, cumulative, total
+
+async def profile_cpu(seconds: float, top: int = 30, interval: float = 0.005) -> str:
+    """
+    Runs a sampling CPU profile over every thread in the process
+
+    Args:
+        seconds (float): how long to sample for
+        top (int): how many functions to list
+        interval (float): seconds between samples
+
+    Returns:
+        report (str): the top functions by own and cumulative samples
+    """
+    own, cumulative, total = await asyncio.to_thread(_sample_threads, seconds, interval)
+    total = max(total, 1)
+
+    lines = [f"Sampling CPU profile: {seconds}s, {total} stack samples every {interval * 1000:.0f}ms", ""]
+    for title, counter in (("Own samples (on top of stack)", own), ("Cumulative samples (anywhere on stack)", cumulative)):
+        lines.append(title)
+        for key, count in counter.most_common(top):
+            lines.append(f"{count:>8} {count / total:>7.1%}  {key}")
+        lines.append("")
+
+    return "\n".join(lines)
+
+async def profile_memory(seconds: float, top: int = 30) -> str:
+    """
+    Diffs two tracemalloc snapshots taken `seconds` apart
+
+    Args:
+        seconds (float): how long to wait between snapshots
+        top (int): how many allocation sites to list
+
+    Returns:
+        report (str): the top allocation sites by size growth
+    """
+    # only stop tracing afterwards if we're the ones who started it
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(10)
+
+    try:
+        before = tracemalloc.take_snapshot()
+        await asyncio.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+
+    stats = after.compare_to(before, "lineno")
+
+    lines = [
+        f"tracemalloc diff: {seconds}s, traced {current / 1024:.1f} KiB now, {peak / 1024:.1f} KiB peak",
+        ""
+    ]
+    lines += [str(stat) for stat in stats[:top]]
+
+    return "\n".join(lines)
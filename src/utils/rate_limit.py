@@ -0,0 +1,174 @@
+"""
+Token-bucket rate limiting, for upstream calls and for admission control
+"""
+
+# built-in
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional
+import asyncio
+import time
+
+# my modules
+from src.utils import metrics
+from src.utils.config import get_config
+
+class TokenBucket():
+    """
+    Holds up to `capacity` tokens, refilled at `rate` tokens per second.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """
+        Takes tokens if they're available right now, never waits
+
+        Args:
+            tokens (float): how many tokens to take
+
+        Returns:
+            acquired (bool): True if the tokens were taken
+        """
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def refund(self, tokens: float = 1):
+        """
+        Gives back tokens taken by `try_acquire` for work that didn't happen after all
+
+        Args:
+            tokens (float): how many tokens to give back
+        """
+        self.tokens = min(self.capacity, self.tokens + tokens)
+
+    def is_full(self) -> bool:
+        "Whether the bucket has refilled completely (i.e. is no different from a new one)"
+        self._refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self, max_wait: float) -> bool:
+        """
+        Takes one token, waiting for it if it'll be available within `max_wait` seconds.
+        Waiters are served in order.
+
+        Args:
+            max_wait (float): the longest we're willing to wait
+
+        Returns:
+            acquired (bool): True if a token was taken, False if it'd take too long
+        """
+        async with self._lock:
+            if self.try_acquire():
+                return True
+
+            wait = (1 - self.tokens) / self.rate
+            if wait > max_wait:
+                return False
+
+            await asyncio.sleep(wait)
+            self._refill()
+            self.tokens -= 1
+            return True
+
+@dataclass(frozen=True)
+class AdmissionLimits():
+    "How often a guild's users (each) and the guild as a whole may request TTS"
+    user_per_min: float = 6
+    user_burst: float = 3
+    guild_per_min: float = 30
+    guild_burst: float = 10
+
+class AdmissionControl():
+    """
+    Token buckets per user (per guild), per guild and for the whole bot. A request is admitted only
+    if every level has a token, so one user looping can't use up their guild's share, and one guild
+    can't use up everyone's. Checking never waits and never touches the network or the database.
+    """
+
+    MAX_BUCKETS = 10000 # idle buckets are dropped past this many
+
+    def __init__(self, defaults: AdmissionLimits, global_per_min: float = 600, global_burst: float = 100):
+        """
+        Args:
+            defaults (AdmissionLimits): limits for guilds that haven't set their own
+            global_per_min (float): requests per minute across every guild
+            global_burst (float): how many requests the whole bot may take at once
+        """
+        self.defaults = defaults
+        self.global_bucket = TokenBucket(global_per_min / 60, global_burst)
+        self._users: Dict[Hashable, TokenBucket] = dict()
+        self._guilds: Dict[int, TokenBucket] = dict()
+
+    @classmethod
+    def from_config(cls) -> "AdmissionControl":
+        """
+        Builds admission control from the "admission" config section
+
+        Returns:
+            admission (AdmissionControl): the admission control
+        """
+        config = get_config("admission")
+        fallback = AdmissionLimits()
+        defaults = AdmissionLimits(
+            user_per_min=config.get("user_per_min", fallback.user_per_min),
+            user_burst=config.get("user_burst", fallback.user_burst),
+            guild_per_min=config.get("guild_per_min", fallback.guild_per_min),
+            guild_burst=config.get("guild_burst", fallback.guild_burst)
+        )
+        return cls(defaults, config.get("global_per_min", 600), config.get("global_burst", 100))
+
+    def _bucket(self, buckets: Dict, key: Hashable, per_min: float, burst: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None or bucket.capacity != burst or bucket.rate != per_min / 60:
+            # new, or the guild's limits changed
+            if len(buckets) >= self.MAX_BUCKETS:
+                for idle in [key for key, bucket in buckets.items() if bucket.is_full()]:
+                    del buckets[idle]
+            bucket = buckets[key] = TokenBucket(per_min / 60, burst)
+        return bucket
+
+    def admit(self, guild_id: int, user_id: int, limits: Optional[AdmissionLimits] = None) -> Optional[str]:
+        """
+        Takes a token at every level if all of them have one
+
+        Args:
+            guild_id (int): the guild the request is in
+            user_id (int): who made it
+            limits (Optional[AdmissionLimits]): the guild's limits, defaults to `defaults`
+
+        Returns:
+            rejected_by (Optional[str]): None if admitted, otherwise which level was out of tokens
+            ("user", "guild" or "global")
+        """
+        limits = limits or self.defaults
+        levels = (
+            ("user", self._bucket(self._users, (guild_id, user_id), limits.user_per_min, limits.user_burst)),
+            ("guild", self._bucket(self._guilds, guild_id, limits.guild_per_min, limits.guild_burst)),
+            ("global", self.global_bucket)
+        )
+
+        taken: list[TokenBucket] = []
+        for level, bucket in levels:
+            if not bucket.try_acquire():
+                # a rejected request doesn't count against the other levels
+                for earlier in taken:
+                    earlier.refund()
+                metrics.inc(f"admission.rejected.{level}")
+                return level
+            taken.append(bucket)
+
+        metrics.inc("admission.admitted")
+        return None
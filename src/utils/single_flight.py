@@ -0,0 +1,63 @@
+"""
+Single-flight: coalesces identical concurrent async calls, so only the first caller does the work
+and everyone else awaits its result. Once every caller has given up, the work is cancelled too.
+"""
+
+# built-in
+from typing import Any, Awaitable, Callable, Dict, Hashable
+import asyncio
+
+class SingleFlight():
+    """
+    Tracks in-flight calls by key. The work runs in its own task, so a caller being cancelled
+    doesn't cancel the result other callers are waiting on; only the last caller giving up does.
+    """
+
+    def __init__(self):
+        # maps key -> task doing the work
+        self._in_flight: Dict[Hashable, asyncio.Task] = dict()
+        # maps task -> how many callers are still waiting on it
+        self._waiters: Dict[asyncio.Task, int] = dict()
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """
+        Runs `factory()` unless a call with the same key is already in flight, in which case
+        its result is awaited instead
+
+        Args:
+            key (Hashable): identifies identical calls
+            factory (Callable[[], Awaitable]): starts the work, only called by the first caller
+
+        Returns:
+            result (Any): the work's result (exceptions are re-raised to every caller)
+            shared (bool): True if this caller piggybacked on another caller's work
+        """
+        task = self._in_flight.get(key)
+        shared = task is not None
+
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+
+            def forget(done: asyncio.Task):
+                if self._in_flight.get(key) is done:
+                    del self._in_flight[key]
+            task.add_done_callback(forget)
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task), shared
+        except asyncio.CancelledError:
+            if self._waiters[task] == 1 and not task.done():
+                # nobody wants the result anymore: stop the work, and let the next identical call start afresh
+                task.cancel()
+                if self._in_flight.get(key) is task:
+                    del self._in_flight[key]
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
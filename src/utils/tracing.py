@@ -0,0 +1,218 @@
+"""
+Per-request tracing for TTS.
+Each /tts invocation carries a Trace, and every stage it goes through (normalization, synthesis,
+enqueue, queue wait, ffmpeg startup, playback) records a timed span on it.
+Finished traces are exported as JSON lines (one span per line) when tracing is enabled in config.
+Traces finish on the event loop and the audio thread, so the file is written by a background thread.
+"""
+
+# built-in
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+import atexit
+import json
+import queue
+import threading
+import time
+import uuid
+
+# my modules
+from .config import get_config
+from .logging_utils import timestamp_print as tsprint
+
+# serialized traces waiting for the writer thread, None stops it
+_EXPORT_QUEUE: queue.Queue = queue.Queue()
+_EXPORT_LOCK = threading.Lock()
+_export_thread: Optional[threading.Thread] = None
+
+class Span():
+    "A single timed stage of a trace"
+
+    def __init__(self, trace: "Trace", name: str, attrs: dict, start: Optional[float] = None):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.start = start if start is not None else time.perf_counter()
+        self.end: Optional[float] = None
+
+    def finish(self, **attrs):
+        """
+        Ends the span, optionally attaching more attributes
+
+        Args:
+            attrs: extra attributes to record on the span
+        """
+        self.attrs.update(attrs)
+        self.end = time.perf_counter()
+
+    def to_dict(self) -> dict:
+        """
+        Converts the span to a JSON-serializable dict
+
+        Returns:
+            span (dict): the span's trace ID, name, offset and duration (ms) and attributes
+        """
+        end = self.end if self.end is not None else time.perf_counter()
+        return {
+            "trace_id": self.trace.trace_id,
+            "name": self.name,
+            "offset_ms": round((self.start - self.trace.start) * 1000, 3),
+            "duration_ms": round((end - self.start) * 1000, 3),
+            **self.attrs
+        }
+
+class Trace():
+    """
+    Holds all spans for one TTS request.
+    Queued clips `hold` the trace open, and it's exported once every clip has been `release`d.
+    """
+
+    def __init__(self, name: str, **attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+        self.spans: list[Span] = []
+
+        self._pending = 0
+        self._finished = False
+        self._lock = threading.Lock()
+
+    def start_span(self, name: str, start: Optional[float] = None, **attrs) -> Span:
+        """
+        Starts a span that has to be finished manually (for stages that cross callbacks)
+
+        Args:
+            name (str): the name of the stage
+            start (Optional[float]): a `time.perf_counter()` start time, if the stage started earlier
+            attrs: attributes to record on the span
+
+        Returns:
+            span (Span): the started span
+        """
+        span = Span(self, name, attrs, start)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """
+        Times the enclosed block as a span
+
+        Args:
+            name (str): the name of the stage
+            attrs: attributes to record on the span
+        """
+        span = self.start_span(name, **attrs)
+        try:
+            yield span
+        except BaseException as e:
+            span.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            span.finish()
+
+    def hold(self):
+        "Marks one more clip as depending on this trace"
+        with self._lock:
+            self._pending += 1
+
+    def release(self):
+        "Marks one clip as done, finishing the trace once no clips remain"
+        with self._lock:
+            self._pending -= 1
+            done = self._pending <= 0
+        if done:
+            self.finish()
+
+    def finish(self, **attrs):
+        """
+        Finishes the trace and exports it. Only the first call does anything.
+
+        Args:
+            attrs: extra attributes to record on the trace (e.g. the return code)
+        """
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+            self.attrs.update(attrs)
+
+        export_trace(self)
+
+    def to_lines(self) -> list[str]:
+        """
+        Serializes the trace as JSON lines: one summary line, then one line per span
+
+        Returns:
+            lines (list[str]): the JSON lines, without newlines
+        """
+        summary = {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 3),
+            **self.attrs
+        }
+        lines = [json.dumps(summary, default=str)]
+        lines += [json.dumps(span.to_dict(), default=str) for span in self.spans]
+        return lines
+
+def export_trace(trace: Trace):
+    """
+    Queues a finished trace to be appended to the trace file, if tracing is enabled. Never blocks on
+    the disk, the writer thread does that.
+
+    Args:
+        trace (Trace): the trace to export
+    """
+    global _export_thread
+
+    config = get_config("tracing")
+    if not config.get("enabled", False):
+        return
+
+    # serialized now, so the trace's duration is when it finished, not when it's written
+    _EXPORT_QUEUE.put((Path(config.get("path", "traces.jsonl")), trace.to_lines()))
+    with _EXPORT_LOCK:
+        if _export_thread is None:
+            _export_thread = threading.Thread(target=_write_loop, name="trace-export", daemon=True)
+            _export_thread.start()
+
+def _write_loop():
+    running = True
+    while running:
+        batch = [_EXPORT_QUEUE.get()]
+        # take whatever else piled up meanwhile, so a burst is one write per file
+        while True:
+            try:
+                batch.append(_EXPORT_QUEUE.get_nowait())
+            except queue.Empty:
+                break
+
+        if None in batch:
+            running = False
+        by_path: dict[Path, list[str]] = dict()
+        for path, lines in filter(None, batch):
+            by_path.setdefault(path, []).extend(lines)
+
+        for path, lines in by_path.items():
+            try:
+                with path.open("a", encoding="utf-8") as file:
+                    file.write("\n".join(lines) + "\n")
+            except Exception as e:
+                tsprint(f"Failed to export {len(lines)} trace line(s) to {path}: {e}")
+
+@atexit.register
+def flush_traces():
+    "Writes every queued trace and stops the writer thread (run at exit, so traces aren't lost)"
+    global _export_thread
+
+    with _EXPORT_LOCK:
+        thread, _export_thread = _export_thread, None
+    if thread and thread.is_alive():
+        _EXPORT_QUEUE.put(None)
+        thread.join(timeout=10)
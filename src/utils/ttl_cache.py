@@ -0,0 +1,69 @@
+"""
+Bounded cache whose entries expire after a fixed time-to-live
+"""
+
+# built-in
+from collections import OrderedDict
+from typing import Any, Hashable
+import time
+
+_MISSING = object()
+
+class TTLCache():
+    """
+    Least-recently-set entries are evicted once `maxsize` is reached, and entries older
+    than `ttl` seconds are treated as missing.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # maps key -> (expiry time, value), oldest first
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Gets a live entry
+
+        Args:
+            key (Hashable): the key to look up
+            default (Any): returned if the key is missing or expired
+
+        Returns:
+            value (Any): the cached value, or `default`
+        """
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return default
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Sets an entry, evicting the oldest entries if the cache is full
+
+        Args:
+            key (Hashable): the key to set
+            value (Any): the value to cache
+        """
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        """
+        Drops an entry, if present (e.g. once the value it caches has changed)
+
+        Args:
+            key (Hashable): the key to drop
+        """
+        self._entries.pop(key, None)
@@ -0,0 +1,160 @@
+"""
+Per-guild runtime state, allocated only once a guild actually uses voice/TTS.
+Everything the bot tracks for a guild lives in one compact `__slots__` record, and records for
+guilds that have gone quiet are reclaimed, so memory scales with active guilds rather than with
+every guild the bot is in.
+"""
+
+# built-in
+from collections import deque
+from typing import Deque, Dict, Iterator, Optional
+import asyncio
+import time
+
+# pycord
+import discord
+
+# my modules
+from src.tts.queue_item import QueueItem
+from src.utils import metrics
+from src.utils.config import get_config
+from src.utils.tracing import Trace
+
+class GuildState():
+    "Everything tracked for one active guild"
+
+    __slots__ = (
+        "guild_id",
+        "vc",                     # Optional[discord.VoiceClient]
+        "last_triggered_channel", # Optional[int], text channel that last triggered the bot
+        "connection",             # ConnectionState, see vc_state
+        "lock",                   # Optional[asyncio.Lock], serializes connects/moves/disconnects
+        "idle_timer",             # Optional[asyncio.TimerHandle], pending idle disconnect
+        "occupied_channel",       # Optional[int], voice channel whose humans are being counted
+        "humans",                 # int, non-bot members in that channel, kept up to date from voice events
+        "empty_timer",            # Optional[asyncio.TimerHandle], pending leave of an empty channel
+        "queues",                 # Optional[Dict[str, Deque[QueueItem]]], voice -> clips waiting
+        "stream",                 # the guild's audio stream, once it has played something
+        "preparing",              # Optional[asyncio.Task], clip being sped up before it's streamed
+        "downloads",              # Optional[Dict[asyncio.Task, tuple[author_id, Trace]]], requests still synthesizing
+        "last_active"             # time.monotonic() of the last use
+    )
+
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        self.vc: Optional[discord.VoiceClient] = None
+        self.last_triggered_channel: Optional[int] = None
+        self.connection = None
+        self.lock: Optional[asyncio.Lock] = None
+        self.idle_timer: Optional[asyncio.TimerHandle] = None
+        self.occupied_channel: Optional[int] = None
+        self.humans = 0
+        self.empty_timer: Optional[asyncio.TimerHandle] = None
+        self.queues: Optional[Dict[str, Deque[QueueItem]]] = None
+        self.stream = None
+        self.preparing: Optional[asyncio.Task] = None
+        self.downloads: Optional[Dict[asyncio.Task, tuple[Optional[int], Trace]]] = None
+        self.last_active = time.monotonic()
+
+    def queue(self, voice: str) -> Deque[QueueItem]:
+        """
+        Gets the queue for a voice, creating it on first use
+
+        Args:
+            voice (str): the voice's display name
+
+        Returns:
+            queue (Deque[QueueItem]): the voice's queue
+        """
+        if self.queues is None:
+            self.queues = dict()
+        queue = self.queues.get(voice)
+        if queue is None:
+            queue = self.queues[voice] = deque()
+        return queue
+
+    def queued_items(self) -> int:
+        "How many clips are waiting across every voice"
+        return sum(len(queue) for queue in self.queues.values()) if self.queues else 0
+
+    def is_idle(self) -> bool:
+        "Whether nothing is connected, queued, playing or in progress, so the record can be dropped"
+        return (
+            self.vc is None
+            and not self.queued_items()
+            and (self.stream is None or not self.stream.has_audio())
+            and self.preparing is None
+            and not self.downloads
+            and self.idle_timer is None
+            and self.empty_timer is None
+            and (self.lock is None or not self.lock.locked())
+        )
+
+class GuildRegistry():
+    "Holds the state records of active guilds"
+
+    def __init__(self, reclaim_after: Optional[float] = None):
+        """
+        Args:
+            reclaim_after (Optional[float]): seconds a guild must be idle before its record is dropped,
+            defaults to the "guild_state" config section's `reclaim_after_s`
+        """
+        self._guilds: Dict[int, GuildState] = dict()
+
+        if reclaim_after is None:
+            reclaim_after = get_config("guild_state").get("reclaim_after_s", 600)
+        self.reclaim_after = reclaim_after
+
+    def get(self, guild_id: int) -> Optional[GuildState]:
+        """
+        Gets a guild's record without creating one
+
+        Args:
+            guild_id (int): the guild to look up
+
+        Returns:
+            state (Optional[GuildState]): the record, or None if the guild isn't active
+        """
+        return self._guilds.get(guild_id)
+
+    def get_or_create(self, guild_id: int) -> GuildState:
+        """
+        Gets a guild's record, creating it if the guild wasn't active, and marks it used
+
+        Args:
+            guild_id (int): the guild to look up
+
+        Returns:
+            state (GuildState): the record
+        """
+        state = self._guilds.get(guild_id)
+        if state is None:
+            state = self._guilds[guild_id] = GuildState(guild_id)
+        state.last_active = time.monotonic()
+        return state
+
+    def __iter__(self) -> Iterator[GuildState]:
+        # copied, so records can be added or reclaimed while iterating
+        return iter(list(self._guilds.values()))
+
+    def __len__(self) -> int:
+        return len(self._guilds)
+
+    def reclaim(self) -> int:
+        """
+        Drops the records of guilds that have been idle for `reclaim_after` seconds
+
+        Returns:
+            reclaimed (int): how many records were dropped
+        """
+        cutoff = time.monotonic() - self.reclaim_after
+        stale = [
+            guild_id for guild_id, state in self._guilds.items()
+            if state.last_active < cutoff and state.is_idle()
+        ]
+        for guild_id in stale:
+            del self._guilds[guild_id]
+
+        if stale:
+            metrics.inc("guilds.reclaimed", len(stale))
+        return len(stale)
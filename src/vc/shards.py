@@ -0,0 +1,202 @@
+"""
+Per-shard voice/TTS state for running as an AutoShardedBot.
+Each shard gets its own guild registry, VC state, TTS queues and playback worker, so no single task
+iterates every guild, and shard-level latency/queue metrics show where load is piling up.
+"""
+
+# built-in
+from typing import Deque, Dict, Iterator, Optional
+import asyncio
+import os
+
+# pycord
+import discord
+
+# my modules
+from src.audio import transcode
+from src.tts import storage
+from src.tts.queue_item import QueueItem
+from src.tts.tts_core import TTSManager, TTSBackgroundTask, release_item
+from src.utils import metrics
+from src.utils.logging_utils import timestamp_print as tsprint
+from src.vc.guild_state import GuildRegistry
+from src.vc.vc_state import VCState
+
+class Shard():
+    "Everything voice-related for the guilds on one shard"
+
+    def __init__(self, shard_id: int):
+        self.shard_id = shard_id
+        self.guilds = GuildRegistry()
+        self.vc_state = VCState(self.guilds)
+        self.tts_manager = TTSManager(guilds=self.guilds)
+        self.bg_task = TTSBackgroundTask(guilds=self.guilds)
+
+    def report_metrics(self, latency: Optional[float]):
+        """
+        Publishes this shard's gauges
+
+        Args:
+            latency (Optional[float]): the shard's gateway latency in seconds, if known
+        """
+        prefix = f"shard.{self.shard_id}"
+        if latency is not None:
+            metrics.set_gauge(f"{prefix}.latency_ms", latency * 1000)
+        metrics.set_gauge(f"{prefix}.guilds_active", len(self.guilds))
+        metrics.set_gauge(f"{prefix}.voice_connections", sum(1 for _ in self.vc_state.connected()))
+        metrics.set_gauge(f"{prefix}.queue_depth", sum(state.queued_items() for state in self.guilds))
+
+    def live_files(self) -> set[str]:
+        """
+        Gets every clip file this shard still needs: queued, being sped up, or in a stream
+
+        Returns:
+            files (set[str]): paths relative to downloads/
+        """
+        files = {item.filename for item in self.bg_task.preparing_items.values()}
+        for state in self.guilds:
+            for queue in (state.queues or {}).values():
+                files.update(item.filename for item in queue)
+            if state.stream:
+                for clip in state.stream.clips():
+                    files.update(os.path.relpath(path, storage.DOWNLOADS_DIR) for path in clip.paths)
+        return files
+
+class ShardRouter():
+    """
+    Maps guilds to their shard's state, creating shards (and starting their playback workers) on first use
+    """
+
+    METRICS_INTERVAL = 15 # seconds between shard metric reports
+
+    def __init__(self, bot: discord.Bot):
+        self.bot = bot
+        self.running = False
+        self._shards: Dict[int, Shard] = dict()
+        self._metrics_task: Optional[asyncio.Task] = None
+        self._janitor_task: Optional[asyncio.Task] = None
+        self.janitor = storage.Janitor.from_config()
+
+        # shards are created lazily, so check for ffmpeg now rather than on the first /tts
+        transcode.get_ffmpeg_path()
+
+    @property
+    def shard_count(self) -> int:
+        return self.bot.shard_count or 1
+
+    def shard_id_for(self, guild_id: int) -> int:
+        """
+        Works out which shard a guild is on (the same formula Discord uses)
+
+        Args:
+            guild_id (int): the guild to look up
+
+        Returns:
+            shard_id (int): the guild's shard
+        """
+        return (guild_id >> 22) % self.shard_count
+
+    def for_guild(self, guild_id: int) -> Shard:
+        """
+        Gets the state of the shard a guild is on
+
+        Args:
+            guild_id (int): the guild to look up
+
+        Returns:
+            shard (Shard): the guild's shard
+        """
+        shard_id = self.shard_id_for(guild_id)
+        shard = self._shards.get(shard_id)
+        if shard is None:
+            shard = self._shards[shard_id] = Shard(shard_id)
+            if self.running:
+                shard.bg_task.start(self.bot, shard.vc_state, shard.tts_manager)
+        return shard
+
+    def __iter__(self) -> Iterator[Shard]:
+        return iter(list(self._shards.values()))
+
+    def start(self):
+        """
+        Starts the playback worker of every shard created so far (later ones start as they're created),
+        the shard metrics reporter and the download janitor
+        """
+        if self.running:
+            return
+        self.running = True
+
+        tsprint(f"Running voice across {self.shard_count} shard(s)")
+        for shard in self:
+            shard.bg_task.start(self.bot, shard.vc_state, shard.tts_manager)
+        self._metrics_task = self.bot.loop.create_task(self._report_loop())
+        if self.janitor:
+            self._janitor_task = self.bot.loop.create_task(self.janitor.run(self.live_files, self.evict))
+
+    def stop(self):
+        "Stops every shard's playback worker, the metrics reporter and the download janitor"
+        if not self.running:
+            return
+        self.running = False
+
+        for shard in self:
+            shard.bg_task.stop()
+        for task in (self._metrics_task, self._janitor_task):
+            if task:
+                task.cancel()
+
+    def live_files(self) -> set[str]:
+        """
+        Gets every clip file any shard still needs
+
+        Returns:
+            files (set[str]): paths relative to downloads/
+        """
+        return set().union(*(shard.live_files() for shard in self))
+
+    async def evict(self, excess: int) -> int:
+        """
+        Drops queued (not yet streaming) clips, newest first, until `excess` bytes are freed
+
+        Args:
+            excess (int): how many bytes to free
+
+        Returns:
+            dropped (int): how many clips were dropped
+        """
+        queued: list[tuple[QueueItem, Deque[QueueItem]]] = [
+            (item, queue)
+            for shard in self
+            for state in shard.guilds
+            for queue in (state.queues or {}).values()
+            for item in queue
+        ]
+        # the newest clips have the longest wait ahead of them anyway
+        queued.sort(key=lambda entry: entry[0].enqueued_at, reverse=True)
+
+        victims: list[QueueItem] = []
+        freed = 0
+        for item, queue in queued:
+            if freed >= excess:
+                break
+            try:
+                freed += os.path.getsize(os.path.join(storage.DOWNLOADS_DIR, item.filename))
+            except OSError:
+                pass
+            queue.remove(item)
+            release_item(item)
+            victims.append(item)
+
+        await asyncio.to_thread(storage.remove_files, [item.filename for item in victims])
+        return len(victims)
+
+    async def _report_loop(self):
+        while True:
+            latencies = dict(getattr(self.bot, "latencies", None) or [(0, self.bot.latency)])
+            for shard in self:
+                latency = latencies.get(shard.shard_id)
+                # latency is inf/nan until the shard's first heartbeat
+                shard.report_metrics(latency if latency is not None and latency < float("inf") else None)
+            # each shard only knows its own guilds, so the bot-wide total is summed here
+            metrics.set_gauge("guilds.active", sum(len(shard.guilds) for shard in self))
+            await asyncio.sleep(self.METRICS_INTERVAL)
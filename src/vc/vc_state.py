@@ -1,41 +1,71 @@
 """
 Lightweight voice-state manager to keep track of guild VC's and the last channel TTS was triggered from.
-No major Discord API calls.
+Connections go through a small per-guild state machine, so switching channels reuses the voice session
+(`move_to`) instead of a full disconnect and reconnect, and idle connections are kept warm for a while
+before being dropped. The humans in the bot's channel are counted incrementally from voice events, so
+noticing an empty channel doesn't take a member scan per event. State lives in the shared
+GuildRegistry, so only active guilds cost anything.
 """
 
 # built-in
-from typing import Dict, Optional
+from enum import Enum
+from typing import Awaitable, Callable, Iterator, Optional
+import asyncio
 
 # pycord
 import discord
 
 # my modules
+from src.utils import metrics
+from src.utils.config import get_config
 from src.utils.logging_utils import timestamp_print as tsprint
+from src.vc.guild_state import GuildRegistry, GuildState
+
+class ConnectionState(Enum):
+    "Where a guild's voice connection is in its lifecycle"
+    DISCONNECTED = 0
+    CONNECTING = 1
+    CONNECTED = 2
+    MOVING = 3
+    DISCONNECTING = 4
 
 class VCState():
     "Manages the bot's voice channel state"
 
-    def __init__(self):
-        # maps guild_id -> VoiceClient | None
-        self.vc_dict: Dict[int, Optional[discord.VoiceClient]] = dict()
+    def __init__(
+        self,
+        guilds: Optional[GuildRegistry] = None,
+        idle_timeout: Optional[float] = None,
+        empty_grace: Optional[float] = None
+    ):
+        """
+        ## Args:
+        - `guilds` (Optional[GuildRegistry]): where per-guild state is kept, shared with the TTS side
+        - `idle_timeout` (Optional[float]): seconds to keep an unused connection before disconnecting,
+        defaults to the "voice" config section's `idle_disconnect_s` (0 keeps connections forever)
+        - `empty_grace` (Optional[float]): seconds to stay in a channel nobody is in before leaving,
+        defaults to the "voice" config section's `empty_leave_s`
+        """
+        self.guilds = guilds if guilds is not None else GuildRegistry()
 
-        # maps guild_id -> last channel id that triggered the bot
-        self.last_triggered_channel_dict: Dict[int, Optional[int]] = dict()
+        config = get_config("voice")
+        if idle_timeout is None:
+            idle_timeout = config.get("idle_disconnect_s", 900)
+        self.idle_timeout = idle_timeout
+        if empty_grace is None:
+            empty_grace = config.get("empty_leave_s", 30)
+        self.empty_grace = empty_grace
 
-    def init_guild(self, guild_id: int):
+    def connected(self) -> Iterator[tuple[GuildState, discord.VoiceClient]]:
         """
-        Verifies/initializes guild in vc dict and "last triggered channel" dict
+        Iterates over the guilds the bot is connected to voice in
 
-        ## Args:
-        - `guild_id` (int): the guild ID to verify/initialize
+        ## Returns:
+        - `(state, vc)` pairs for every active guild with a connected voice client
         """
-        if guild_id not in self.vc_dict:
-            tsprint(f"Initializing guild {guild_id} in VC dict...")
-            self.vc_dict[guild_id] = None
-
-        if guild_id not in self.last_triggered_channel_dict:
-            tsprint(f"Initializing guild {guild_id} in last triggered dict...")
-            self.last_triggered_channel_dict[guild_id] = None
+        for state in self.guilds:
+            if state.vc is not None and state.vc.is_connected():
+                yield state, state.vc
 
     def set_vc_state(self, guild_id: int, vc: Optional[discord.VoiceClient]):
         """
@@ -45,7 +75,15 @@ class VCState():
         - `guild_id` (int): the guild ID to set the voice channel state in
         - `vc` (Optional[discord.VoiceClient]): the voice channel to set to
         """
-        self.vc_dict[guild_id] = vc
+        state = self.guilds.get_or_create(guild_id) if vc else self.guilds.get(guild_id)
+        if state is None:
+            return # nothing to clear
+
+        state.vc = vc
+        state.connection = ConnectionState.CONNECTED if vc else ConnectionState.DISCONNECTED
+        if vc is None:
+            self.cancel_idle_disconnect(guild_id)
+            self._stop_counting(state)
 
     def get_vc_state(self, guild_id: int) -> Optional[discord.VoiceClient]:
         """
@@ -57,8 +95,234 @@ class VCState():
         ## Returns:
         - `vc` (Optional[discord.VoiceClient]): the voice channel obtained
         """
-        return self.vc_dict.get(guild_id)
-    
+        state = self.guilds.get(guild_id)
+        return state.vc if state else None
+
+    def get_connection_state(self, guild_id: int) -> ConnectionState:
+        """
+        Gets where the specified guild's voice connection is in its lifecycle
+
+        ## Args:
+        - `guild_id` (int): the guild ID to check
+
+        ## Returns:
+        - `state` (ConnectionState): the connection state
+        """
+        state = self.guilds.get(guild_id)
+        return state.connection if state and state.connection else ConnectionState.DISCONNECTED
+
+    def is_settling(self, guild_id: int) -> bool:
+        """
+        Checks whether a connect or move is in progress in the specified guild
+
+        ## Args:
+        - `guild_id` (int): the guild ID to check
+
+        ## Returns:
+        - True while connecting or moving, False otherwise
+        """
+        return self.get_connection_state(guild_id) in (ConnectionState.CONNECTING, ConnectionState.MOVING)
+
+    async def wait_settled(self, guild_id: int) -> ConnectionState:
+        """
+        Waits out a connect, move or disconnect in progress in the specified guild
+
+        ## Args:
+        - `guild_id` (int): the guild ID to wait on
+
+        ## Returns:
+        - `state` (ConnectionState): the connection state it settled in
+        """
+        state = self.guilds.get(guild_id)
+        if state and state.lock:
+            async with state.lock:
+                pass
+        return self.get_connection_state(guild_id)
+
+    def _lock(self, state: GuildState) -> asyncio.Lock:
+        if state.lock is None:
+            state.lock = asyncio.Lock()
+        return state.lock
+
+    async def ensure_connected(self, guild_id: int, channel: discord.VoiceChannel) -> discord.VoiceClient:
+        """
+        Makes sure the bot is in a voice channel: nothing to do if it already is, `move_to` if it's
+        elsewhere in the guild (reusing the voice session), otherwise a fresh connection
+
+        ## Args:
+        - `guild_id` (int): the guild ID to connect in
+        - `channel` (discord.VoiceChannel): the voice channel to be in
+
+        ## Returns:
+        - `vc` (discord.VoiceClient): the connected voice client
+        """
+        state = self.guilds.get_or_create(guild_id)
+        async with self._lock(state):
+            vc = state.vc
+
+            if vc and vc.is_connected():
+                if vc.channel == channel:
+                    return vc
+
+                tsprint(f"Moving from VC {vc.channel.name} to {channel.name} in {guild_id}")
+                state.connection = ConnectionState.MOVING
+                try:
+                    await vc.move_to(channel)
+                except Exception:
+                    # the session is in an unknown state, drop it so the next attempt starts clean
+                    await self._disconnect(guild_id, vc)
+                    raise
+                state.connection = ConnectionState.CONNECTED
+                metrics.inc("voice.moves")
+                return vc
+
+            state.connection = ConnectionState.CONNECTING
+            try:
+                vc = await channel.connect(reconnect=False)
+            except Exception:
+                state.connection = ConnectionState.DISCONNECTED
+                raise
+            self.set_vc_state(guild_id, vc)
+            metrics.inc("voice.connects")
+            return vc
+
+    async def disconnect(self, guild_id: int):
+        """
+        Disconnects from voice in the specified guild, if connected
+
+        ## Args:
+        - `guild_id` (int): the guild ID to disconnect in
+        """
+        state = self.guilds.get(guild_id)
+        if state is None:
+            return
+
+        async with self._lock(state):
+            await self._disconnect(guild_id, state.vc)
+
+    async def _disconnect(self, guild_id: int, vc: Optional[discord.VoiceClient]):
+        state = self.guilds.get_or_create(guild_id)
+        state.connection = ConnectionState.DISCONNECTING
+        try:
+            if vc:
+                await vc.disconnect()
+        finally:
+            self.set_vc_state(guild_id, None)
+
+    def touch(self, guild_id: int, on_idle: Callable[[int], Awaitable[None]]):
+        """
+        Marks the guild's connection as used, (re)starting its idle disconnect timer
+
+        ## Args:
+        - `guild_id` (int): the guild ID whose connection was used
+        - `on_idle` (Callable[[int], Awaitable[None]]): called with the guild ID once the timer runs out
+        """
+        self.cancel_idle_disconnect(guild_id)
+        if not self.idle_timeout:
+            return
+
+        state = self.guilds.get_or_create(guild_id)
+
+        def fire():
+            state.idle_timer = None
+            asyncio.create_task(on_idle(guild_id))
+
+        state.idle_timer = asyncio.get_running_loop().call_later(self.idle_timeout, fire)
+
+    def cancel_idle_disconnect(self, guild_id: int):
+        """
+        Stops the specified guild's idle disconnect timer, if any
+
+        ## Args:
+        - `guild_id` (int): the guild ID to stop the timer for
+        """
+        state = self.guilds.get(guild_id)
+        if state and state.idle_timer:
+            state.idle_timer.cancel()
+            state.idle_timer = None
+
+    def track_occupancy(self, guild_id: int, channel: discord.VoiceChannel, on_empty: Callable[[int], Awaitable[None]]):
+        """
+        Starts counting the humans in the channel the bot just joined or moved to. This is the only
+        member scan; from here on the count follows `update_occupancy`.
+
+        ## Args:
+        - `guild_id` (int): the guild the bot joined in
+        - `channel` (discord.VoiceChannel): the channel it's now in
+        - `on_empty` (Callable[[int], Awaitable[None]]): called with the guild ID once the channel has
+        been empty for the grace period
+        """
+        state = self.guilds.get_or_create(guild_id)
+        state.occupied_channel = channel.id
+        state.humans = sum(1 for member in channel.members if not member.bot)
+        self._check_empty(state, on_empty)
+
+    def update_occupancy(
+        self,
+        guild_id: int,
+        before_channel_id: Optional[int],
+        after_channel_id: Optional[int],
+        on_empty: Callable[[int], Awaitable[None]]
+    ):
+        """
+        Applies a human's voice channel change to the count of the bot's channel
+
+        ## Args:
+        - `guild_id` (int): the guild it happened in
+        - `before_channel_id` (Optional[int]): the channel they left, if any
+        - `after_channel_id` (Optional[int]): the channel they joined, if any
+        - `on_empty` (Callable[[int], Awaitable[None]]): called with the guild ID once the channel has
+        been empty for the grace period
+        """
+        state = self.guilds.get(guild_id)
+        if state is None or state.occupied_channel is None or before_channel_id == after_channel_id:
+            return # not counting here, or a mute/deafen/stream change
+
+        if after_channel_id == state.occupied_channel:
+            state.humans += 1
+        elif before_channel_id == state.occupied_channel:
+            state.humans = max(0, state.humans - 1)
+        else:
+            return
+        self._check_empty(state, on_empty)
+
+    def get_humans(self, guild_id: int) -> int:
+        """
+        Gets how many humans are in the bot's channel in the specified guild
+
+        ## Args:
+        - `guild_id` (int): the guild ID to check
+
+        ## Returns:
+        - `humans` (int): the count, 0 if the bot isn't in a channel
+        """
+        state = self.guilds.get(guild_id)
+        return state.humans if state and state.occupied_channel is not None else 0
+
+    def _check_empty(self, state: GuildState, on_empty: Callable[[int], Awaitable[None]]):
+        if state.humans:
+            if state.empty_timer:
+                state.empty_timer.cancel()
+                state.empty_timer = None
+            return
+        if state.empty_timer:
+            return # already counting down
+
+        guild_id = state.guild_id
+
+        def fire():
+            state.empty_timer = None
+            asyncio.create_task(on_empty(guild_id))
+
+        state.empty_timer = asyncio.get_running_loop().call_later(self.empty_grace, fire)
+
+    def _stop_counting(self, state: GuildState):
+        state.occupied_channel = None
+        state.humans = 0
+        if state.empty_timer:
+            state.empty_timer.cancel()
+            state.empty_timer = None
+
     def set_last_triggered(self, guild_id: int, text_channel_id: Optional[int]):
         """
         Sets the last triggered text channel state in the specified guild
@@ -67,8 +331,10 @@ class VCState():
         - `guild_id` (int): the guild ID to set the last triggered text channel state in
         - `text_channel_id` (Optional[int]): the text channel to set the last triggered state to
         """
-        self.last_triggered_channel_dict[guild_id] = text_channel_id
-    
+        state = self.guilds.get_or_create(guild_id) if text_channel_id else self.guilds.get(guild_id)
+        if state:
+            state.last_triggered_channel = text_channel_id
+
     def get_last_triggered(self, guild_id: int) -> Optional[int]:
         """
         Gets the last triggered text channel state in the specified guild
@@ -79,8 +345,9 @@ class VCState():
         ## Returns:
         - `text_channel_id` (Optional[int]): the text channel obtained
         """
-        return self.last_triggered_channel_dict.get(guild_id)
-    
+        state = self.guilds.get(guild_id)
+        return state.last_triggered_channel if state else None
+
     def is_connected(self, guild_id: int) -> bool:
         """
         Checks whether the bot is connected in a specific guild
@@ -106,4 +373,4 @@ class VCState():
         - True if in the specified voice channel, False otherwise
         """
         vc = self.get_vc_state(guild_id)
-        return vc and vc.is_connected() and vc.channel == channel
\ No newline at end of file
+        return vc and vc.is_connected() and vc.channel == channel